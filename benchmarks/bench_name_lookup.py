@@ -0,0 +1,68 @@
+"""
+Latency of ProperNounDB.fuzzy_lookup when the names are read from the database
+on every lookup (before) or kept in its in-memory index (after), and of the
+same lookups made at once with fuzzy_lookup_many (batched) or restricted to
+the NPCs of one location (scoped).
+
+    python -m benchmarks.bench_name_lookup [n_names]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.sql_client import SQLClient
+
+LOOKUPS = 100
+NICKNAMES_PER_NAME = 3
+NAMES_PER_LOCATION = 10
+
+
+def query(i: int, n_names: int) -> str:
+    # misspelled, so that it is scored rather than found exactly
+    return f"nik {i * 7 % n_names} 1"
+
+
+def location(i: int) -> str:
+    return f"location {i // NAMES_PER_LOCATION}"
+
+
+def timed(label: str, noun_db: ProperNounDB, n_names: int, reload=False, scoped=False):
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        if reload:
+            noun_db._index = None
+        if scoped:
+            noun_db.fuzzy_lookup(
+                query(i, n_names), kind="npc", within=location(i * 7 % n_names)
+            )
+        else:
+            noun_db.fuzzy_lookup(query(i, n_names))
+    elapsed_ms = (time.perf_counter() - start) * 1000 / LOOKUPS
+    print(f"{label:>7}: {elapsed_ms:8.3f} ms per lookup")
+
+
+if __name__ == "__main__":
+    n_names = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        noun_db = ProperNounDB("bench", conn=SQLClient("bench").conn)
+        for start in range(0, n_names, NAMES_PER_LOCATION):
+            noun_db.add_many(
+                [
+                    (f"name {i}", [f"nick {i} {j}" for j in range(NICKNAMES_PER_NAME)])
+                    for i in range(start, min(start + NAMES_PER_LOCATION, n_names))
+                ],
+                kind="npc",
+                within=location(start),
+            )
+        timed("before", noun_db, n_names, reload=True)
+        timed("after", noun_db, n_names)
+        start = time.perf_counter()
+        noun_db.fuzzy_lookup_many([query(i, n_names) for i in range(LOOKUPS)])
+        elapsed_ms = (time.perf_counter() - start) * 1000 / LOOKUPS
+        print(f"batched: {elapsed_ms:8.3f} ms per lookup")
+        timed("scoped", noun_db, n_names, scoped=True)
+        noun_db.close()
@@ -0,0 +1,87 @@
+"""
+Latency of a fuzzy name lookup scoring every name and nickname (before) or only
+the shortlist of the trigram index (after), and how often both find the same
+name, for misspelled names in worlds of 1k, 10k and 100k NPCs with 3 nicknames
+each. Names spelled right take the exact-match path (exact).
+
+    python -m benchmarks.bench_name_shortlist [n_names ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from llmdm import name_index
+from llmdm.names import NAMES
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.sql_client import SQLClient
+
+LOOKUPS = 200
+SYLLABLES = ["", "a", "en", "or", "is", "wyn", "dell", "mar", "ith", "ul"]
+
+
+def generate_names(n_names: int, rng: random.Random) -> list[tuple[str, list[str]]]:
+    full_names = [name.split() for names in NAMES.values() for name in names]
+    firsts = sorted({name[0] for name in full_names})
+    lasts = sorted({name[-1] for name in full_names if len(name) > 1})
+    entries = []
+    for i in range(n_names):
+        first = rng.choice(firsts) + rng.choice(SYLLABLES)
+        last = rng.choice(lasts) + rng.choice(SYLLABLES)
+        name = f"{first} {last}"
+        entries.append((name, [first, last, f"{first} of house {last}"]))
+    return entries
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    i = rng.randrange(len(name))
+    return name[:i] + name[i + 1 :]
+
+
+def lookups(noun_db: ProperNounDB, queries: list[str]) -> tuple[list[str], float]:
+    start = time.perf_counter()
+    names = [noun_db.fuzzy_lookup(query) for query in queries]
+    return names, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def bench(n_names: int):
+    rng = random.Random(n_names)
+    noun_db = ProperNounDB(f"bench{n_names}", conn=SQLClient(f"bench{n_names}").conn)
+    entries = generate_names(n_names, rng)
+    noun_db.add_many(entries)
+    names = [rng.choice(entries)[0] for _ in range(LOOKUPS)]
+    queries = [misspell(name, rng) for name in names]
+
+    noun_db._index = None
+    start = time.perf_counter()
+    noun_db.index
+    load_ms = (time.perf_counter() - start) * 1000
+    # the trigram index is built by the first lookup needing it
+    start = time.perf_counter()
+    noun_db.fuzzy_lookup(queries[0])
+    build_ms = (time.perf_counter() - start) * 1000
+
+    shortlist_from = name_index.SHORTLIST_FROM
+    name_index.SHORTLIST_FROM = float("inf")
+    expected, before_ms = lookups(noun_db, queries)
+    name_index.SHORTLIST_FROM = shortlist_from
+    found, after_ms = lookups(noun_db, queries)
+    same = sum(a == b for a, b in zip(expected, found)) / len(queries)
+    _, exact_ms = lookups(noun_db, names)
+    print(
+        f"{n_names:>7} names: index loaded in {load_ms:6.0f} ms, trigrams in "
+        f"{build_ms:5.0f} ms, "
+        f"{before_ms:7.3f} -> {after_ms:6.3f} ms per lookup, "
+        f"{same:.0%} same names, exact {exact_ms:.3f} ms"
+    )
+    noun_db.close()
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for n_names in sizes:
+            bench(n_names)
@@ -0,0 +1,118 @@
+"""
+Share of player inputs naming an NPC with a misspelling that
+get_npc_to_talk_to resolves without asking the LLM (a single name mentioned
+scoring UNAMBIGUOUS_SCORE) and share resolved to the wrong NPC, without
+(before) and with (after) the phonetic key index. The inputs are the misspelled
+names alone and in the sentences players type. The NPCs are the names of
+llmdm.names with their first name as nickname, NPCS_PER_LOCATION per location,
+and are looked up within their location as get_npc_to_talk_to does.
+
+    python -m benchmarks.bench_phonetic [n_queries]
+"""
+
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from llmdm import name_index
+from llmdm.game_data import UNAMBIGUOUS_SCORE
+from llmdm.names import NAMES
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.sql_client import SQLClient
+
+NPCS_PER_LOCATION = 6
+# what players type to start a conversation
+SENTENCES = [
+    "talk to {}",
+    "I want to speak with {}",
+    "{}, do you have a minute?",
+    "ask {} about the missing caravan",
+    "walk over to {} and say hello",
+]
+# the ways players misspell invented names
+MISSPELLINGS = [
+    (r"([bdfgklmnprst])", r"\1\1"),
+    (r"(.)\1", r"\1"),
+    (r"h", ""),
+    (r"c", "k"),
+    (r"k", "c"),
+    (r"ie", "i"),
+    (r"y", "i"),
+    (r"ph", "f"),
+    (r"ae", "e"),
+    (r"[aeiou]", "a"),
+]
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    for spelling, replacement in rng.sample(MISSPELLINGS, len(MISSPELLINGS)):
+        matches = list(re.finditer(spelling, name))
+        if matches:
+            match = rng.choice(matches)
+            return (
+                name[: match.start()] + match.expand(replacement) + name[match.end() :]
+            )
+    return name
+
+
+def bench(
+    label: str,
+    noun_db: ProperNounDB,
+    queries: list[tuple[str, str]],
+    locations: dict[str, str],
+):
+    resolved = wrong = 0
+    start = time.perf_counter()
+    for query, name in queries:
+        candidates = noun_db.mentions(
+            query, threshold=UNAMBIGUOUS_SCORE, kind="npc", within=locations[name]
+        )
+        if len(candidates) == 1:
+            resolved += 1
+            wrong += candidates[0][0] != name
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(
+        f"{label:>16}: {resolved / len(queries):4.0%} resolved without the LLM, "
+        f"{wrong / len(queries):4.1%} wrongly, {elapsed_ms:.3f} ms per lookup"
+    )
+
+
+if __name__ == "__main__":
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(0)
+    names = sorted({name for names in NAMES.values() for name in names})
+    rng.shuffle(names)
+    locations = {
+        name: f"location {i // NPCS_PER_LOCATION}" for i, name in enumerate(names)
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        noun_db = ProperNounDB("bench", conn=SQLClient("bench").conn)
+        for start in range(0, len(names), NPCS_PER_LOCATION):
+            npcs = names[start : start + NPCS_PER_LOCATION]
+            noun_db.add_many(
+                [(name, [name.split()[0]]) for name in npcs],
+                kind="npc",
+                within=locations[npcs[0]],
+            )
+        queries = []
+        while len(queries) < n_queries:
+            name = rng.choice(names)
+            spelled = rng.choice([name, name.split()[0]])
+            query = misspell(spelled, rng)
+            if query != spelled:
+                queries.append((query, name))
+        sentences = [
+            (rng.choice(SENTENCES).format(query), name) for query, name in queries
+        ]
+        phonetic_min_length = name_index.PHONETIC_MIN_LENGTH
+        name_index.PHONETIC_MIN_LENGTH = float("inf")
+        bench("names, before", noun_db, queries, locations)
+        bench("sentences, before", noun_db, sentences, locations)
+        name_index.PHONETIC_MIN_LENGTH = phonetic_min_length
+        bench("names, after", noun_db, queries, locations)
+        bench("sentences, after", noun_db, sentences, locations)
+        noun_db.close()
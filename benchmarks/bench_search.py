@@ -0,0 +1,54 @@
+"""
+Latency of finding the NPCs whose description mentions a word, with a LIKE scan
+of the npcs table (before) or the FTS5 index through SQLClient.search (after).
+Each word is mentioned by about n_npcs / WORDS NPCs.
+
+    python -m benchmarks.bench_search [n_npcs]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from llmdm.npc import NPC
+from llmdm.sql_client import SQLClient
+
+QUERIES = 100
+WORDS = 1000
+
+
+def timed(label: str, search):
+    start = time.perf_counter()
+    for i in range(QUERIES):
+        search(f"rune{i * 7 % WORDS}")
+    elapsed_us = (time.perf_counter() - start) * 1e6 / QUERIES
+    print(f"{label:>7}: {elapsed_us:8.1f} us per search")
+
+
+if __name__ == "__main__":
+    n_npcs = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        sql_db = SQLClient("bench")
+        sql_db.save_npcs(
+            [
+                NPC(
+                    name=f"npc {i}",
+                    description=f"A smith of the old town who carries the "
+                    f"rune{i % WORDS} amulet, weathered by years of hard work.",
+                )
+                for i in range(n_npcs)
+            ]
+        )
+
+        def like(word):
+            sql_db.cursor.execute(
+                "SELECT name FROM npcs WHERE description LIKE ?",
+                (f"%{word}%",),
+            )
+            return sql_db.cursor.fetchall()
+
+        timed("before", like)
+        timed("after", lambda word: sql_db.search(word, kinds=("npc",)))
+        sql_db.close()
@@ -0,0 +1,80 @@
+"""
+Time to copy the save database of a world with many NPCs, by rebuilding it
+from its objects (before) or with SQLite's online backup API, in one step or
+BACKUP_PAGES pages at a time (after). Only the SQL store is measured, the graph
+and vector stores need their servers running.
+
+    python -m benchmarks.bench_snapshot [n_npcs]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from llmdm.location import Location
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.npc import NPC
+from llmdm.save_db import BACKUP_PAGES, save_path
+from llmdm.sql_client import SQLClient
+
+NPCS_PER_LOCATION = 10
+
+
+def build_save(name: str, n_npcs: int) -> tuple[SQLClient, ProperNounDB]:
+    sql_db = SQLClient(name)
+    noun_db = ProperNounDB(name, conn=sql_db.conn)
+    npcs = [
+        NPC(
+            name=f"npc {i}",
+            location_name=f"location {i // NPCS_PER_LOCATION}",
+            description="A weathered traveller with a story for every scar. " * 4,
+        )
+        for i in range(n_npcs)
+    ]
+    locations = [
+        Location(
+            name=f"location {i}",
+            npcs=npcs[i * NPCS_PER_LOCATION : (i + 1) * NPCS_PER_LOCATION],
+        )
+        for i in range(n_npcs // NPCS_PER_LOCATION)
+    ]
+    with sql_db.transaction(), noun_db.transaction():
+        sql_db.save_npcs(npcs)
+        sql_db.save_locations(locations)
+        noun_db.add_many([(obj.name, []) for obj in npcs + locations])
+    return sql_db, noun_db
+
+
+def rebuild(sql_db: SQLClient, noun_db: ProperNounDB, name: str):
+    copy = SQLClient(name)
+    copy_nouns = ProperNounDB(name, conn=copy.conn)
+    with copy.transaction(), copy_nouns.transaction():
+        copy.save_npcs(sql_db.get_all_npcs())
+        copy.save_locations(sql_db.get_all_locations())
+        copy_nouns.add_many([(canonical, []) for canonical in noun_db.get_nicknames()])
+    copy.close()
+
+
+def timed(label: str, copy):
+    start = time.perf_counter()
+    copy()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"{label:>24}: {elapsed_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    n_npcs = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("saved")
+        sql_db, noun_db = build_save("bench", n_npcs)
+        size_kb = os.path.getsize(save_path("bench")) // 1024
+        print(f"{n_npcs} NPCs, {size_kb} KB save")
+        timed("before: rebuild", lambda: rebuild(sql_db, noun_db, "rebuilt"))
+        timed("after: backup", lambda: sql_db.backup(save_path("full"), pages=-1))
+        timed(
+            f"after: backup by {BACKUP_PAGES}",
+            lambda: sql_db.backup(save_path("stepped")),
+        )
+        sql_db.close()
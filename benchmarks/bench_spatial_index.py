@@ -0,0 +1,44 @@
+"""
+Neighbor lookup latency of the location SpatialIndex.
+
+    python -m benchmarks.bench_spatial_index [n_locations ...]
+"""
+
+import random
+import sys
+import time
+
+from llmdm.location_graph import NEARBY_AREAS, NEARBY_RADIUS
+from llmdm.spatial_index import SpatialIndex
+
+QUERIES = 1000
+
+
+def bench(n_locations: int, rng: random.Random):
+    # locations spread the way GameData places them: a journey apart on average
+    side = (n_locations**0.5) * 10
+    index = SpatialIndex(cell_size=2.0)
+    for i in range(n_locations):
+        index.insert(f"location {i}", rng.uniform(0, side), rng.uniform(0, side))
+    queries = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(QUERIES)]
+
+    start = time.perf_counter()
+    for x, y in queries:
+        index.nearest(x, y, NEARBY_AREAS)
+    nearest_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+    start = time.perf_counter()
+    for x, y in queries:
+        index.within(x, y, NEARBY_RADIUS)
+    within_ms = (time.perf_counter() - start) * 1000 / QUERIES
+
+    print(
+        f"{n_locations:>7} locations: nearest(k={NEARBY_AREAS}) {nearest_ms:.3f} ms, "
+        f"within(r={NEARBY_RADIUS}) {within_ms:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    for n in [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000]:
+        bench(n, rng)
@@ -0,0 +1,67 @@
+"""
+Commits and write latency of the saves made while generating a town, committed
+one by one with the default rollback journal (before) or as one unit of work
+in WAL mode (after).
+
+    python -m benchmarks.bench_transactions [n_locations]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+from llmdm.location import Location
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.npc import NPC
+from llmdm.sql_client import SQLClient
+
+NPCS_PER_LOCATION = 4
+
+
+def generate_town(sql_db, noun_db, n_locations: int):
+    for i in range(n_locations):
+        npcs = [NPC(name=f"npc {i}/{j}") for j in range(NPCS_PER_LOCATION)]
+        for npc in npcs:
+            sql_db.save_npc(npc)
+            noun_db.add(npc.name, [])
+        sql_db.save_location(Location(name=f"location {i}", npcs=npcs))
+        noun_db.add(f"location {i}", [])
+        sql_db.save_checkpoint(f"town/populate/location {i}", f"location {i}")
+
+
+def bench(name: str, n_locations: int, unit_of_work: bool):
+    # the two clients of a save share its connection
+    sql_db = SQLClient(name)
+    noun_db = ProperNounDB(name, conn=sql_db.conn)
+    if not unit_of_work:
+        sql_db.conn.execute("PRAGMA journal_mode = DELETE")
+        sql_db.conn.execute("PRAGMA synchronous = FULL")
+    commits = []
+    sql_db.conn.set_trace_callback(
+        lambda statement: statement == "COMMIT" and commits.append(statement)
+    )
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        if unit_of_work:
+            stack.enter_context(sql_db.transaction())
+            stack.enter_context(noun_db.transaction())
+        generate_town(sql_db, noun_db, n_locations)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    writes = n_locations * (2 * NPCS_PER_LOCATION + 3)
+    print(
+        f"{name:>6}: {len(commits):>4} commits, {elapsed_ms:8.1f} ms total, "
+        f"{elapsed_ms / writes:.3f} ms per write"
+    )
+    sql_db.close()
+
+
+if __name__ == "__main__":
+    n_locations = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        bench("before", n_locations, unit_of_work=False)
+        bench("after", n_locations, unit_of_work=True)
@@ -348,6 +348,28 @@ class LeaveConversation(Action, ConversationAction):
         game_data.transition_mode_to("free")
 
 
+@dataclass
+class ForkSavePrompt:
+    prompt: str = "Name of the new save?"
+
+
+class ForkSave(Action, FreeModeAction):
+    prompt_type = ForkSavePrompt
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def perform(self, game_data: GameData):
+        logger.debug(f"ForkSave.perform - {self.prompt_response}")
+        save_name = self.prompt_response.prompt.strip().lower()
+        try:
+            game_data.fork(save_name)
+        except ValueError as e:
+            render_text(f"Sorry, {e}.")
+            return
+        render_text(f"The story so far was saved as {save_name}.")
+
+
 @dataclass
 class Exit(Action, FreeModeAction, ConversationAction):
     prompt_type = EmptyPrompt
@@ -1,6 +1,4 @@
-import json
 import logging
-import os
 from dataclasses import dataclass
 
 from llmdm.utils import render_text
@@ -25,11 +23,5 @@ class Character:
         render_text(f"You are {character.name}, {character.description}")
         return character
 
-    @classmethod
-    def from_save(cls, save_name):
-        with open(os.path.join("saved", f"{save_name}.json")) as f:
-            data = json.load(f)
-        return cls(**data["PlayerCharacter"])
-
     def describe(self):
         return f"{self.name}: {self.description}"
@@ -1,6 +1,36 @@
 import json
+import weakref
 from dataclasses import asdict, dataclass, fields, is_dataclass
-from typing import Optional
+from typing import Hashable, Optional
+
+
+class Tracked:
+    """
+    Mixin for the dataclasses of saved objects, telling the clients watching an
+    object when one of its fields is assigned so that they know what to write
+    back. The clients are only referenced weakly, and copies aren't watched.
+    """
+
+    def watch(self, client, key: Hashable):
+        """Call client.assigned(key) whenever a field is assigned."""
+        watchers = self.__dict__.get("_watchers")
+        if watchers is None:
+            watchers = weakref.WeakKeyDictionary()
+            object.__setattr__(self, "_watchers", watchers)
+        watchers[client] = key
+
+    def unwatch(self, client):
+        self.__dict__.get("_watchers", {}).pop(client, None)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        for client, key in list(self.__dict__.get("_watchers", {}).items()):
+            client.assigned(key)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_watchers", None)
+        return state
 
 
 @dataclass
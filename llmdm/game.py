@@ -10,23 +10,20 @@ from llmdm.actions import (
     FreeModeActionNames,
     FreeModeActions,
 )
-from llmdm.character import Character
-from llmdm.game_data import GameData, GameState
-from llmdm.generate import LLM
-from llmdm.graph_client import GraphClient
-from llmdm.nouns_lookup import ProperNounDB
-from llmdm.sql_client import SQLClient
+from llmdm.game_data import GameData
+from llmdm.save_db import list_saves
 from llmdm.utils import (
-    SAVE_DIR,
     prompt_user_input,
     render_text,
     start_display_thread,
     stop_display_thread,
 )
-from llmdm.vector_client import OpenSearchClient
 
 logger = logging.getLogger("llmdm.game")
 
+# take a snapshot of the save every this many turns, set to 0 to disable
+SNAPSHOT_TURNS = int(os.getenv("LLMDM_SNAPSHOT_TURNS", "0"))
+
 
 class Game:
     def __init__(self, logs=False, save_name="SavedGame"):
@@ -35,10 +32,9 @@ class Game:
         self.story = ""
         self.action = None
         self.action_type = None
+        self.turns = 0
 
-        saved_games = [
-            os.path.splitext(f)[0] for f in os.listdir(SAVE_DIR) if f.endswith(".json")
-        ]
+        saved_games = list_saves()
 
         while (
             load_or_new := prompt_user_input("[Load] game or start a [new] one?\n")
@@ -50,17 +46,7 @@ class Game:
             game_name = prompt_user_input(
                 "Which game to play?:\n- " + "\n- ".join(saved_games) + "\n"
             )
-            game_state = GameState.from_save(game_name.strip().lower())
-            self.game_data = GameData(
-                llm=LLM(),
-                sql_db=SQLClient(game_name),
-                graph_db=GraphClient(game_name),
-                vector_db=OpenSearchClient(game_name),
-                player_character=Character.from_save(game_name),
-                noun_db=ProperNounDB(game_name),
-                game_state=game_state,
-                save_name=game_name,
-            )
+            self.game_data = GameData.load(game_name.strip().lower())
         else:
             while True:
                 save_name = prompt_user_input(
@@ -78,6 +64,8 @@ class Game:
             self.game_data = GameData.new_game(save_name)
 
         self.game_data.print_state()
+        # the game loop never waits on storage from here on
+        self.game_data.start_write_behind()
 
     def prompt(self):
         if self.game_data.game_state.mode == "free":
@@ -106,8 +94,9 @@ class Game:
 
     def run(self):
         start_display_thread()
-        while True:
-            try:
+        # finally, so that the queued writes are saved on an error, Ctrl-C or exit
+        try:
+            while True:
                 self.prompt()
                 logger.debug(f"{self.action=}, {self.action_type=}")
                 if self.action is None:
@@ -115,12 +104,21 @@ class Game:
                 if self.action_type.value == Actions.exit.value:
                     render_text("Game Ended")
                     break
-                self.resolve()
-                self.game_data.save()
-            except Exception as e:
+                if self.action_type.value == Actions.forksave.value:
+                    # copies the state the last turn committed, so not in a turn
+                    self.resolve()
+                    continue
+                with self.game_data.unit_of_work():
+                    self.resolve()
+                    self.game_data.save()
+                self.turns += 1
+                if SNAPSHOT_TURNS and self.turns % SNAPSHOT_TURNS == 0:
+                    self.game_data.snapshot()
+        finally:
+            try:
+                self.game_data.stop_write_behind()
+            finally:
                 stop_display_thread()
-                raise e
-        stop_display_thread()
 
 
 def run():
@@ -1,32 +1,57 @@
 import json
 import logging
+import math
 import os
 import random
-from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from itertools import zip_longest
 from json.decoder import JSONDecodeError
+from typing import Optional
 
 from llmdm.character import Character
-from llmdm.generate import LLM
+from llmdm.generate import LLM, parse_npc_record
 from llmdm.graph_client import GraphClient
-from llmdm.location import Location
+from llmdm.location import Location, Neighborhood
+from llmdm.location_graph import LocationGraph
 from llmdm.names import NAMES
 from llmdm.nouns_lookup import ProperNounDB
 from llmdm.npc import NPC
+from llmdm.object_cache import CachedSQLClient
 from llmdm.points_of_interest import (
     COMMON_LOCATIONS,
     ESSENTIAL_LOCATIONS,
     UNIQUE_LOCATIONS,
 )
 from llmdm.quest import Quest
-from llmdm.sql_client import SQLClient
+from llmdm.save_db import save_path
 from llmdm.town_names import TOWN_NAMES
 from llmdm.traits import TRAIT_TRIPLETS
-from llmdm.utils import SAVE_DIR, render_text
+from llmdm.utils import SAVE_DIR, content_key, render_text
 from llmdm.vector_client import OpenSearchClient
+from llmdm.write_behind import WriteBehind
 
 logger = logging.getLogger(__name__)
 
+# number of NPC ideas turned into NPCs by each batched generation
+NPC_BATCH_SIZE = 4
+# sublocations are placed within this distance of their parent location
+SUBLOCATION_RADIUS = 0.5
+# distance range from the current location to a newly generated area
+TRAVEL_DISTANCE = (5.0, 20.0)
+# fuzzy lookup score from which a generated name is taken for a known one
+SAME_NAME_SCORE = 80
+# the player's input names an NPC without asking the LLM when it is the only
+# NPC of the location matching this well
+UNAMBIGUOUS_SCORE = 90
+
+
+def open_save(save_name: str) -> tuple[CachedSQLClient, ProperNounDB]:
+    """The clients of a save, sharing the one connection to its file."""
+    sql_db = CachedSQLClient(save_name)
+    return sql_db, ProperNounDB(save_name, conn=sql_db.conn)
+
 
 @dataclass
 class GameState:
@@ -35,77 +60,180 @@ class GameState:
     mode: str = "one of: free, combat, conversation"
     mode_data: dict = field(default_factory=lambda: {})
     active_quest: dict = field(default_factory=lambda: {})
-
-    @classmethod
-    def from_save(cls, save_name):
-        with open(os.path.join("saved", f"{save_name}.json"), "r") as f:
-            data = json.load(f)
-        logger.debug(
-            f"GameState.from_save - loaded json:\n{json.dumps(data, indent=2)}"
-        )
-        return cls(**data["GameState"])
+    seed: Optional[int] = None
 
 
 @dataclass
 class GameData:
     llm: LLM
-    sql_db: SQLClient
+    sql_db: CachedSQLClient
     graph_db: GraphClient
     vector_db: OpenSearchClient
     game_state: GameState
     noun_db: ProperNounDB
     player_character: Character
     save_name: str
+    rng: random.Random = None
+    location_graph: LocationGraph = None
+    write_behind: WriteBehind = None
+    # key -> (write, args) deferred inside the current unit of work
+    held_writes: dict = None
+
+    def __post_init__(self):
+        # all generation randomness comes from the save's seed so that the same
+        # seed produces the same world
+        if self.rng is None:
+            self.rng = random.Random(self.game_state.seed)
+        if self.location_graph is None:
+            self.location_graph = LocationGraph.from_db(self.sql_db, self.noun_db)
 
     def save(self):
-        with open(os.path.join(SAVE_DIR, f"{self.save_name}.json"), "w") as f:
-            save_data = {
+        self.sql_db.flush()
+        # committed with the rest of the turn's writes
+        self.sql_db.save_game(
+            {
                 "GameState": asdict(self.game_state),
                 "PlayerCharacter": asdict(self.player_character),
             }
-            json.dump(save_data, f, indent=2)
-        logger.debug(f"Saving data to file:\n{json.dumps(save_data, indent=2)}")
+        )
 
     @classmethod
-    def new_game(cls, save_name: str):
-        llm = LLM()
-        character = Character.new(llm)
-        new_storyline = llm.generate(
-            """
-Based on the following player character description, generate a short narrative for the small, rural village where the player starts their journey. The narrative should be rich in detail, include compelling plot hooks, and remain open-ended to encourage exploration. Include 1 or two plot hooks that could lead to quests for the player.
-""",
-            # f"""
-            # Concept: {character.description}
-            #
-            # Please craft this narrative to align closely with the character's background, incorporating unique elements that will intrigue the player and set the stage for their adventure.
-            #             """,
-            system_instructions="""
-You are a creative storyteller and world-builder for a text-based RPG game. Your task is to craft unique, engaging, and open-ended narratives that serve as starting points for players. These narratives should be inspired by the player's character description and set in a small town where the player's adventure begins. Include intriguing plot hooks and backstory elements without resolving the storyline, allowing for open-ended gameplay. Avoid clichés and ensure that each story is fresh and imaginative.
-            """,
-            max_new_tokens=256,
+    def load(cls, save_name: str) -> "GameData":
+        sql_db, noun_db = open_save(save_name)
+        save_data = sql_db.load_game()
+        if not save_data:
+            sql_db.close()
+            raise ValueError(
+                f"Save {save_name} has no game yet, start a new game named {save_name} to finish generating it"
+            )
+        game_state = GameState(**save_data["GameState"])
+        return cls(
+            llm=LLM(seed=game_state.seed),
+            sql_db=sql_db,
+            graph_db=GraphClient(save_name),
+            vector_db=OpenSearchClient(save_name),
+            player_character=Character(**save_data["PlayerCharacter"]),
+            noun_db=noun_db,
+            game_state=game_state,
+            save_name=save_name,
         )
-        logger.debug(new_storyline)
+
+    def start_write_behind(self):
+        """From now on, persist in a background thread instead of the game loop."""
+        self.write_behind = WriteBehind()
+        self.sql_db.write_behind = self.noun_db.write_behind = self.write_behind
+
+    def stop_write_behind(self):
+        """Wait for the queued writes, then go back to persisting inline."""
+        if self.write_behind is not None:
+            try:
+                self.sql_db.flush()
+            finally:
+                # the thread is stopped even when a write failed, and the error raised
+                try:
+                    self.write_behind.close()
+                finally:
+                    self.write_behind = None
+                    self.sql_db.write_behind = self.noun_db.write_behind = None
+
+    def defer(self, key, write, *args):
+        """
+        Run write(*args) now, or on the write-behind thread when it is started.
+        Inside a unit of work, only once it commits.
+        """
+        if self.held_writes is not None:
+            self.held_writes[key] = (write, args)
+            return
+        if self.write_behind is None:
+            return write(*args)
+        self.write_behind.put(key, write, *args)
+
+    def fork(self, new_save_name: str):
+        """
+        Copy the save under a new name, to be loaded and played independently.
+        Call it between turns, outside a unit of work: the copy is the state
+        the last turn committed, once its queued writes are done.
+        """
+        if self.held_writes is not None:
+            raise RuntimeError("Cannot fork a save in the middle of a turn")
+        if os.path.exists(save_path(new_save_name)):
+            raise ValueError(f"Save {new_save_name} already exists")
+        self.sql_db.flush()
+        self.sql_db.wait_for_writes()
+        self.sql_db.backup(save_path(new_save_name))
+        GraphClient(new_save_name).import_data(self.graph_db.export())
+        OpenSearchClient(new_save_name).import_data(self.vector_db.export())
+        logger.info(f"fork - {self.save_name} forked to {new_save_name}")
+
+    def snapshot(self) -> str:
+        """
+        Write a copy of the save to saved/snapshots/<save name>/<time>/: the save
+        database, and exports of the graph and vector stores. Returns the
+        directory.
+        """
+        directory = os.path.join(
+            SAVE_DIR,
+            "snapshots",
+            self.save_name,
+            datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+        )
+        os.makedirs(directory)
+        self.sql_db.flush()
+        self.sql_db.wait_for_writes()
+        self.sql_db.backup(os.path.join(directory, f"{self.save_name}.sql"))
+        with open(os.path.join(directory, "graph.json"), "w") as f:
+            json.dump(self.graph_db.export(), f)
+        with open(os.path.join(directory, "vector.json"), "w") as f:
+            json.dump(self.vector_db.export(), f)
+        logger.info(f"snapshot - {self.save_name} saved to {directory}")
+        return directory
+
+    @classmethod
+    def new_game(cls, save_name: str, seed: Optional[int] = None):
+        llm = LLM()
         state = GameState(
             mode="free",
             location="",
             date="day 0, hour 0",
         )
+        sql_db, noun_db = open_save(save_name)
         game_data = cls(
             llm=llm,
-            sql_db=SQLClient(save_name),
+            sql_db=sql_db,
             graph_db=GraphClient(save_name),
             vector_db=OpenSearchClient(save_name),
             game_state=state,
-            noun_db=ProperNounDB(save_name),
-            player_character=character,
+            noun_db=noun_db,
+            player_character=None,
             save_name=save_name,
         )
+        if game_data.sql_db.has_checkpoints():
+            render_text("Resuming world generation from the last checkpoint..")
+        if seed is None and os.getenv("LLMDM_SEED"):
+            seed = int(os.getenv("LLMDM_SEED"))
+        state.seed = game_data.checkpoint(
+            "new_game/seed",
+            lambda: seed if seed is not None else random.randrange(2**32),
+        )
+        llm.seed = state.seed
+        logger.info(f"new_game - seed: {state.seed}")
+        game_data.player_character = game_data.checkpoint(
+            "new_game/character",
+            lambda: Character.new(llm),
+            dump=asdict,
+            load=lambda data: Character(**data),
+        )
+        new_storyline = game_data.checkpoint(
+            "new_game/storyline", game_data.generate_storyline
+        )
+        logger.debug(new_storyline)
         render_text("\nGenerating..")
         starting_location = game_data.generate_town(
             town_input=f"Based on:\n{new_storyline}"
         )
         game_data.game_state.location = starting_location.name
         game_data.save()
+        game_data.sql_db.clear_checkpoints()
 
         logger.debug(
             f"game_state: {json.dumps(asdict(game_data.game_state), indent=2)}"
@@ -116,6 +244,70 @@ You are a creative storyteller and world-builder for a text-based RPG game. Your
         game_data.travel_to(starting_location)
         return game_data
 
+    def checkpoint(self, step: str, generate, dump=None, load=None):
+        """
+        Run a world generation step once per save.
+
+        The result of ``generate`` is stored in the save database (through ``dump``
+        when it is not JSON serializable) so that, if generation fails later on,
+        restarting it resumes from here and ``load`` rebuilds the result instead of
+        generating it again.
+        """
+        data = self.sql_db.get_checkpoint(step)
+        if data is not None:
+            logger.info(f"checkpoint - resuming from {step}")
+            return load(data) if load else data
+        if self.game_state.seed is not None:
+            # each step draws from its own stream so resuming doesn't shift the
+            # random choices of the steps after it
+            self.rng.seed(f"{self.game_state.seed}/{step}")
+            self.llm.reseed(step)
+        # the step's writes and its checkpoint are committed together
+        with self.unit_of_work():
+            result = generate()
+            self.sql_db.save_checkpoint(step, dump(result) if dump else result)
+        return result
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Commit the writes made to the save databases inside the block as one
+        transaction, e.g. everything a player action or a generation step saves.
+        The writes deferred to the graph and vector stores only run once it
+        commits, and a rollback reloads the location graph from the save.
+        """
+        if self.held_writes is not None:
+            with self.sql_db.transaction(), self.noun_db.transaction():
+                yield
+            return
+        self.held_writes = {}
+        try:
+            with self.sql_db.transaction(), self.noun_db.transaction():
+                yield
+        except BaseException:
+            self.held_writes = None
+            self.location_graph = LocationGraph.from_db(self.sql_db, self.noun_db)
+            raise
+        held, self.held_writes = self.held_writes, None
+        for key, (write, args) in held.items():
+            self.defer(key, write, *args)
+
+    def generate_storyline(self) -> str:
+        return self.llm.generate(
+            """
+Based on the following player character description, generate a short narrative for the small, rural village where the player starts their journey. The narrative should be rich in detail, include compelling plot hooks, and remain open-ended to encourage exploration. Include 1 or two plot hooks that could lead to quests for the player.
+""",
+            # f"""
+            # Concept: {character.description}
+            #
+            # Please craft this narrative to align closely with the character's background, incorporating unique elements that will intrigue the player and set the stage for their adventure.
+            #             """,
+            system_instructions="""
+You are a creative storyteller and world-builder for a text-based RPG game. Your task is to craft unique, engaging, and open-ended narratives that serve as starting points for players. These narratives should be inspired by the player's character description and set in a small town where the player's adventure begins. Include intriguing plot hooks and backstory elements without resolving the storyline, allowing for open-ended gameplay. Avoid clichés and ensure that each story is fresh and imaginative.
+            """,
+            max_new_tokens=256,
+        )
+
     def transition_mode_to(self, mode: str, npc: NPC = None):
         # set time elapsed
         previous_mode = self.game_state.mode
@@ -141,6 +333,13 @@ You are a creative storyteller and world-builder for a text-based RPG game. Your
         parent_location = None
         if destination == "leaving":
             extra_prompt = f"The player is leaving {current_location.name}, {current_location.description} and is going to:\n{player_input}"
+            if nearby_areas := self.location_graph.nearby(
+                current_location.name, top_level=True
+            ):
+                extra_prompt += (
+                    "\n\nThese places already exist nearby, create somewhere else:\n- "
+                    + "\n- ".join(nearby_areas)
+                )
         elif destination == "new sublocation":
             extra_prompt = f"The player is in {current_location.name}, {current_location.description} and is staying there, but going to:\n{player_input}"
             parent_location = current_location.name
@@ -153,6 +352,10 @@ You are a creative storyteller and world-builder for a text-based RPG game. Your
             "sublocations": [],
         }
         _fill_data.update(fill_data)
+        if "coordinates" not in _fill_data:
+            _fill_data["coordinates"] = self.place_location(
+                _fill_data["parent_location"], near=current_location
+            )
         new_location, nicknames = self.llm.generate_object(
             Location,
             fill_data=_fill_data,
@@ -162,8 +365,32 @@ You are a creative storyteller and world-builder for a text-based RPG game. Your
         self.save_location(new_location, nicknames)
         return new_location
 
+    def place_location(
+        self, parent_location: Optional[str] = None, near: Location = None
+    ) -> tuple[float, float]:
+        """
+        Coordinates for a new location: close to its parent location, or a
+        journey away from `near` (or from the world's origin).
+        """
+        parent = self.location_graph.nodes.get(parent_location)
+        if parent and parent.coordinates:
+            origin = parent.coordinates
+            distance = self.rng.uniform(0, SUBLOCATION_RADIUS)
+        else:
+            origin = (near and near.coordinates) or (0.0, 0.0)
+            # the first location of the world is its origin
+            distance = (
+                self.rng.uniform(*TRAVEL_DISTANCE) if self.location_graph.nodes else 0.0
+            )
+        angle = self.rng.uniform(0, 2 * math.pi)
+        return (
+            round(origin[0] + distance * math.cos(angle), 3),
+            round(origin[1] + distance * math.sin(angle), 3),
+        )
+
     def travel_to(self, new_location: Location, move_type: str = None):
-        new_location = self.expand_location(new_location)
+        if self.expand_location(new_location):
+            self.update_location(new_location)
         if not self.game_state.location:
             travel_text = self.llm.generate(
                 f"""
@@ -181,14 +408,33 @@ Keep the description between two to four sentences, making it detailed yet conci
                 """,
                 max_new_tokens=512,
             )
+            travel_text = self.llm.remove_unfinished(travel_text, max_new_tokens=256)
 
         else:
             current_location = self.sql_db.get_location(self.game_state.location)
+            waypoints = []
+            if move_type == "route":
+                # the locations passed through on the way, narrated as one journey
+                route = self.location_graph.find_route(
+                    current_location.name, new_location.name
+                )
+                if route is None:
+                    logger.info(
+                        f"travel_to - no route to {new_location.name}, travelling directly"
+                    )
+                    move_type = "nearby"
+                else:
+                    waypoints = route[1:-1]
+            waypoints_str = ", ".join(
+                f"{name} ({self.location_graph.nodes[name].location_type})"
+                for name in waypoints
+            )
             type_prompt = {
                 "local": f"Focus on a small, immediate transition within {current_location.name}, emphasizing details like proximity and visible features in  the {current_location.location_type}",
                 "child": f"Describe moving deeper within {current_location.name} to a more specific point, referencing key elements in both {current_location.name} and {new_location.name}.",
                 "parent": f"Describe the player’s movement from {current_location.name} outward to the broader {new_location.name}, creating a sense of leaving the smaller space of {current_location.name}.",
                 "nearby": f"Describe the journey between two nearby locations, incorporating the atmosphere of both {current_location.name} and {new_location.name}.",
+                "route": f"Describe the whole journey from {current_location.name} to {new_location.name} as one continuous trip, briefly passing through these locations in order: {waypoints_str}.",
             }.get(move_type)
 
             if move_type == "local":
@@ -218,20 +464,30 @@ The player is moving from one location to another in a text-based RPG.
 
 {type_prompt}
 
-Describe the player’s movement from {current_location.name} to {new_location}. Use the characteristics of the {current_location.location_type} and the {new_location.location_type} to guide your description. Mention key details from each location to create a short, but immersive transition. Respond in one to three sentences.
+Describe the player’s movement from {current_location.name} to {new_location.name}. Use the characteristics of the {current_location.location_type} and the {new_location.location_type} to guide your description. Mention key details from each location to create a short, but immersive transition. Respond in one to three sentences.
                 """
-            travel_text = self.llm.generate(
-                prompt=prompt,
-                system_instructions="""
-You are creating travel descriptions for a text-based RPG. When a player moves from one location to another, describe the transition in a way that captures the feel of both locations. Use the location names, types, and descriptions to set the scene, and incorporate motion verbs (like “stride,” “stroll,” “hurry”) that match the tone and setting. The descriptions should be short, vivid, and help the player imagine the journey.
-                """,
-                max_new_tokens=256,
+            # narrations are reused per route until one of the locations changes
+            route = (current_location.name, new_location.name, move_type)
+            source_key = content_key(
+                current_location.describe(), new_location.describe(), *waypoints
             )
-        travel_text = self.llm.remove_unfinished(travel_text, max_new_tokens=256)
+            travel_text = self.sql_db.get_travel_narration(*route, source_key)
+            if travel_text is None:
+                travel_text = self.llm.generate(
+                    prompt=prompt,
+                    system_instructions="""
+You are creating travel descriptions for a text-based RPG. When a player moves from one location to another, describe the transition in a way that captures the feel of both locations. Use the location names, types, and descriptions to set the scene, and incorporate motion verbs (like “stride,” “stroll,” “hurry”) that match the tone and setting. The descriptions should be short, vivid, and help the player imagine the journey.
+                    """,
+                    max_new_tokens=256,
+                )
+                travel_text = self.llm.remove_unfinished(
+                    travel_text, max_new_tokens=256
+                )
+                self.sql_db.save_travel_narration(*route, source_key, travel_text)
         render_text(travel_text)
         render_text("----------")
         self.game_state.location = new_location.name
-        self.describe_scene()
+        self.describe_scene(new_location)
 
     def generate_npc(
         self,
@@ -240,22 +496,23 @@ You are creating travel descriptions for a text-based RPG. When a player moves f
         fill_data: dict = {},
         prefill=True,
     ):
+        fill_data = dict(fill_data)
         if prefill:
             if "gender" not in fill_data:
-                fill_data["gender"] = random.choices(
+                fill_data["gender"] = self.rng.choices(
                     list(NAMES.keys()), weights=[0.47, 0.47, 0.06], k=1
                 )[0]
             gender = fill_data["gender"]
 
-            for _ in range(10):
-                if "name" not in fill_data:
-                    fill_data["name"] = random.choice(NAMES[gender])
-                    name = fill_data["name"]
-                if not self.sql_db.npc_name_used(name):
-                    break
+            if "name" not in fill_data:
+                for _ in range(10):
+                    fill_data["name"] = self.rng.choice(NAMES[gender])
+                    if not self.sql_db.npc_name_used(fill_data["name"]):
+                        break
+            name = fill_data["name"]
 
             if "traits" not in fill_data:
-                fill_data["traits"] = random.choice(TRAIT_TRIPLETS)
+                fill_data["traits"] = self.rng.choice(TRAIT_TRIPLETS)
             traits = fill_data["traits"]
 
             extra_prompt += f"""
@@ -265,23 +522,32 @@ The NPC is named {name}, they are {gender} presenting, and they have these trait
         else:
             name = None
 
-        # placeholders updated after initial generation
-        fill_data["affinity_score"] = 0
-        fill_data["affinity_type"] = "not set"
-
         if player_input:
             extra_prompt += f"The player gave this description of the NPC they are approaching: {player_input}"
 
-        new_npc, nicknames = self.llm.generate_object(
-            NPC,
-            fill_data=fill_data,
-            nicknames=True,
-            extra_prompt=extra_prompt,
-            name=name,
-        )
-        new_npc.affinity_score, new_npc.affinity_type = self.llm.generate_affinity_data(
-            new_npc, self.player_character
-        )
+        try:
+            new_npc, nicknames = self.llm.generate_full_npc(
+                self.player_character,
+                fill_data=fill_data,
+                extra_prompt=extra_prompt,
+                name=name,
+            )
+        except ValueError as e:
+            logger.info(f"generate_npc - {e}, generating in steps")
+            # placeholders updated after initial generation
+            fill_data["affinity_score"] = 0
+            fill_data["affinity_type"] = "not set"
+
+            new_npc, nicknames = self.llm.generate_object(
+                NPC,
+                fill_data=fill_data,
+                nicknames=True,
+                extra_prompt=extra_prompt,
+                name=name,
+            )
+            new_npc.affinity_score, new_npc.affinity_type = (
+                self.llm.generate_affinity_data(new_npc, self.player_character)
+            )
         self.save_npc(new_npc, nicknames)
         return new_npc
 
@@ -311,12 +577,22 @@ The NPC is named {name}, they are {gender} presenting, and they have these trait
         return self.sql_db.get_all_npcs()
 
     def get_location(self, name: str) -> Location:
-        proper_name = self.noun_db.fuzzy_lookup(name)
+        proper_name = self.noun_db.fuzzy_lookup(name, kind="location")
         return self.sql_db.get_location(proper_name)
 
     def get_npc_to_talk_to(self, player_input):
-        current_location = self.sql_db.get_location(self.game_state.location)
-        npc_name = self.llm.get_npc_name(player_input, current_location)
+        candidates = self.noun_db.mentions(
+            player_input,
+            threshold=UNAMBIGUOUS_SCORE,
+            kind="npc",
+            within=self.game_state.location,
+        )
+        if len(candidates) == 1:
+            logger.debug(f"get_npc_to_talk_to: resolved locally: {candidates}")
+            return self.sql_db.get_npc(candidates[0][0])
+        npc_name = self.llm.get_npc_name(
+            player_input, self.sql_db.get_npc_summaries(self.game_state.location)
+        )
         logger.debug(f"get_npc_to_talk_to: name from location info: {npc_name}")
         if npc_name:
             try:
@@ -324,6 +600,7 @@ The NPC is named {name}, they are {gender} presenting, and they have these trait
             except IndexError as e:
                 raise e
                 logger.debug("Generating new NPC to talk to...")
+                current_location = self.sql_db.get_location(self.game_state.location)
                 npc = self.generate_npc(
                     extra_prompt=f"""
 The npc is: {npc_name}, and they are currently in {current_location.name}, {current_location.description}
@@ -332,13 +609,23 @@ The npc is: {npc_name}, and they are currently in {current_location.name}, {curr
                     fill_data={"location_name": current_location.name},
                 )
                 current_location.npcs.append(npc)
-                self.sql_db.save_location(current_location)
+                self.update_location(current_location)
                 return npc
         logger.debug("get_npc_to_talk_to: NPC not found")
         return None
 
+    def resolve_names(self, names: list[str], kind: str = None) -> list[str]:
+        """The known proper noun each name stands for, or the name if none."""
+        return [
+            resolved or name
+            for name, (resolved, _) in zip(
+                names,
+                self.noun_db.fuzzy_lookup_many(names, SAME_NAME_SCORE, kind=kind),
+            )
+        ]
+
     def get_npc(self, name: str) -> NPC:
-        proper_name = self.noun_db.fuzzy_lookup(name)
+        proper_name = self.noun_db.fuzzy_lookup(name, kind="npc")
         logger.debug(f"GameData.get_npc - {proper_name=}")
         return self.sql_db.get_npc(proper_name)
 
@@ -418,27 +705,138 @@ You are given NPC descriptions and you response ONLY with a short description of
                 npc, motivation=self.game_state.mode_data["npc_motivation"]
             )
 
-    def generate_town(self, town_input=""):
-        name = random.choice(TOWN_NAMES)
+    def plan_town(self) -> dict:
+        name = self.rng.choice(TOWN_NAMES)
         # select town locations
-        town_size = random.randint(4, 10)
+        town_size = self.rng.randint(4, 10)
         num_essential = max(town_size // 3, 3)
-        has_a_unique = random.randint(0, town_size - num_essential) > 3
+        has_a_unique = self.rng.randint(0, town_size - num_essential) > 3
         num_common = town_size - num_essential - has_a_unique
 
+        # dict.fromkeys keeps the order stable across runs, unlike set
         town_pois = list(
-            set(
-                random.choices(COMMON_LOCATIONS, k=num_common)
-                + random.choices(ESSENTIAL_LOCATIONS, k=num_essential)
+            dict.fromkeys(
+                self.rng.choices(COMMON_LOCATIONS, k=num_common)
+                + self.rng.choices(ESSENTIAL_LOCATIONS, k=num_essential)
             )
         )
         if has_a_unique:
-            town_pois.append(random.choice(UNIQUE_LOCATIONS))
+            town_pois.append(self.rng.choice(UNIQUE_LOCATIONS))
+        return {"name": name, "points_of_interest": town_pois}
+
+    def generate_town(self, town_input=""):
+        # every step is checkpointed so a failure only costs the step that failed
+        town_plan = self.checkpoint("town/plan", self.plan_town)
+        name = town_plan["name"]
+        town_pois = town_plan["points_of_interest"]
 
         logger.info(f"generate_town - points of interest: {town_pois}")
 
+        town_description = self.checkpoint(
+            "town/description",
+            lambda: self.generate_town_description(town_input, name, town_pois),
+        )
+        the_town = self.checkpoint(
+            "town/location",
+            lambda: self.generate_location(
+                player_input=f"Use the following information when designing the town:\n{town_description}",
+                fill_data={"name": name},
+            ),
+            dump=lambda location: location.name,
+            load=self.sql_db.get_location,
+        )
+        locations_in_town = [
+            self.checkpoint(
+                f"town/location/{point_of_interest}",
+                lambda point_of_interest=point_of_interest: self.generate_location(
+                    player_input=f"Create a {point_of_interest}.\nThe {point_of_interest} is in the town of {the_town.name}:\n{town_description}.",
+                    fill_data={"parent_location": the_town.name},
+                ),
+                dump=lambda location: location.name,
+                load=self.sql_db.get_location,
+            )
+            for point_of_interest in town_pois
+        ]
+        # the NPCs of the description that already exist are not generated again
+        npc_names = self.checkpoint(
+            "town/npc_names",
+            lambda: list(
+                dict.fromkeys(
+                    self.resolve_names(
+                        self.llm.parse_out(town_description, NPC), kind="npc"
+                    )
+                )
+            ),
+        )
+        npcs = [
+            self.checkpoint(
+                f"town/npc/{npc_parsed}",
+                lambda npc_parsed=npc_parsed: self.sql_db.get_npc(npc_parsed)
+                or self.generate_npc_from_lore(town_description, npc_parsed),
+                dump=lambda npc: npc.name,
+                load=self.sql_db.get_npc,
+            )
+            for npc_parsed in npc_names
+        ]
+
+        def match_npcs_to_locations():
+            self.llm.match_npcs_to_locations(
+                town_description,
+                locations_in_town,
+                npcs,
+                resolve_names=lambda names: self.resolve_names(names, kind="npc"),
+            )
+            matched = []
+            for location in locations_in_town:
+                for npc in location.npcs:
+                    npc.location_name = location.name
+                    matched.append(npc)
+            self.sql_db.save_npcs(matched)
+            self.noun_db.set_within({npc.name: npc.location_name for npc in matched})
+            return {
+                loc.name: [npc.name for npc in loc.npcs] for loc in locations_in_town
+            }
+
+        npc_locations = self.checkpoint("town/npc_locations", match_npcs_to_locations)
+        npc_map = {npc.name: npc for npc in npcs}
+
+        def populate_location(location):
+            location.npcs = [npc_map[n] for n in npc_locations[location.name]]
+            self.expand_location(location)
+            self.noun_db.add(
+                location.name, [], kind="location", within=location.parent_location
+            )
+            return location
+
+        def load_populated(location, npc_names):
+            location.npcs = [self.sql_db.get_npc(name) for name in npc_names]
+            return location
+
+        # the NPCs generated by each step are saved by it, the locations are
+        # saved together once they are all populated
+        for location in locations_in_town:
+            self.checkpoint(
+                f"town/populate/{location.name}",
+                lambda location=location: populate_location(location),
+                dump=lambda location: [npc.name for npc in location.npcs],
+                load=lambda npc_names, location=location: load_populated(
+                    location, npc_names
+                ),
+            )
+
+        def save_town():
+            the_town.sublocations = [loc.name for loc in locations_in_town]
+            self.update_locations([*locations_in_town, the_town])
+            return the_town.name
+
+        self.checkpoint("town/save", save_town)
+        return the_town
+
+    def generate_town_description(
+        self, town_input: str, name: str, town_pois: list[str]
+    ) -> str:
         pois_str = "- " + "\n- ".join(town_pois)
-        town_description = self.llm.generate(
+        return self.llm.generate(
             prompt=f"""
 Using the following storyline:
 {town_input}
@@ -462,27 +860,6 @@ Do not provide a closed narrative or fixed events; instead, create an intriguing
             """,
             max_new_tokens=2048,
         )
-        the_town = self.generate_location(
-            player_input=f"Use the following information when designing the town:\n{town_description}",
-            fill_data={"name": name},
-        )
-        locations_in_town = [
-            self.generate_location(
-                player_input=f"Create a {point_of_interest}.\nThe {point_of_interest} is in the town of {the_town.name}:\n{town_description}.",
-                fill_data={"parent_location": the_town.name},
-            )
-            for point_of_interest in town_pois
-        ]
-        npcs = self.generate_from_lore(town_description, types=[NPC]).get("NPC")
-        self.llm.match_npcs_to_locations(town_description, locations_in_town, npcs)
-        for location in locations_in_town:
-            self.expand_location(location)
-            self.noun_db.add(location.name, [])
-            self.sql_db.save_location(location)
-
-        the_town.sublocations = [loc.name for loc in locations_in_town]
-        self.sql_db.save_location(the_town)
-        return the_town
 
     def respond_npc_not_found(self, player_input):
         current_location = self.get_location(self.game_state.location)
@@ -504,55 +881,48 @@ You output brief resonses the the player's actions.
             )
         )
 
-    def generate_from_lore(self, text, types="all"):
-        if types == "all":
-            types = [NPC, Location]
-        generated = defaultdict(list)
-        for object_type in types:
-            for npc_parsed in self.llm.parse_out(text, object_type):
-                generated[f"{object_type.__name__}"].append(
-                    self.generate_npc(
-                        extra_prompt=f"""
+    def generate_npc_from_lore(self, text: str, npc_parsed: str) -> NPC:
+        return self.generate_npc(
+            extra_prompt=f"""
 Create an NPC with **name**: {npc_parsed}
 Use details about {npc_parsed} from following description:
 {text}
 """,
-                        prefill=False,
-                    )
-                )
-        # can use current state to influence generated results
-        return generated
+            prefill=False,
+        )
 
     def get_location_to_move_to(
         self,
         player_input: str,
     ) -> (str, Location):
-        current_location = self.sql_db.get_location(self.game_state.location)
+        # try to resolve the destination from the names around the player first
+        if resolved := self.location_graph.resolve_movement(
+            player_input, self.game_state.location
+        ):
+            move_type, destination = resolved
+            logger.info(f"get_location_to_move_to - resolved locally: {resolved}")
+            return move_type, self.sql_db.get_location(destination)
+
+        neighborhood = self.get_neighborhood()
+        current_location = neighborhood.location
+        parent_location = neighborhood.parent
         dest_options = ["local"]
-        if current_location.parent_location:
-            parent_location = self.sql_db.get_location(current_location.parent_location)
+        if parent_location:
             dest_options.append("parent")
-            nearby_locations = [
-                self.sql_db.get_location(nl)
-                for nl in parent_location.sublocations
-                if nl != current_location.name
-            ]
             parent_dependant = f"""
 - Parent Location:
 name: {parent_location.name}, type: {parent_location.location_type}
 """
-            if nearby_locations:
-                dest_options.append("nearby")
-                parent_dependant += "- Nearby Locations:\n" + "\n".join(
-                    f"name: {nearby_location.name}, type: {nearby_location.location_type}"
-                    for nearby_location in nearby_locations
-                )
         else:
             parent_dependant = ""
-            nearby_locations = None
-        child_locations = list(
-            map(self.sql_db.get_location, current_location.sublocations)
-        )
+        nearby_locations = neighborhood.siblings + neighborhood.nearby
+        if nearby_locations:
+            dest_options.append("nearby")
+            parent_dependant += "- Nearby Locations:\n" + "\n".join(
+                f"name: {nearby_location.name}, type: {nearby_location.location_type}"
+                for nearby_location in nearby_locations
+            )
+        child_locations = neighborhood.children
         if child_locations:
             dest_options.append("child")
             child_locations_str = "- Child Locations:\n" + "\n".join(
@@ -617,18 +987,15 @@ Below are contextual details about the game environment to help with interpretin
             )
         )
         movement_data["destination"] = self.noun_db.fuzzy_lookup(
-            movement_data["destination"]
+            movement_data["destination"], kind="location"
         )
         render_text("Movement Data:")
         render_text(json.dumps(movement_data, indent=2))
 
         if current_location.name == movement_data["destination"]:
             return "local", current_location
-        if (
-            current_location.parent_location
-            and parent_location.name == movement_data["destination"]
-        ):
-            return "local", current_location
+        if parent_location and parent_location.name == movement_data["destination"]:
+            return "parent", parent_location
 
         if nearby_locations:
             for nearby_location in nearby_locations:
@@ -642,10 +1009,26 @@ Below are contextual details about the game environment to help with interpretin
         render_text("Error with movement data")
         raise ValueError("Bad LLM Generation")
 
+    def get_neighborhood(self, name: str = None) -> Neighborhood:
+        """
+        The location (the player's by default) and those one move away, including
+        the areas around it on the map.
+        """
+        name = name or self.game_state.location
+        nearby = [
+            other
+            for other, move_type in self.location_graph.neighbors(name).items()
+            if move_type == "nearby"
+        ]
+        return self.sql_db.get_neighborhood(name, nearby=nearby)
+
     def describe_scene(self, location: Location = None):
         if location is None:
             location = self.sql_db.get_location(self.game_state.location)
-        npcs = location.npcs
+        # only the columns used by the prompt, not whole NPCs and locations
+        npcs = self.sql_db.get_npc_summaries(
+            location.name, ("name", "appearance", "traits", "gender")
+        )
         if npcs:
             npc_instruct = """
 When describing a scene that includes NPCs, mention the NPCs as part of the environment. Use their appearance, actions, or traits to enhance the scene’s atmosphere. Focus on how the NPCs interact with the environment or each other, but keep the main focus on the player’s perspective.
@@ -659,6 +1042,35 @@ When describing a scene that includes NPCs, mention the NPCs as part of the envi
         else:
             npc_instruct = ""
             npc_descriptions = ""
+        exits = self.sql_db.get_location_summaries(
+            [
+                name
+                for name, move_type in self.location_graph.neighbors(
+                    location.name
+                ).items()
+                if move_type in ("parent", "child")
+            ],
+            ("name", "location_type"),
+        )
+        if exits:
+            exit_descriptions = """
+**Ways Out**:
+""" + "\n".join(
+                f"{way.name} ({way.location_type})" for way in exits
+            )
+        else:
+            exit_descriptions = ""
+
+        # the scene only depends on the location, the NPCs present and the ways
+        # out, so it is reused until one of them changes
+        scene_key = content_key(
+            location.describe(), npc_descriptions, exit_descriptions
+        )
+        if (
+            response := self.sql_db.get_scene_description(location.name, scene_key)
+        ) is not None:
+            render_text(response)
+            return
 
         response = self.llm.generate(
             f"""
@@ -667,6 +1079,7 @@ Describe the scene for the location below, focusing on its atmosphere, sensory d
 {location.describe()}
 
 {npc_descriptions}
+{exit_descriptions}
             """,
             system_instructions=f"""
 You are describing scenes in a text-based RPG. For each location, focus on creating an immersive description that highlights the atmosphere, sensory details (sights, sounds, smells, textures), and notable features.
@@ -680,21 +1093,24 @@ Write the description in two to four sentences, and keep it grounded in the play
 """,
             max_new_tokens=256,
         )
+        self.sql_db.save_scene_description(location.name, scene_key, response)
         render_text(response)
 
-    def expand_location(self, location: Location) -> Location:
+    def expand_location(self, location: Location) -> list[NPC]:
+        """
+        Generate NPCs for a location with too few, adding them to its NPCs.
+        Returns the new NPCs, the caller saves the location.
+        """
+        new_npcs = []
         if len(location.npcs) < 3:
-            n_npcs = random.randint(3, 6) - len(location.npcs)
+            n_npcs = self.rng.randint(3, 6) - len(location.npcs)
             new_npcs = self.generate_more_npcs(location, n=n_npcs)
-            for npc in new_npcs:
-                self.save_npc(npc)
             location.npcs.extend(new_npcs)
-            self.sql_db.save_location(location)
         if not location.sublocations:
             # does location type not need sublocations (rooms, etc)
             # generate full layout
             pass
-        return location
+        return new_npcs
 
     def update_affinity_score(self):
         npc = self.sql_db.get_npc(self.game_state.mode_data["npc"])
@@ -757,33 +1173,68 @@ Write the description in two to four sentences, and keep it grounded in the play
                 continue
         if npcs_ideas is None:
             return []
-        npcs = []
+        ideas = []
         for npc_idea in npcs_ideas:
             if not isinstance(npc_idea, str):
                 npc_idea = json.dumps(npc_idea)
-            if not npc_idea.strip():
-                continue
-            logger.debug(f"generating npc for {location.name}")
-            npcs.append(
-                self.generate_npc(
-                    extra_prompt=f"Create the NPC based on the following idea:\n{npc_idea.strip()}",
-                    fill_data={"location_name": location.name},
-                    prefill=False,
-                )
-            )
+            if npc_idea.strip():
+                ideas.append(npc_idea.strip())
+        logger.debug(f"generating {len(ideas)} npcs for {location.name}")
+        return self.generate_npcs_from_ideas(
+            ideas, fill_data={"location_name": location.name}
+        )
+
+    def generate_npcs_from_ideas(
+        self, ideas: list[str], fill_data: dict = {}
+    ) -> list[NPC]:
+        """
+        Turn NPC ideas into saved NPCs, NPC_BATCH_SIZE ideas per generation. Ideas
+        whose generated record is invalid or reuses a name fall back to generate_npc.
+        """
+        npcs = []
+        names_used = set()
+        for start in range(0, len(ideas), NPC_BATCH_SIZE):
+            batch = ideas[start : start + NPC_BATCH_SIZE]
+            records = self.llm.generate_npcs(batch, self.player_character)
+            # the valid records of the batch are saved together
+            generated, generated_nicknames = [], []
+            for npc_idea, record in zip_longest(batch, records[: len(batch)]):
+                try:
+                    npc, nicknames = parse_npc_record(record, fill_data)
+                    normalized_name = self.noun_db.normalize_name(npc.name)
+                    if normalized_name in names_used or self.sql_db.npc_name_used(
+                        npc.name
+                    ):
+                        raise ValueError(f"name already used: {npc.name}")
+                except ValueError as e:
+                    logger.info(f"generate_npcs_from_ideas - {e}, generating alone")
+                    npc = self.generate_npc(
+                        extra_prompt=f"Create the NPC based on the following idea:\n{npc_idea}",
+                        fill_data=fill_data,
+                        prefill=False,
+                    )
+                else:
+                    generated.append(npc)
+                    generated_nicknames.append(nicknames)
+                names_used.add(self.noun_db.normalize_name(npc.name))
+                npcs.append(npc)
+            if generated:
+                self.save_npcs(generated, generated_nicknames)
         return npcs
 
     def save_conversation(self):
         conversation_summary = self.llm.summarize_conversation(
             **self.game_state.mode_data
         )
-        self.vector_db.index_document(
+        self.defer(
+            object(),
+            self.vector_db.index_document,
             {
                 "date": self.game_state.date,
                 "type": "conversation",
                 "summary": conversation_summary,
                 "npc": self.game_state.mode_data["npc"],
-            }
+            },
         )
 
     def get_npc_history(self, npc: NPC) -> str:
@@ -797,16 +1248,44 @@ Write the description in two to four sentences, and keep it grounded in the play
     def save_npc(self, npc, nicknames=None):
         if nicknames is None:
             nicknames = self.llm.generate_nicknames(npc)
-        self.noun_db.add(npc.name, nicknames)
+        self.noun_db.add(npc.name, nicknames, kind="npc", within=npc.location_name)
         self.sql_db.save_npc(npc)
-        self.graph_db.add_entity(npc)
+        self.defer(("entity", "npc", npc.name), self.graph_db.add_entity, npc)
 
     def save_location(self, location, nicknames=None):
         if nicknames is None:
             nicknames = self.llm.generate_nicknames(location)
-        self.noun_db.add(location.name, nicknames)
+        self.noun_db.add(
+            location.name,
+            nicknames,
+            kind="location",
+            within=location.parent_location,
+        )
         self.sql_db.save_location(location)
-        self.graph_db.add_entity(location)
+        self.location_graph.add(location, nicknames)
+        self.defer(
+            ("entity", "location", location.name), self.graph_db.add_entity, location
+        )
+
+    def save_npcs(self, npcs: list[NPC], nicknames: list[list[str]]):
+        """save_npc for many NPCs at once, with their already generated nicknames."""
+        with self.unit_of_work():
+            self.noun_db.add_many(
+                list(zip([npc.name for npc in npcs], nicknames)), kind="npc"
+            )
+            self.noun_db.set_within({npc.name: npc.location_name for npc in npcs})
+            self.sql_db.save_npcs(npcs)
+        self.defer(object(), self.graph_db.add_entities, npcs)
+
+    def update_location(self, location: Location):
+        """Save changes to a location that was already added with save_location."""
+        self.update_locations([location])
+
+    def update_locations(self, locations: list[Location]):
+        """update_location for many locations, written with one save_locations."""
+        self.sql_db.save_locations(locations)
+        for location in locations:
+            self.location_graph.add(location)
 
     def save_quest(self, quest: Quest):
         self.sql_db.save_quest(quest)
@@ -816,12 +1295,18 @@ Write the description in two to four sentences, and keep it grounded in the play
         quest_data.pop("locations")
         quest_data.update({"type": "quest/aquired", "npc": quest.giver})
 
-        self.vector_db.index_document(quest_data)
-        self.graph_db.add_entity(quest)
-        for npc in npcs:
-            npc_name = self.noun_db.fuzzy_lookup(npc)
-            self.graph_db.add_relation(
-                {"_from": f"npc/{npc_name}", "_to": f"quest/{quest.name}"}
+        self.defer(object(), self.vector_db.index_document, quest_data)
+        self.defer(("entity", "quest", quest.name), self.graph_db.add_entity, quest)
+        for npc, (npc_name, _) in zip(
+            npcs, self.noun_db.fuzzy_lookup_many(npcs, kind="npc")
+        ):
+            if npc_name is None:
+                logger.debug(f"save_quest - {npc} not found")
+                continue
+            self.defer(
+                object(),
+                self.graph_db.add_relation,
+                {"_from": f"npc/{npc_name}", "_to": f"quest/{quest.name}"},
             )
 
     def get_quest(self, name) -> Quest:
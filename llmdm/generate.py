@@ -1,8 +1,10 @@
 import json
 import logging
 import os
+import random
 import re
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, fields
+from typing import Optional
 
 from openai import OpenAI
 
@@ -13,14 +15,27 @@ from llmdm.npc import NPC
 from llmdm.utils import prompt_user_input, render_text, suppress_stdout
 
 with suppress_stdout():
-    from transformers import AutoTokenizer, pipeline
+    from transformers import AutoTokenizer, pipeline, set_seed
 
 
 logger = logging.getLogger(__name__)
 
+AFFINITY_TYPES = ("fixed", "dynamic", "deciding")
+AFFINITY_GUIDE = """
+- **affinity_score**: an integer from -100 to 100 for the NPC's initial disposition toward the player: Enemy <= -50, Rival -49 to -10, Neutral -9 to 9, Friendly 10 to 49, Ally 50 to 89, Loved One >= 90.
+- **affinity_type**: how the NPC's affinity can change over time, one of: "fixed" (never changes), "dynamic" (changes often, in small steps), "deciding" (open at first, more resistant with each shift).
+"""
+
 
 class LLM:
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
+        # when set, each generation is sampled with a seed derived from it, the
+        # stream and the number of generations so far, so the same sequence of
+        # prompts always gives the same responses while a retried prompt gets a
+        # new one
+        self.seed = seed
+        self.stream = ""
+        self.calls = 0
         self.USE_OAI = os.getenv("USE_OPENAI")
         if self.USE_OAI:
             self.client = OpenAI()
@@ -37,6 +52,17 @@ class LLM:
                     tokenizer=AutoTokenizer.from_pretrained(model_name),
                 )
 
+    def reseed(self, stream: str):
+        """Derive the seeds of the next generations from `stream`, e.g. a step name."""
+        self.stream = stream
+        self.calls = 0
+
+    def next_seed(self) -> Optional[int]:
+        if self.seed is None:
+            return None
+        self.calls += 1
+        return random.Random(f"{self.seed}/{self.stream}/{self.calls}").randrange(2**31)
+
     def generate(
         self,
         prompt,
@@ -54,18 +80,23 @@ class LLM:
             },
             {"role": "user", "content": prompt.strip()},
         ]
+        seed = self.next_seed()
         if self.USE_OAI:
             response_format = {"type": "json_object"} if json_out else None
+            sampling = {} if seed is None else {"seed": seed}
             generated_text = (
                 self.client.chat.completions.create(
                     messages=messages,
                     model="gpt-4o",
                     response_format=response_format,
+                    **sampling,
                 )
                 .choices[0]
                 .message.content
             )
         else:
+            if seed is not None:
+                set_seed(seed)
             with suppress_stdout():
                 generated_text = (
                     self.pipeline(
@@ -255,6 +286,100 @@ You are an AI designed to parse {object_type} data out of descriptions. You are
             return obj, self.generate_nicknames(obj)
         return obj
 
+    def generate_full_npc(
+        self,
+        player_character: Character,
+        fill_data: dict = {},
+        extra_prompt: str = None,
+        name: str = None,
+    ) -> (NPC, list[str]):
+        """
+        Generate an NPC together with its nicknames and initial affinity data in
+        one structured generation. Raises ValueError if no valid NPC was generated.
+        """
+        template = {
+            k: v for k, v in npc_record_template().items() if k not in fill_data
+        }
+        llm_prompt = f"""
+Player Character Information:
+{player_character.describe()}
+
+Create a detailed NPC for our text-based RPG game.
+Include the following data: {', '.join(template)}
+"""
+        if extra_prompt:
+            llm_prompt += f"\n\n{extra_prompt}"
+        llm_prompt += f"""
+Also include:
+- **nicknames**: 3-5 alternate names, mixing titles based on the NPC's role or description and familiar nicknames based on their name.
+{AFFINITY_GUIDE}
+Remember to output the NPC as a JSON object and no other text.
+"""
+        if not name:
+            name_instruct = "Create an NPC with a name that is unique to this setting and avoid commonly used fantasy names like Elara, Mira, Thorne, and Bran. Create names that are unfamiliar yet fit within a medieval fantasy world."
+        else:
+            name_instruct = ""
+
+        for i in range(3):
+            try:
+                generated_data = self.generate(
+                    llm_prompt,
+                    system_instructions=f"""
+You are a part of an expert AI Dungeon Master. You are the AI designed to create an NPC for the game.
+{name_instruct}
+You are careful to escape quotation marks when needed because you ONLY output VALID JSON in the format:
+{json.dumps(template, indent=2)}
+                    """,
+                    max_new_tokens=1000,
+                    json_out=True,
+                )
+                return parse_npc_record(json.loads(generated_data), fill_data)
+            except Exception as e:
+                logger.info(f"Could not parse NPC data, attempt {i}: {e}")
+        raise ValueError("Could not create a full NPC...")
+
+    def generate_npcs(self, ideas: list[str], player_character: Character) -> list:
+        """
+        Generate complete NPC records, including nicknames and affinity data, for
+        several NPC ideas with one structured generation.
+
+        Records are returned unvalidated, see parse_npc_record.
+        """
+        ideas_str = "\n".join(f"{i + 1}. {idea}" for i, idea in enumerate(ideas))
+        template = json.dumps({"npcs": [npc_record_template()]}, indent=2)
+        for i in range(3):
+            try:
+                generated_data = self.generate(
+                    f"""
+Player Character Information:
+{player_character.describe()}
+
+Create one detailed NPC for each of the following NPC ideas, in the same order:
+{ideas_str}
+
+For each NPC also include:
+- **nicknames**: 3-5 alternate names, mixing titles based on the NPC's role or description and familiar nicknames based on their name.
+{AFFINITY_GUIDE}
+Remember to output a JSON object with a list of {len(ideas)} NPCs and no other text.
+                    """,
+                    system_instructions=f"""
+You are a part of an expert AI Dungeon Master. You are the AI designed to create NPCs for a text-based RPG.
+Keep each NPC true to its idea and make every NPC's name unique. You are careful to escape quotation marks when needed because you ONLY output VALID JSON in the format:
+{template}
+                    """,
+                    max_new_tokens=600 * len(ideas),
+                    json_out=True,
+                )
+                records = json.loads(generated_data)
+                if isinstance(records, dict):
+                    records = records.get("npcs")
+                if not isinstance(records, list):
+                    raise ValueError(f"expected a list of NPCs, got: {records}")
+                return records
+            except Exception as e:
+                logger.info(f"Could not parse NPC batch, attempt {i}: {e}")
+        return []
+
     def generate_nicknames(self, obj: dataclass) -> list:
         nicknames = (
             self.generate(
@@ -285,7 +410,7 @@ Provide a list of 3-5 comma separated names, with a mix of both title-based and
         if type(obj) is NPC:
             nicknames.append(obj.name.split(" ")[0])
 
-        return list(set(n.strip() for n in nicknames))
+        return list(dict.fromkeys(n.strip() for n in nicknames))
 
     def generate_for_npc(
         self, prompt: str, npc: NPC, motivation: str, player_name: str
@@ -372,11 +497,12 @@ Answer only with "Yes" or "No" based on the NPC’s intent to end or continue th
             .lower()
         )
 
-    def get_npc_name(self, player_input: str, current_location: Location) -> str:
-        if not current_location.npcs:
+    def get_npc_name(self, player_input: str, npc_summaries: list) -> str:
+        """npc_summaries: name and description of the NPCs at the player's location."""
+        if not npc_summaries:
             return None
         npcs = "- " + "\n- ".join(
-            [f"{npc.name}: {npc.description}" for npc in current_location.npcs]
+            [f"{npc.name}: {npc.description}" for npc in npc_summaries]
         )
         exists = self.generate(
             f"""
@@ -445,7 +571,7 @@ You are an AI designed to parse a list of NPC *names* out of descriptions. You a
                     max_new_tokens=512,
                     json_out=True,
                 )
-                obj_list = list(set(json.loads(generated_data)))
+                obj_list = list(dict.fromkeys(json.loads(generated_data)))
                 break
             except Exception as e:
                 logger.info(f"Could not parse json response attempt {i}: {e}")
@@ -457,7 +583,11 @@ You are an AI designed to parse a list of NPC *names* out of descriptions. You a
         return obj_list
 
     def match_npcs_to_locations(
-        self, description: str, locations: list[Location], npcs: list[NPC]
+        self,
+        description: str,
+        locations: list[Location],
+        npcs: list[NPC],
+        resolve_names=None,
     ):
         people = "\n".join(f"{npc.name}: {npc.description}" for npc in npcs)
         places = "\n".join(f"{loc.name}: {loc.description}" for loc in locations)
@@ -505,7 +635,11 @@ Be careful to escape quotation marks when needed and ONLY output VALID JSON.
 
         npc_map = {npc.name: npc for npc in npcs}
         location_map = {loc.name: loc for loc in locations}
-        for npc_name, location_name in matches.items():
+        npc_names = list(matches)
+        if resolve_names is not None:
+            # the names as written in the output may be a little off
+            npc_names = resolve_names(npc_names)
+        for npc_name, location_name in zip(npc_names, matches.values()):
             npc = npc_map.get(npc_name)
             location = location_map.get(location_name)
             if location and npc:
@@ -723,6 +857,47 @@ When summarizing:
         )
 
 
+def npc_record_template() -> dict:
+    template = asdict(NPC())
+    template["affinity_score"] = "<integer from -100 to 100>"
+    template["affinity_type"] = "<fixed | dynamic | deciding>"
+    template["nicknames"] = ["<nickname or title>"]
+    return template
+
+
+def parse_npc_record(record: dict, fill_data: dict = {}) -> (NPC, list[str]):
+    """
+    Validate a generated NPC record (see npc_record_template) and build the NPC
+    and its nicknames from it. Raises ValueError if the record is unusable.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"NPC record is not an object: {record}")
+    npc_data = {f.name: record.get(f.name) for f in fields(NPC)}
+    npc_data.update(fill_data)
+    if missing := [k for k, v in npc_data.items() if v is None or v == ""]:
+        raise ValueError(f"NPC record is missing {missing}")
+    for f in fields(NPC):
+        if f.type is str:
+            npc_data[f.name] = str(npc_data[f.name]).strip()
+    try:
+        npc_data["affinity_score"] = max(
+            -100, min(100, int(npc_data["affinity_score"]))
+        )
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid affinity_score: {npc_data['affinity_score']}")
+    npc_data["affinity_type"] = npc_data["affinity_type"].lower()
+    if npc_data["affinity_type"] not in AFFINITY_TYPES:
+        raise ValueError(f"invalid affinity_type: {npc_data['affinity_type']}")
+    npc = NPC(**npc_data)
+
+    nicknames = record.get("nicknames") or []
+    if isinstance(nicknames, str):
+        nicknames = nicknames.split(",")
+    nicknames = [str(n).strip() for n in nicknames if str(n).strip()]
+    nicknames.append(npc.name.split(" ")[0])
+    return npc, list(dict.fromkeys(nicknames))
+
+
 def strip_markdown(text):
     for token in ["```json", "```"]:
         text = "".join(text.split(token))
@@ -8,6 +8,10 @@ from llmdm.utils import suppress_stdout
 
 logger = logging.getLogger(__name__)
 
+COLLECTIONS = ["npc", "location", "quest", "object"]
+# document fields that are given by the database they are in
+GENERATED_FIELDS = ("_id", "_rev")
+
 
 class GraphClient:
     def __init__(
@@ -39,7 +43,6 @@ class GraphClient:
 
     def setup_collections(self):
         """Set up the necessary collections and graph."""
-        COLLECTIONS = ["npc", "location", "quest", "object"]
         for collection_name in COLLECTIONS:
             if not self.db.has_collection(collection_name):
                 self.db.create_collection(collection_name)
@@ -71,6 +74,36 @@ class GraphClient:
         except DocumentInsertError:
             logger.exception("Error adding entity")
 
+    def add_entities(self, entities: list[dataclass]):
+        """Add entities with one request per collection."""
+        collections = {}
+        for entity in entities:
+            collections.setdefault(sanitize(type(entity).__name__), []).append(
+                {"name": entity.name, "_key": sanitize(entity.name)}
+            )
+        for collection, data in collections.items():
+            logger.debug(f"DatabaseWrapper.add_entities - {collection}: {data}")
+            for result in self.db.collection(collection).insert_many(data):
+                if isinstance(result, DocumentInsertError):
+                    logger.error(f"Error adding entity: {result}")
+
+    def export(self) -> dict[str, list[dict]]:
+        """Every entity and relation of the save, by collection."""
+        return {
+            collection: [
+                {k: v for k, v in document.items() if k not in GENERATED_FIELDS}
+                for document in self.db.collection(collection).all()
+            ]
+            for collection in COLLECTIONS + ["relation"]
+        }
+
+    def import_data(self, data: dict[str, list[dict]]):
+        """Load the output of export(), replacing documents with the same key."""
+        for collection, documents in data.items():
+            if documents:
+                self.db.collection(collection).insert_many(documents, overwrite=True)
+        logger.debug(f"Imported {sum(map(len, data.values()))} graph documents.")
+
     def add_relation(self, relation: dict):
         """Create a relation between two entities."""
         logger.debug(f"DatabaseWrapper.add_relation - {relation}")
@@ -2,11 +2,12 @@ import json
 from dataclasses import asdict, dataclass, field
 from typing import Optional
 
+from llmdm.data_types import Tracked
 from llmdm.npc import NPC
 
 
 @dataclass
-class Location:
+class Location(Tracked):
     name: str = "<name>"
     description: str = "<description>"
     npcs: list["NPC"] = field(default_factory=list)
@@ -14,6 +15,7 @@ class Location:
     sublocations: list[str] = field(default_factory=list)  # Names of sublocations
     location_type: str = "<Town, Forest, Dungeon, Cave, etc.>"
     attributes: str = "<comma separated list of keyword attributes>"
+    coordinates: Optional[tuple[float, float]] = None  # (x, y) position in the world
 
     def describe(self) -> str:
         description = ""
@@ -31,3 +33,15 @@ description: {self.description}
         self_dict = asdict(self)
         self_dict["npcs"] = [asdict(npc) for npc in self.npcs]
         print(json.dumps(self_dict, indent=2))
+
+
+@dataclass
+class Neighborhood:
+    """A location with the locations one move away from it."""
+
+    location: Location
+    parent: Optional[Location] = None
+    siblings: list[Location] = field(default_factory=list)
+    children: list[Location] = field(default_factory=list)
+    # other locations asked for by name, e.g. areas close by on the map
+    nearby: list[Location] = field(default_factory=list)
@@ -0,0 +1,232 @@
+import logging
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from rapidfuzz import fuzz, process, utils
+
+from llmdm.location import Location
+from llmdm.spatial_index import SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# minimum score (0-100) for a movement to be resolved without asking the LLM
+LOCAL_MATCH_THRESHOLD = 90
+# top level locations (towns, forests, ...) within this distance of each other are
+# "nearby", at most NEARBY_AREAS of them
+NEARBY_RADIUS = 25.0
+NEARBY_AREAS = 5
+
+
+@dataclass
+class LocationNode:
+    name: str
+    location_type: str = ""
+    parent_location: Optional[str] = None
+    sublocations: list[str] = field(default_factory=list)
+    nicknames: list[str] = field(default_factory=list)
+    coordinates: Optional[tuple[float, float]] = None
+
+
+class LocationGraph:
+    """
+    In-memory hierarchy of the locations of a save, used to resolve movement
+    without going to the database. GameData keeps it in sync with save_location.
+    """
+
+    def __init__(self):
+        self.nodes: dict[str, LocationNode] = {}
+        # parent name -> names of the locations with that parent_location
+        self.children: dict[str, dict[str, None]] = defaultdict(dict)
+        # (origin, destination) -> shortest route, cleared whenever a node changes
+        self.routes: dict[tuple[str, str], Optional[list[str]]] = {}
+        self.spatial = SpatialIndex(cell_size=2.0)
+
+    @classmethod
+    def from_db(cls, sql_db, noun_db) -> "LocationGraph":
+        graph = cls()
+        nicknames = noun_db.get_nicknames()
+        for (
+            name,
+            parent_location,
+            sublocations,
+            location_type,
+            coordinates,
+        ) in sql_db.get_location_hierarchy():
+            graph.add_node(
+                LocationNode(
+                    name=name,
+                    location_type=location_type,
+                    parent_location=parent_location,
+                    sublocations=sublocations,
+                    nicknames=nicknames.get(name, []),
+                    coordinates=coordinates,
+                )
+            )
+        logger.debug(f"LocationGraph loaded {len(graph.nodes)} locations.")
+        return graph
+
+    def add(self, location: Location, nicknames: list[str] = None):
+        """Add or update a location, keeping its known nicknames if none are given."""
+        if nicknames is None and location.name in self.nodes:
+            nicknames = self.nodes[location.name].nicknames
+        self.add_node(
+            LocationNode(
+                name=location.name,
+                location_type=location.location_type,
+                parent_location=location.parent_location,
+                sublocations=list(location.sublocations),
+                nicknames=list(nicknames or []),
+                coordinates=location.coordinates,
+            )
+        )
+
+    def add_node(self, node: LocationNode):
+        if previous := self.nodes.get(node.name):
+            self.children[previous.parent_location].pop(node.name, None)
+        self.nodes[node.name] = node
+        if node.parent_location:
+            self.children[node.parent_location][node.name] = None
+        if node.coordinates:
+            self.spatial.insert(node.name, *node.coordinates)
+        else:
+            self.spatial.remove(node.name)
+        self.routes.clear()
+
+    def get_children(self, name: str) -> list[str]:
+        node = self.nodes.get(name)
+        sublocations = node.sublocations if node else []
+        return [
+            child
+            for child in dict.fromkeys(sublocations + list(self.children[name]))
+            if child in self.nodes
+        ]
+
+    def get_siblings(self, name: str) -> list[str]:
+        node = self.nodes.get(name)
+        if not node or not node.parent_location:
+            return []
+        return [
+            sibling
+            for sibling in self.get_children(node.parent_location)
+            if sibling != name
+        ]
+
+    def nearby(
+        self,
+        name: str,
+        k: int = NEARBY_AREAS,
+        radius: float = None,
+        top_level: bool = False,
+    ) -> list[str]:
+        """
+        The k locations closest to `name` (optionally only those within radius, or
+        only those without a parent location), closest first.
+        """
+        node = self.nodes.get(name)
+        if not node or not node.coordinates:
+            return []
+
+        def where(other):
+            return other != name and not (
+                top_level and self.nodes[other].parent_location
+            )
+
+        if radius is None:
+            found = self.spatial.nearest(*node.coordinates, k, where=where)
+        else:
+            found = self.spatial.within(*node.coordinates, radius, where=where)[:k]
+        return [other for _, other in found]
+
+    def neighbors(self, name: str) -> dict[str, str]:
+        """Map of the locations reachable with one move from `name` to the move type."""
+        neighbors = {name: "local"}
+        node = self.nodes.get(name)
+        if node and node.parent_location in self.nodes:
+            neighbors[node.parent_location] = "parent"
+        for sibling in self.get_siblings(name):
+            neighbors.setdefault(sibling, "nearby")
+        if node and not node.parent_location:
+            for area in self.nearby(name, radius=NEARBY_RADIUS, top_level=True):
+                neighbors.setdefault(area, "nearby")
+        for child in self.get_children(name):
+            neighbors.setdefault(child, "child")
+        return neighbors
+
+    def find_route(self, origin: str, destination: str) -> Optional[list[str]]:
+        """
+        Shortest route, in moves, from origin to destination with both included.
+        None if the locations aren't connected.
+        """
+        if (origin, destination) not in self.routes:
+            self.routes[(origin, destination)] = self._bfs(origin, destination)
+        return self.routes[(origin, destination)]
+
+    def _bfs(self, origin: str, destination: str) -> Optional[list[str]]:
+        previous = {origin: None}
+        queue = deque([origin])
+        while queue:
+            name = queue.popleft()
+            if name == destination:
+                route = []
+                while name is not None:
+                    route.append(name)
+                    name = previous[name]
+                return route[::-1]
+            for next_name in self.neighbors(name):
+                if next_name not in previous:
+                    previous[next_name] = name
+                    queue.append(next_name)
+        return None
+
+    def resolve_movement(
+        self, player_input: str, current: str, threshold=LOCAL_MATCH_THRESHOLD
+    ) -> Optional[tuple[str, str]]:
+        """
+        Fuzzy match the player's movement command against the names and nicknames
+        of the locations around `current`, then of every known location. The
+        current location is not a candidate: "leave the tavern" names it too, so
+        moving within or out of it is left to the LLM.
+
+        Returns (move_type, destination name), where move_type is "route" for
+        destinations more than one move away, or None when no location matches
+        with at least `threshold` or the best match is ambiguous.
+        """
+        neighbors = self.neighbors(current)
+        neighbors.pop(current)
+        if destination := self.match_location(player_input, neighbors, threshold):
+            return neighbors[destination], destination
+        destination = self.match_location(
+            player_input, [name for name in self.nodes if name != current], threshold
+        )
+        if destination and self.find_route(current, destination):
+            return neighbors.get(destination, "route"), destination
+        return None
+
+    def match_location(
+        self, player_input: str, names, threshold=LOCAL_MATCH_THRESHOLD
+    ) -> Optional[str]:
+        """The one location among `names` best matching the player's input, if any."""
+        aliases = []
+        for name in names:
+            node = self.nodes.get(name, LocationNode(name=name))
+            for alias in [name] + node.nicknames:
+                if len(utils.default_process(alias)) >= 3:
+                    aliases.append((alias, name))
+        matches = process.extract(
+            player_input,
+            [alias for alias, _ in aliases],
+            scorer=fuzz.partial_ratio,
+            processor=utils.default_process,
+            score_cutoff=threshold,
+            limit=None,
+        )
+        scores = {}
+        for _, score, index in matches:
+            name = aliases[index][1]
+            scores[name] = max(score, scores.get(name, 0))
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        logger.debug(f"match_location: {player_input=}, {ranked=}")
+        if not ranked or (len(ranked) > 1 and ranked[0][1] == ranked[1][1]):
+            return None
+        return ranked[0][0]
@@ -0,0 +1,338 @@
+import logging
+import re
+from array import array
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+logger = logging.getLogger(__name__)
+
+# partitions with more choices than this only score a shortlist of them
+SHORTLIST_FROM = 2000
+# choices sharing the most trigrams with the query that are scored
+SHORTLIST_SIZE = 200
+
+
+def trigrams(normalized_name: str) -> set[str]:
+    """
+    The character trigrams of each word, padded so that the first and last
+    letters count. Per word, as token_sort_ratio doesn't mind the word order.
+    """
+    return {
+        padded[i : i + 3]
+        for word in normalized_name.split()
+        for padded in (f" {word} ",)
+        for i in range(len(padded) - 2)
+    }
+
+
+# spellings of the same sound, replaced in order by phonetic_key
+PHONETIC_SPELLINGS = [
+    (r"[^a-z]", ""),
+    (r"y", "i"),
+    (r"ie", "i"),
+    (r"ae", "e"),
+    (r"x", "ks"),
+    (r"ph", "f"),
+    (r"th", "0"),
+    (r"sch", "sk"),
+    (r"[cs]h", "x"),
+    (r"c(?=[eiy])", "s"),
+    (r"ck|[cq]", "k"),
+    (r"dg", "j"),
+    (r"gh", "g"),
+    (r"z", "s"),
+    (r"v", "f"),
+]
+# phonetic keys with fewer consonants than this sound like too many names
+PHONETIC_MIN_LENGTH = 3
+# a name sounding like the query and spelled at least PHONETIC_FLOOR close to
+# it scores PHONETIC_SCORE; the floor is SAME_NAME_SCORE of llmdm.game_data, so
+# sounding alike never makes a generated name be taken for a known one
+PHONETIC_FLOOR = 80
+PHONETIC_SCORE = 90
+
+
+def phonetic_key(normalized_name: str) -> str:
+    """
+    How a name sounds, a simplified Metaphone keeping the vowels: for each
+    word, its sounds with repeats merged. "Thorgrim" and "Thorgrimm", or
+    "Kieran" and "Kiran", have the same key, "Lorin" and "Laren" don't.
+    """
+    keys = []
+    for word in normalized_name.split():
+        for spelling, sound in PHONETIC_SPELLINGS:
+            word = re.sub(spelling, sound, word)
+        if not word:
+            continue
+        key = word[0] + re.sub(r"[hw]", "", word[1:])
+        keys.append(re.sub(r"(.)\1+", r"\1", key))
+    return " ".join(sorted(keys))
+
+
+def sounding_score(score: float) -> float:
+    """The score of a name sounding like the query, spelled `score` close."""
+    return max(score, PHONETIC_SCORE) if score >= PHONETIC_FLOOR else score
+
+
+def partition_keys(kind: Optional[str], within: Optional[str]) -> set[tuple]:
+    """The (kind, within) partitions holding a name, None standing for any."""
+    return {(None, None), (kind, None), (None, within), (kind, within)}
+
+
+class NamePartition:
+    """
+    The normalized names and nicknames of a partition of the index, with an
+    inverted index of their trigrams to shortlist the ones worth scoring and
+    one of their phonetic keys.
+    """
+
+    def __init__(self):
+        # normalized name or nickname -> ids of the names it refers to
+        self.name_ids: dict[str, list[int]] = {}
+        # the keys of name_ids, as the list rapidfuzz scores; removed ones are
+        # None so that the positions in the postings stay valid
+        self.choices: list[Optional[str]] = []
+        self.positions: dict[str, int] = {}
+        # trigram -> positions of the choices having it, built once the
+        # partition is large enough to need shortlists
+        self.postings: Optional[dict[str, array]] = None
+        # phonetic key -> the choices having it
+        self.sounds: dict[str, list[str]] = defaultdict(list)
+        self.phonetic_keys: dict[str, str] = {}
+
+    def add(self, name_id: int, normalized_name: str, phonetic_key: str):
+        ids = self.name_ids.get(normalized_name)
+        if ids is None:
+            ids = self.name_ids[normalized_name] = []
+            self.positions[normalized_name] = len(self.choices)
+            self.sounds[phonetic_key].append(normalized_name)
+            self.phonetic_keys[normalized_name] = phonetic_key
+            if self.postings is not None:
+                self.index_trigrams(len(self.choices), normalized_name)
+            self.choices.append(normalized_name)
+        if name_id not in ids:
+            ids.append(name_id)
+
+    def index_trigrams(self, position: int, normalized_name: str):
+        for trigram in trigrams(normalized_name):
+            if trigram not in self.postings:
+                self.postings[trigram] = array("q")
+            self.postings[trigram].append(position)
+
+    def remove(self, name_id: int, normalized_name: str):
+        self.name_ids[normalized_name].remove(name_id)
+        if not self.name_ids[normalized_name]:
+            del self.name_ids[normalized_name]
+            self.choices[self.positions.pop(normalized_name)] = None
+            key = self.phonetic_keys.pop(normalized_name)
+            self.sounds[key].remove(normalized_name)
+
+    def sounds_like(self, normalized_query: str) -> list[str]:
+        """
+        The choices with the phonetic key of the query, scored alongside the
+        shortlist and preferred among equal scores.
+        """
+        key = phonetic_key(normalized_query)
+        if len(re.sub(r"[aeiou ]", "", key)) < PHONETIC_MIN_LENGTH:
+            return []
+        return self.sounds.get(key, [])
+
+    def shortlist(self, normalized_query: str) -> list[Optional[str]]:
+        """
+        The choices worth scoring against the query: all of them in a small
+        partition, else the SHORTLIST_SIZE sharing the most trigrams with it.
+        """
+        if len(self.choices) <= SHORTLIST_FROM:
+            return self.choices
+        if self.postings is None:
+            self.postings = {}
+            for position, choice in enumerate(self.choices):
+                if choice is not None:
+                    self.index_trigrams(position, choice)
+        postings = [
+            np.frombuffer(self.postings[trigram], dtype=np.int64)
+            for trigram in trigrams(normalized_query)
+            if trigram in self.postings
+        ]
+        if not postings:
+            return []
+        counts = np.bincount(np.concatenate(postings), minlength=len(self.choices))
+        best = np.argpartition(counts, -SHORTLIST_SIZE)[-SHORTLIST_SIZE:]
+        return [self.choices[i] for i in best[counts[best] > 0]]
+
+
+class NameIndex:
+    """
+    In-memory index of the proper nouns of a save: the canonical name of each
+    id, and its normalized name and nicknames in partitions by kind of entity
+    (npc, location) and by the location it is within, so that a lookup only
+    scores the names it could be looking for. Lookups score the query against
+    the choices of a partition with rapidfuzz, without touching the database.
+    """
+
+    def __init__(self):
+        self.canonical_names: dict[int, str] = {}
+        # canonical name -> its ids
+        self.ids: dict[str, list[int]] = defaultdict(list)
+        # id -> (kind, within) of the name
+        self.scopes: dict[int, tuple] = {}
+        # id -> its normalized name and nicknames
+        self.nicknames: dict[int, list[str]] = defaultdict(list)
+        self.partitions: dict[tuple, NamePartition] = defaultdict(NamePartition)
+        self.next_id = 1
+
+    def add_name(
+        self,
+        name_id: int,
+        name: str,
+        normalized_name: str,
+        kind: Optional[str] = None,
+        within: Optional[str] = None,
+    ):
+        self.canonical_names[name_id] = name
+        self.ids[name].append(name_id)
+        self.scopes[name_id] = (kind, within)
+        self.next_id = max(self.next_id, name_id + 1)
+        self.add_nickname(name_id, normalized_name)
+
+    def add_nickname(self, name_id: int, normalized_nickname: str):
+        if normalized_nickname in self.nicknames[name_id]:
+            return
+        self.nicknames[name_id].append(normalized_nickname)
+        sound = phonetic_key(normalized_nickname)
+        for key in partition_keys(*self.scopes.get(name_id, (None, None))):
+            self.partitions[key].add(name_id, normalized_nickname, sound)
+
+    def set_within(self, name_id: int, within: Optional[str]):
+        """Move a name to the partitions of another location."""
+        kind, previous = self.scopes[name_id]
+        removed = partition_keys(kind, previous) - partition_keys(kind, within)
+        added = partition_keys(kind, within) - partition_keys(kind, previous)
+        for normalized_nickname in self.nicknames[name_id]:
+            for key in removed:
+                self.partitions[key].remove(name_id, normalized_nickname)
+            for key in added:
+                self.partitions[key].add(
+                    name_id, normalized_nickname, phonetic_key(normalized_nickname)
+                )
+        self.scopes[name_id] = (kind, within)
+
+    def names_of(self, partition: NamePartition, normalized_name: str) -> list[str]:
+        """The canonical names a normalized name or nickname refers to."""
+        return list(
+            dict.fromkeys(
+                self.canonical_names[name_id]
+                for name_id in partition.name_ids.get(normalized_name, ())
+                if name_id in self.canonical_names
+            )
+        )
+
+    def fuzzy_lookup(
+        self,
+        normalized_query: str,
+        threshold=10,
+        limit=10,
+        kind: Optional[str] = None,
+        within: Optional[str] = None,
+    ) -> list[tuple[str, float]]:
+        """
+        (canonical name, score) of the best matches, best first, the names
+        sounding like the query first among equal scores and raised to
+        sounding_score(). A query that is a name or nickname only matches the
+        names it refers to, without scoring.
+        """
+        if (kind, within) not in self.partitions:
+            return []
+        partition = self.partitions[kind, within]
+        if exact := self.names_of(partition, normalized_query):
+            return [(name, 100.0) for name in exact[:limit]]
+        sounds = set(partition.sounds_like(normalized_query))
+        matches = [
+            (choice, sounding_score(score) if choice in sounds else score)
+            for choice, score, _ in process.extract(
+                normalized_query,
+                list(dict.fromkeys([*partition.shortlist(normalized_query), *sounds])),
+                scorer=fuzz.token_sort_ratio,
+                score_cutoff=min(threshold, PHONETIC_FLOOR),
+                limit=None,
+            )
+        ]
+        matches = [match for match in matches if match[1] >= threshold]
+        matches.sort(key=lambda match: (-match[1], match[0] not in sounds))
+        logger.debug(f"fuzzy_lookup: {matches[:limit]=}")
+        results = {}
+        for choice, score in matches:
+            for name in self.names_of(partition, choice):
+                results.setdefault(name, score)
+            if len(results) >= limit:
+                break
+        return list(results.items())[:limit]
+
+    def fuzzy_lookup_many(
+        self,
+        normalized_queries: list[str],
+        threshold=10,
+        kind: Optional[str] = None,
+        within: Optional[str] = None,
+    ) -> list[tuple[Optional[str], float]]:
+        """
+        (canonical name, score) of the best match of each query, scored in one
+        pass over all the choices with every CPU; (None, 0) when none reaches
+        the threshold. Queries that are a name or nickname are not scored, and
+        the names sounding like a query score sounding_score() and win its ties.
+        """
+        results = [(None, 0.0)] * len(normalized_queries)
+        partition = self.partitions.get((kind, within))
+        if partition is None or not partition.choices:
+            return results
+        queries = {}
+        for i, query in enumerate(normalized_queries):
+            if exact := self.names_of(partition, query):
+                results[i] = (exact[0], 100.0)
+            else:
+                queries[i] = query
+        if not queries:
+            return results
+        if len(partition.choices) <= SHORTLIST_FROM:
+            choices = partition.choices
+        else:
+            # the shortlists of all the queries, scored together
+            choices = list(
+                dict.fromkeys(
+                    choice
+                    for query in queries.values()
+                    for choice in [
+                        *partition.shortlist(query),
+                        *partition.sounds_like(query),
+                    ]
+                    if choice is not None
+                )
+            )
+            if not choices:
+                return results
+        scores = process.cdist(
+            list(queries.values()),
+            choices,
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=min(threshold, PHONETIC_FLOOR),
+            workers=-1,
+        )
+        positions = None
+        for (i, query), query_scores in zip(queries.items(), scores):
+            sounds = set(partition.sounds_like(query))
+            if sounds:
+                if positions is None:
+                    positions = {choice: j for j, choice in enumerate(choices)}
+                for choice in sounds:
+                    if (j := positions.get(choice)) is not None:
+                        query_scores[j] = sounding_score(query_scores[j])
+            query_scores[query_scores < threshold] = 0
+            tied = np.flatnonzero(query_scores == query_scores.max())
+            best = next((j for j in tied if choices[j] in sounds), tied[0])
+            names = query_scores[best] and self.names_of(partition, choices[best])
+            if names:
+                results[i] = (names[0], float(query_scores[best]))
+        return results
@@ -2,50 +2,62 @@ import logging
 import os
 import re
 import sqlite3
+from typing import Optional
 
-from rapidfuzz import fuzz, process
-
+from llmdm.name_index import NameIndex
+from llmdm.save_db import SaveConnection, SaveDB, save_path
+from llmdm.sql_client import CLASSIFY_NAMES
 from llmdm.utils import SAVE_DIR
 
 logger = logging.getLogger(__name__)
 
+# longest run of words of a sentence looked up as a name by mentions()
+MAX_MENTION_WORDS = 4
 
-class ProperNounDB:
-    def __init__(self, save_name):
-        """Initialize the database connection and create tables."""
-        if not os.path.exists(SAVE_DIR):
-            os.mkdir(SAVE_DIR)
-        self.conn = sqlite3.connect(
-            os.path.join(SAVE_DIR, f"{save_name}_proper_nouns.sql")
-        )
-        self.create_tables()
 
-    def create_tables(self):
-        """Create the names and nicknames tables if they don't exist."""
-        cursor = self.conn.cursor()
-        # Create the names table
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS names (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                normalized_name TEXT NOT NULL
-            )
+class ProperNounDB(SaveDB):
+    def __init__(self, save_name, conn: SaveConnection):
         """
-        )
-        # Create the nicknames table
+        Use the connection `conn` of the SQLClient of the save, which creates
+        and migrates the names tables with the rest of the save database.
+        """
+        self.save_name = save_name
+        self.path = save_path(save_name)
+        self.attach(conn)
+        # loaded on the first lookup, then kept up to date by add_many()
+        self._index = None
+        self.import_legacy()
+
+    def classify(self):
+        """Fill in the kind and within of the names that are NPCs or locations."""
+        for statement in CLASSIFY_NAMES:
+            self.conn.execute(statement)
+
+    def reopen(self, conn: sqlite3.Connection) -> "ProperNounDB":
+        return ProperNounDB(self.save_name, conn=conn)
+
+    def import_legacy(self):
+        """Copy the names of saves made when they had a database of their own."""
+        legacy_file = os.path.join(SAVE_DIR, f"{self.save_name}_proper_nouns.sql")
+        if not os.path.exists(legacy_file):
+            return
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM names LIMIT 1")
+        if cursor.fetchone():
+            return
+        self.conn.commit()
+        cursor.execute("ATTACH DATABASE ? AS legacy", (legacy_file,))
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS nicknames (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name_id INTEGER NOT NULL,
-                nickname TEXT NOT NULL,
-                normalized_nickname TEXT NOT NULL,
-                FOREIGN KEY(name_id) REFERENCES names(id)
-            )
+            INSERT INTO names (id, name, normalized_name)
+            SELECT id, name, normalized_name FROM legacy.names
         """
         )
+        cursor.execute("INSERT INTO nicknames SELECT * FROM legacy.nicknames")
+        self.classify()
         self.conn.commit()
+        cursor.execute("DETACH DATABASE legacy")
+        logger.info(f"Imported {legacy_file} into the save database.")
 
     def normalize_name(self, name):
         """
@@ -57,43 +69,100 @@ class ProperNounDB:
         name = re.sub(r"\s+", " ", name).strip()
         return name
 
-    def add(self, name, nicknames=[]):
-        """Add a name and their nicknames to the database."""
-        logger.debug(f"name: {name}, nicknames: {nicknames}")
-        if name not in nicknames:
-            nicknames.append(name)
+    def add(self, name, nicknames=[], kind: str = None, within: str = None):
+        """
+        Add a name and their nicknames to the database. `kind` is the kind of
+        entity named ("npc" or "location") and `within` the location it is in.
+        """
+        self.add_many([(name, nicknames)], kind, within)
 
-        normalized_name = self.normalize_name(name)
+    def add_many(
+        self,
+        entries: list[tuple[str, list[str]]],
+        kind: str = None,
+        within: str = None,
+    ):
+        """
+        Add (name, nicknames) entries of the same kind and location to the index,
+        and to the database with one statement per table in one transaction.
+        """
+        logger.debug(f"add_many: {entries}")
+        # ids are assigned here so the nicknames can reference them
+        first_id = self.index.next_id
+        names = [
+            (name_id, name, self.normalize_name(name), kind, within)
+            for name_id, (name, _) in enumerate(entries, start=first_id)
+        ]
+        nicknames = [
+            (name_id, nickname, self.normalize_name(nickname))
+            for name_id, (name, nicknames) in enumerate(entries, start=first_id)
+            for nickname in (nicknames if name in nicknames else [*nicknames, name])
+        ]
+        for row in names:
+            self.index.add_name(*row)
+        for name_id, _, normalized_nickname in nicknames:
+            self.index.add_nickname(name_id, normalized_nickname)
+        self.defer(("names", object()), ProperNounDB.insert, names, nicknames)
+
+    def insert(self, names: list[tuple], nicknames: list[tuple]):
+        """Write the rows of names and nicknames made by add_many()."""
         cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO names (name, normalized_name)
-            VALUES (?, ?)
-        """,
-            (
-                name,
-                normalized_name,
-            ),
-        )
-        name_id = cursor.lastrowid
-        # Insert the nicknames
-        for nickname in nicknames:
-            normalized_nickname = self.normalize_name(nickname)
-            cursor.execute(
+        with self.transaction():
+            cursor.executemany(
+                """
+                INSERT INTO names (id, name, normalized_name, kind, within)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                names,
+            )
+            cursor.executemany(
                 """
                     INSERT INTO nicknames (name_id, nickname, normalized_nickname)
                     VALUES (?, ?, ?)
                 """,
-                (
-                    name_id,
-                    nickname,
-                    normalized_nickname,
-                ),
+                nicknames,
             )
-        self.conn.commit()
+
+    def set_within(self, locations: dict[str, str]):
+        """Record the location each name of `locations` is now within."""
+        rows = [
+            (within, name_id)
+            for name, within in locations.items()
+            for name_id in self.index.ids.get(name, [])
+        ]
+        for within, name_id in rows:
+            self.index.set_within(name_id, within)
+        self.defer(("names", object()), ProperNounDB.update_within, rows)
+
+    def update_within(self, rows: list[tuple]):
+        """Write the (within, id) rows made by set_within()."""
+        self.conn.executemany("UPDATE names SET within = ? WHERE id = ?", rows)
+        self.commit()
+
+    @property
+    def index(self) -> NameIndex:
+        if self._index is None:
+            self._index = NameIndex()
+            self.wait_for_writes(("names",))
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id, name, normalized_name, kind, within FROM names")
+            for row in cursor.fetchall():
+                self._index.add_name(*row)
+            cursor.execute("SELECT name_id, normalized_nickname FROM nicknames")
+            for name_id, normalized_nickname in cursor.fetchall():
+                self._index.add_nickname(name_id, normalized_nickname)
+            logger.debug(
+                f"Name index of {len(self._index.canonical_names)} names loaded."
+            )
+        return self._index
+
+    def rolled_back(self):
+        # drop the names added by the transaction, reloaded on the next lookup
+        self._index = None
 
     def get_all_names(self):
         """Retrieve all names (canonical and nicknames) with their name_id."""
+        self.wait_for_writes(("names",))
         cursor = self.conn.cursor()
         # Get all canonical names
         cursor.execute(
@@ -114,8 +183,24 @@ class ProperNounDB:
         all_names.extend(nicknames)
         return all_names
 
+    def get_nicknames(self):
+        """Map of every canonical name to its nicknames."""
+        self.wait_for_writes(("names",))
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT names.name, nicknames.nickname
+            FROM nicknames JOIN names ON names.id = nicknames.name_id
+            """
+        )
+        nicknames = {}
+        for name, nickname in cursor.fetchall():
+            nicknames.setdefault(name, []).append(nickname)
+        return nicknames
+
     def get_canonical_name(self, name_id):
         """Retrieve the canonical name for a given name_id."""
+        self.wait_for_writes(("names",))
         cursor = self.conn.cursor()
         cursor.execute(
             """
@@ -126,50 +211,72 @@ class ProperNounDB:
         result = cursor.fetchone()
         return result[0] if result else None
 
-    def fuzzy_lookup(self, query, threshold=10, limit=10):
+    def candidates(
+        self, query, threshold=10, limit=10, kind: str = None, within: str = None
+    ) -> list[tuple[str, float]]:
         """
-        Perform a fuzzy lookup for a given query.
+        (canonical name, score) of the names matching a query, best first. A
+        query that is exactly a name or nickname only matches the names it
+        refers to, with a score of 100.
 
         Parameters:
         - query (str): The name to search for.
         - threshold (int): Minimum score for matches (0-100).
         - limit (int): Maximum number of results to return.
+        - kind (str): Only match names of this kind ("npc" or "location").
+        - within (str): Only match names within this location.
         """
         normalized_query = self.normalize_name(query)
-        all_names = self.get_all_names()  # List of tuples: (name_id, normalized_name)
-        names_list = [name for _, name in all_names]
-        matches = process.extract(
-            normalized_query,
-            names_list,
-            scorer=fuzz.token_sort_ratio,
-            score_cutoff=threshold,
-            limit=limit,
+        results = self.index.fuzzy_lookup(
+            normalized_query, threshold, limit, kind, within
         )
-        results = []
-        logger.debug(f"fuzzy_lookup: {matches=}")
-        for match in matches:
-            matched_name = match[0]
-            score = match[1]
-            # Find the name_id(s) corresponding to the matched name
-            matched_name_ids = [
-                name_id for name_id, name in all_names if name == matched_name
-            ]
-            for name_id in matched_name_ids:
-                canonical_name = self.get_canonical_name(name_id)
-                if canonical_name:
-                    results.append({"name": canonical_name, "score": score})
-        # Remove duplicates
-        unique_results = []
-        seen = set()
-        logger.debug(f"fuzzy_lookup: {results=}")
-        for result in results:
-            if result["name"] not in seen:
-                unique_results.append(result)
-                seen.add(result["name"])
-        if not unique_results:
-            logger.debug(f"fuzzy_lookup:\n{normalized_query=}\n{all_names=}")
-
-        return unique_results[0]["name"]
+        if not results:
+            logger.debug(f"candidates: no match for {normalized_query=}")
+        return results
+
+    def fuzzy_lookup(
+        self, query, threshold=10, limit=10, kind: str = None, within: str = None
+    ):
+        """The best match of candidates(), IndexError if there is none."""
+        return self.candidates(query, threshold, limit, kind, within)[0][0]
+
+    def fuzzy_lookup_many(
+        self, queries: list[str], threshold=10, kind: str = None, within: str = None
+    ) -> list[tuple[Optional[str], float]]:
+        """
+        (canonical name, score) of the best match of each query, in the same
+        order, or (None, 0) for the queries matching nothing above `threshold`.
+        """
+        return self.index.fuzzy_lookup_many(
+            [self.normalize_name(query) for query in queries], threshold, kind, within
+        )
+
+    def mentions(
+        self, text: str, threshold=10, kind: str = None, within: str = None
+    ) -> list[tuple[str, float]]:
+        """
+        (canonical name, score) of the names mentioned in a sentence, best
+        first. Runs of up to MAX_MENTION_WORDS words are looked up longest
+        first, skipping the words of runs that already matched, so "talk to
+        mira thornfeld" matches Mira Thornfield rather than every Mira.
+        """
+        words = self.normalize_name(text).split()
+        matched = [False] * len(words)
+        results = {}
+        for length in range(min(MAX_MENTION_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                if any(matched[start : start + length]):
+                    continue
+                span = " ".join(words[start : start + length])
+                found = self.index.fuzzy_lookup(
+                    span, threshold, kind=kind, within=within
+                )
+                for name, score in found:
+                    results[name] = max(score, results.get(name, 0))
+                if found:
+                    matched[start : start + length] = [True] * length
+        logger.debug(f"mentions: {results=}")
+        return sorted(results.items(), key=lambda result: -result[1])
 
     def close(self):
         """Close the database connection."""
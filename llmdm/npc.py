@@ -1,9 +1,11 @@
 import json
 from dataclasses import asdict, dataclass
 
+from llmdm.data_types import Tracked
+
 
 @dataclass
-class NPC:
+class NPC(Tracked):
     name: str = "<npc's name>"
     description: str = "<description>"
     location_name: str = "Location they are found"
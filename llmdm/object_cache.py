@@ -0,0 +1,373 @@
+import logging
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Optional
+
+from llmdm.data_types import Tracked
+from llmdm.location import Location, Neighborhood
+from llmdm.npc import NPC
+from llmdm.quest import Quest
+from llmdm.sql_client import (
+    LOCATION_COLUMNS,
+    NPC_COLUMNS,
+    SUMMARY_COLUMNS,
+    SQLClient,
+    location_row,
+    npc_row,
+    projection,
+)
+
+logger = logging.getLogger(__name__)
+
+# locations, NPCs and quests kept in memory before the least recently used are dropped
+MAX_CACHED_OBJECTS = 1000
+
+
+class CachedSQLClient(SQLClient):
+    """
+    SQLClient with an identity map in front of the locations, NPCs and quests.
+
+    Reading the same name twice returns the same object without going to the
+    database. Saves are written through immediately. Objects whose fields are
+    assigned without being saved are marked as changed when that happens, and
+    are written by flush(), before any query that reads more than one row, and
+    when they are evicted. Changing a list in place (e.g. the NPCs of a
+    location) isn't seen, save the object instead.
+    """
+
+    def __init__(self, db_name, max_size: int = MAX_CACHED_OBJECTS):
+        self.max_size = max_size
+        # (kind, name) -> object, least recently used first
+        self.objects: OrderedDict[tuple[str, str], object] = OrderedDict()
+        # keys of the objects changed since they were loaded or saved
+        self.changed: dict[tuple[str, str], None] = {}
+        super().__init__(db_name)
+
+    def watch(self, key: tuple[str, str], obj: Tracked):
+        obj.watch(self, key)
+
+    def assigned(self, key: tuple[str, str]):
+        """Called by the objects of the identity map when a field is assigned."""
+        self.changed.setdefault(key)
+
+    def forget(self, key: tuple[str, str]):
+        """Drop an object from the identity map, returning it."""
+        obj = self.objects.pop(key)
+        obj.unwatch(self)
+        return obj
+
+    def remember(self, kind: str, obj, pending: dict = None):
+        """
+        Add a loaded object to the identity map, returning the instance already
+        there if any. A write of the object that isn't committed yet is newer
+        than what was loaded, and is used instead; pass pending_writes() when
+        remembering many objects.
+        """
+        key = (kind, obj.name)
+        if key in self.objects:
+            self.objects.move_to_end(key)
+            return self.objects[key]
+        if pending is None:
+            pending = self.pending_writes()
+        if key in pending:
+            obj = deepcopy(pending[key][0])
+        if kind == "location":
+            obj.npcs = [self.remember("npc", npc, pending) for npc in obj.npcs]
+        self.objects[key] = obj
+        self.watch(key, obj)
+        self.evict()
+        return obj
+
+    def lookup(self, kind: str, name: str):
+        key = (kind, name)
+        if key in self.objects:
+            self.objects.move_to_end(key)
+            return self.objects[key]
+        return None
+
+    def peek(self, kind: str, name: str):
+        """
+        The object from the identity map or from a write not committed yet,
+        without going to the database. None if it is in neither.
+        """
+        if (obj := self.lookup(kind, name)) is not None:
+            return obj
+        pending = self.pending_writes()
+        if (kind, name) in pending:
+            return self.remember(kind, pending[(kind, name)][0], pending)
+        return None
+
+    def pending_objects(self, kind: str, pending: dict) -> list:
+        """The objects of a kind whose writes aren't committed yet."""
+        return [
+            self.remember(kind, args[0], pending)
+            for key, args in pending.items()
+            if key[0] == kind
+        ]
+
+    def saved(self, kind: str, obj):
+        """Make a just written object the one returned for its name."""
+        key = (kind, obj.name)
+        if key in self.objects:
+            self.forget(key)
+        self.objects[key] = obj
+        self.watch(key, obj)
+        self.changed.pop(key, None)
+        self.evict()
+
+    def evict(self):
+        while len(self.objects) > self.max_size:
+            key = next(iter(self.objects))
+            obj = self.forget(key)
+            if key in self.changed:
+                del self.changed[key]
+                self.write(key[0], obj)
+
+    def write(self, kind: str, obj):
+        # straight to the database, the object is already in the right state here
+        save = {
+            "location": lambda db, obj: SQLClient.save_locations(db, [obj]),
+            "npc": lambda db, obj: SQLClient.save_npcs(db, [obj]),
+            "quest": SQLClient.save_quest,
+        }[kind]
+        # written later when there is a write-behind thread, so copy it as it is now
+        self.defer((kind, obj.name), save, deepcopy(obj) if self.write_behind else obj)
+
+    def dirty(self) -> list[tuple[str, object]]:
+        return [(kind, self.objects[(kind, name)]) for kind, name in self.changed]
+
+    def flush(self) -> int:
+        """Write the objects changed in place since they were loaded or saved."""
+        dirty = self.dirty()
+        for kind, obj in dirty:
+            self.write(kind, obj)
+        self.changed.clear()
+        if dirty:
+            logger.debug(f"Flushed {len(dirty)} changed objects to the database.")
+        return len(dirty)
+
+    def clear(self):
+        """Flush, then forget every cached object."""
+        self.flush()
+        self.forget_all()
+
+    def forget_all(self):
+        for key in list(self.objects):
+            self.forget(key)
+        self.changed.clear()
+
+    def rolled_back(self):
+        # the cache may hold writes that were just undone
+        self.forget_all()
+
+    def save_locations(self, locations: list[Location]):
+        for location in locations:
+            self.saved("location", location)
+        if self.write_behind is None:
+            super().save_locations(locations)
+        else:
+            for location in locations:
+                self.write("location", location)
+
+    def get_location(self, name: str) -> Optional[Location]:
+        if (location := self.peek("location", name)) is not None:
+            return location
+        locations = self.select_locations("WHERE locations.name = ?", (name,))
+        return locations[0] if locations else None
+
+    def select_locations(self, where: str = "", params=()) -> list[Location]:
+        pending = self.pending_writes()
+        return [
+            self.remember("location", location, pending)
+            for location in super().select_locations(where, params)
+        ]
+
+    def with_pending(self, kind: str, objects: list) -> list:
+        """Loaded objects, and the ones of the same kind not committed yet."""
+        pending = self.pending_writes()
+        merged = {obj.name: obj for obj in objects}
+        for obj in self.pending_objects(kind, pending):
+            merged[obj.name] = obj
+        return list(merged.values())
+
+    def get_all_locations(self) -> list[Location]:
+        self.flush()
+        return sorted(
+            self.with_pending("location", self.select_locations()),
+            key=lambda location: location.name,
+        )
+
+    def get_neighborhood(
+        self, name: str, nearby: list[str] = ()
+    ) -> Optional[Neighborhood]:
+        self.flush()
+        return self.build_neighborhood(name, nearby)
+
+    def neighborhood_candidates(
+        self, location: Location, nearby: list[str]
+    ) -> list[Location]:
+        # the pending writes may add locations to the neighborhood, or move
+        # loaded ones out of it
+        parent_name = location.parent_location
+        parent = parent_name and self.get_location(parent_name)
+        names = {*location.sublocations, *nearby}
+        if parent:
+            names.update([parent.name, *parent.sublocations])
+        return [
+            other
+            for other in self.with_pending(
+                "location", super().neighborhood_candidates(location, nearby)
+            )
+            if other.name != location.name
+            and (
+                other.name in names
+                or other.parent_location == location.name
+                or (parent_name and other.parent_location == parent_name)
+            )
+        ]
+
+    def get_location_summaries(
+        self, names: list[str], columns: tuple[str, ...] = SUMMARY_COLUMNS
+    ) -> list[tuple]:
+        known = {name: self.peek("location", name) for name in names}
+        missing = [name for name, location in known.items() if location is None]
+        loaded = {
+            summary.name: summary._asdict()
+            for summary in (
+                self.select_location_summaries(
+                    missing, tuple(dict.fromkeys(("name", *columns)))
+                )
+                if missing
+                else []
+            )
+        }
+        Projection = projection("locations", tuple(columns))
+        summaries = []
+        for name in names:
+            if known[name] is not None:
+                row = dict(zip(LOCATION_COLUMNS, location_row(known[name])))
+            elif name in loaded:
+                row = loaded[name]
+            else:
+                continue
+            summaries.append(Projection(*(row[column] for column in columns)))
+        return summaries
+
+    def get_npc_summaries(
+        self, location_name: str, columns: tuple[str, ...] = SUMMARY_COLUMNS
+    ) -> list[tuple]:
+        if (location := self.peek("location", location_name)) is not None:
+            names = [npc.name for npc in location.npcs]
+        else:
+            names = [
+                summary.name
+                for summary in self.select_npc_summaries(location_name, ("name",))
+            ]
+        Projection = projection("npcs", tuple(columns))
+        summaries = []
+        for npc in filter(None, map(self.get_npc, names)):
+            row = dict(zip(NPC_COLUMNS, npc_row(npc)))
+            summaries.append(Projection(*(row[column] for column in columns)))
+        return summaries
+
+    def search(self, *args, **kwargs) -> list[tuple]:
+        self.flush()
+        return super().search(*args, **kwargs)
+
+    def get_location_hierarchy(self) -> list[tuple]:
+        self.flush()
+        hierarchy = {row[0]: row for row in self.select_location_hierarchy()}
+        for location in self.pending_objects("location", self.pending_writes()):
+            hierarchy[location.name] = (
+                location.name,
+                location.parent_location,
+                list(location.sublocations),
+                location.location_type,
+                location.coordinates,
+            )
+        return list(hierarchy.values())
+
+    def save_npcs(self, npcs: list[NPC]):
+        for npc in npcs:
+            self.saved("npc", npc)
+        if self.write_behind is None:
+            super().save_npcs(npcs)
+        else:
+            for npc in npcs:
+                self.write("npc", npc)
+
+    def get_npc(self, name: str) -> Optional[NPC]:
+        if (npc := self.peek("npc", name)) is not None:
+            return npc
+        # not waiting, there is no pending write of it
+        if (npc := super().get_npc(name)) is not None:
+            return self.remember("npc", npc)
+        return None
+
+    def npc_name_used(self, name: str) -> bool:
+        return self.peek("npc", name) is not None or super().npc_name_used(name)
+
+    def get_all_npcs(self) -> list[NPC]:
+        self.flush()
+        pending = self.pending_writes()
+        return self.with_pending(
+            "npc", [self.remember("npc", npc, pending) for npc in self.select_npcs()]
+        )
+
+    def save_quest(self, quest: Quest):
+        self.saved("quest", quest)
+        self.write("quest", quest)
+
+    def get_quest(self, name: str) -> Optional[Quest]:
+        if (quest := self.peek("quest", name)) is not None:
+            return quest
+        if (quest := super().get_quest(name)) is not None:
+            return self.remember("quest", quest)
+        return None
+
+    def save_scene_description(
+        self, location_name: str, scene_key: str, description: str
+    ):
+        self.defer(
+            ("scene", location_name),
+            SQLClient.save_scene_description,
+            location_name,
+            scene_key,
+            description,
+        )
+
+    def get_scene_description(self, location_name: str, scene_key: str):
+        pending = self.pending_writes().get(("scene", location_name))
+        if pending is not None:
+            _, pending_key, description = pending
+            return description if pending_key == scene_key else None
+        return super().get_scene_description(location_name, scene_key)
+
+    def save_travel_narration(self, origin, destination, move_type, *args):
+        # every narration is a new variant, they are never coalesced
+        self.defer(
+            ("travel", origin, destination, move_type, object()),
+            SQLClient.save_travel_narration,
+            origin,
+            destination,
+            move_type,
+            *args,
+        )
+
+    def use_travel_narration(self, *route_variant):
+        self.defer(
+            ("travel", *route_variant), SQLClient.use_travel_narration, *route_variant
+        )
+
+    def save_game(self, save_data: dict):
+        self.defer(("save_game",), SQLClient.save_game, save_data)
+
+    def save_checkpoint(self, step: str, data):
+        self.defer(("checkpoint", step), SQLClient.save_checkpoint, step, data)
+
+    def clear_checkpoints(self):
+        self.defer(("clear_checkpoints",), SQLClient.clear_checkpoints)
+
+    def close(self):
+        self.clear()
+        super().close()
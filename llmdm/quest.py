@@ -1,8 +1,10 @@
 from dataclasses import dataclass, field
 
+from llmdm.data_types import Tracked
+
 
 @dataclass
-class Quest:
+class Quest(Tracked):
     name: str = "Title of the quest"
     description: str = "Detailed description of the quest"
     objective: str = "Objective of the quest"
@@ -0,0 +1,183 @@
+import logging
+import os
+import sqlite3
+import weakref
+from contextlib import contextmanager
+from typing import Optional
+
+from llmdm.utils import SAVE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+# pages copied per step of an online backup, the save stays usable between steps
+BACKUP_PAGES = 1024
+
+
+def save_path(save_name: str) -> str:
+    """The single file holding everything of a save."""
+    return os.path.join(SAVE_DIR, f"{save_name}.sql")
+
+
+def list_saves() -> list[str]:
+    """
+    Names of the saves that can be loaded. A save whose world generation stopped
+    partway has no game state yet; starting a new game with its name resumes it.
+    """
+    saves = []
+    for file_name in sorted(os.listdir(SAVE_DIR)):
+        save_name, ext = os.path.splitext(file_name)
+        # older saves also have a proper nouns database
+        if ext != ".sql" or save_name.endswith("_proper_nouns"):
+            continue
+        # saves made before the game state was stored in the database
+        if os.path.exists(os.path.join(SAVE_DIR, f"{save_name}.json")):
+            saves.append(save_name)
+            continue
+        conn = sqlite3.connect(f"file:{save_path(save_name)}?mode=ro", uri=True)
+        try:
+            if conn.execute("SELECT 1 FROM save_data LIMIT 1").fetchone():
+                saves.append(save_name)
+        except sqlite3.OperationalError:
+            # not even the tables were created
+            pass
+        finally:
+            conn.close()
+    return saves
+
+
+class SaveConnection(sqlite3.Connection):
+    """
+    Connection to a save database. The clients sharing it share its
+    transactions, so the state of the current transaction is kept here.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transaction_depth = 0
+        # (client, key) -> (write, args) deferred by the current transaction
+        self.held_writes: dict = {}
+        # told when the current transaction is rolled back
+        self.clients: weakref.WeakSet = weakref.WeakSet()
+
+
+def connect(path: str) -> SaveConnection:
+    """
+    Open a save database. WAL journaling with synchronous=NORMAL only syncs the
+    log at checkpoints, so a commit no longer costs an fsync; a crash can at
+    worst lose the last transactions, never corrupt the save.
+    """
+    conn = sqlite3.connect(path, factory=SaveConnection)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+class SaveDB:
+    """
+    Base for the clients of a save database. Writes made inside transaction()
+    are committed together when the outermost transaction ends, or rolled back
+    if it raises. Transactions belong to the connection, so they span the
+    clients sharing it.
+
+    With a WriteBehind attached, defer() hands writes to its thread. The writes
+    are keyed by tuples starting with what they write, e.g. ("npc", name), and a
+    read calls wait_for_writes() with the keys it depends on, or takes their
+    data from pending_writes(). Writes deferred inside a transaction are held
+    until it commits, and dropped if it rolls back.
+    """
+
+    conn: SaveConnection
+    path: str
+    write_behind = None
+
+    def attach(self, conn: Optional[SaveConnection]):
+        """Use the connection `conn`, or a new one to the save database."""
+        self.conn = conn or connect(self.path)
+        self.conn.clients.add(self)
+
+    def reopen(self, conn: sqlite3.Connection) -> "SaveDB":
+        """A new client of the same database using the connection `conn`."""
+        raise NotImplementedError
+
+    def defer(self, key, write, *args):
+        """Run write(self, *args) now, or on the write-behind thread if attached."""
+        if self.write_behind is None:
+            return write(self, *args)
+        if self.conn.transaction_depth:
+            self.conn.held_writes[(self, key)] = (write, args)
+        else:
+            self.write_behind.put((id(self), key), write, *args, db=self)
+
+    def release_writes(self):
+        """Hand the writes held by the transaction that just ended to the thread."""
+        held, self.conn.held_writes = self.conn.held_writes, {}
+        for (db, key), (write, args) in held.items():
+            db.defer(key, write, *args)
+
+    def backup(self, path: str, pages: int = BACKUP_PAGES, progress=None):
+        """
+        Copy the database to `path` with SQLite's online backup API, `pages`
+        pages at a time. Pages changed by this connection during the backup are
+        copied too, so the copy is consistent without pausing the game.
+        """
+        self.wait_for_writes()
+        target = sqlite3.connect(path)
+        try:
+            self.conn.backup(target, pages=pages, progress=progress, sleep=0)
+        finally:
+            target.close()
+        logger.debug(f"{self.path} backed up to {path}.")
+
+    def pending_writes(self) -> dict:
+        """key -> args of the writes deferred by this client and not committed yet."""
+        pending = {} if self.write_behind is None else self.write_behind.pending(self)
+        for (db, key), (_, args) in self.conn.held_writes.items():
+            if db is self:
+                pending[key] = args
+        return pending
+
+    def wait_for_writes(self, *prefixes: tuple):
+        """
+        Wait until the writes deferred by this client with a key starting with
+        one of `prefixes` are committed, or every queued write if none are given.
+        """
+        if self.write_behind is None:
+            return
+        if not prefixes:
+            self.write_behind.drain()
+            return
+        self.write_behind.drain(
+            lambda db, key: db is self
+            and any(key[: len(prefix)] == prefix for prefix in prefixes)
+        )
+
+    @contextmanager
+    def transaction(self):
+        self.conn.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.transaction_depth -= 1
+            if not self.conn.transaction_depth:
+                self.rollback()
+            raise
+        self.conn.transaction_depth -= 1
+        if not self.conn.transaction_depth:
+            self.release_writes()
+        self.commit()
+
+    def commit(self):
+        """Commit, unless inside a transaction which commits when it ends."""
+        if not self.conn.transaction_depth:
+            self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+        self.conn.held_writes = {}
+        for client in list(self.conn.clients):
+            client.rolled_back()
+        logger.debug(f"{type(self).__name__} transaction rolled back.")
+
+    def rolled_back(self):
+        """Drop what the client keeps in memory of a transaction rolled back."""
@@ -0,0 +1,100 @@
+import math
+from collections import defaultdict
+from typing import Callable, Optional
+
+
+class SpatialIndex:
+    """
+    Uniform grid over 2D points for radius and k-nearest queries. Points are
+    bucketed by cell so a query only visits the cells around it rather than
+    every point in the world.
+    """
+
+    def __init__(self, cell_size: float = 1.0):
+        self.cell_size = cell_size
+        self.points: dict[str, tuple[float, float]] = {}
+        self.cells: dict[tuple[int, int], set[str]] = defaultdict(set)
+        # bounds of the cells ever used, to know when a search can stop
+        self.bounds = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, x: float, y: float) -> tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, name: str, x: float, y: float):
+        self.remove(name)
+        self.points[name] = (x, y)
+        i, j = self.cell(x, y)
+        self.cells[(i, j)].add(name)
+        if self.bounds is None:
+            self.bounds = (i, j, i, j)
+        else:
+            min_i, min_j, max_i, max_j = self.bounds
+            self.bounds = (min(min_i, i), min(min_j, j), max(max_i, i), max(max_j, j))
+
+    def remove(self, name: str):
+        if (point := self.points.pop(name, None)) is not None:
+            cell = self.cell(*point)
+            self.cells[cell].discard(name)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def within(
+        self,
+        x: float,
+        y: float,
+        radius: float,
+        where: Optional[Callable[[str], bool]] = None,
+    ) -> list[tuple[float, str]]:
+        """(distance, name) of the points within radius of (x, y), closest first."""
+        cx, cy = self.cell(x, y)
+        reach = math.ceil(radius / self.cell_size)
+        found = []
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                for name in self.cells.get((i, j), ()):
+                    distance = math.dist((x, y), self.points[name])
+                    if distance <= radius and (where is None or where(name)):
+                        found.append((distance, name))
+        return sorted(found)
+
+    def nearest(
+        self,
+        x: float,
+        y: float,
+        k: int,
+        where: Optional[Callable[[str], bool]] = None,
+    ) -> list[tuple[float, str]]:
+        """(distance, name) of the k points closest to (x, y), closest first."""
+        if not self.cells:
+            return []
+        cx, cy = self.cell(x, y)
+        # rings beyond the furthest cell in use can't hold anything
+        min_i, min_j, max_i, max_j = self.bounds
+        max_ring = max(cx - min_i, max_i - cx, cy - min_j, max_j - cy)
+        found = []
+        for ring in range(max_ring + 1):
+            for cell in ring_cells(cx, cy, ring):
+                for name in self.cells.get(cell, ()):
+                    if where is None or where(name):
+                        found.append((math.dist((x, y), self.points[name]), name))
+            # every point closer than `ring` cells away has been visited
+            found.sort()
+            if len(found) >= k and found[k - 1][0] <= ring * self.cell_size:
+                break
+        return found[:k]
+
+
+def ring_cells(cx: int, cy: int, ring: int):
+    """The cells on the square ring `ring` cells away from (cx, cy)."""
+    if ring == 0:
+        yield cx, cy
+        return
+    for i in range(cx - ring, cx + ring + 1):
+        yield i, cy - ring
+        yield i, cy + ring
+    for j in range(cy - ring + 1, cy + ring):
+        yield cx - ring, j
+        yield cx + ring, j
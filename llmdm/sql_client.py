@@ -1,25 +1,225 @@
 import json
 import logging
 import os
+import re
 import sqlite3
-from dataclasses import asdict
+from collections import namedtuple
+from functools import lru_cache
 from typing import Optional
 
-from llmdm.location import Location
+from llmdm.location import Location, Neighborhood
 from llmdm.npc import NPC
 from llmdm.quest import Quest
+from llmdm.save_db import SaveDB, save_path
 from llmdm.utils import SAVE_DIR
 
 logger = logging.getLogger(__name__)
 
+LOCATION_COLUMNS = [
+    "name",
+    "description",
+    "parent_location",
+    "sublocations",
+    "location_type",
+    "attributes",
+    "x",
+    "y",
+]
+NPC_COLUMNS = [
+    "name",
+    "description",
+    "location_name",
+    "behavior_type",
+    "appearance",
+    "bonds",
+    "ideals",
+    "flaws",
+    "role",
+    "traits",
+    "gender",
+    "affinity_score",
+    "affinity_type",
+]
+# a location with its NPCs, one row per NPC (NPC columns NULL if it has none)
+LOCATION_SELECT = f"""
+    SELECT {", ".join(f"locations.{column}" for column in LOCATION_COLUMNS)},
+        {", ".join(f"npcs.{column}" for column in NPC_COLUMNS)}
+    FROM locations
+    LEFT JOIN location_npcs ON location_npcs.location_name = locations.name
+    LEFT JOIN npcs ON npcs.name = location_npcs.npc_name
+"""
 
-class SQLClient:
-    def __init__(self, db_name):
+# kind of entity -> its table, the columns of its full-text index and their
+# bm25 weights, a match on the name counting most
+SEARCH_INDEXES = {
+    "npc": (
+        "npcs",
+        ("name", "description", "appearance", "role", "traits"),
+        (10.0, 1.0, 1.0, 2.0, 1.0),
+    ),
+    "location": (
+        "locations",
+        ("name", "description", "location_type"),
+        (10.0, 1.0, 2.0),
+    ),
+    "quest": (
+        "quests",
+        ("name", "description", "objective"),
+        (10.0, 1.0, 1.0),
+    ),
+}
+SearchHit = namedtuple("SearchHit", ["kind", "name", "snippet", "rank"])
+
+# fill in the kind and within of the proper nouns that are NPCs or locations
+CLASSIFY_NAMES = [
+    """
+    UPDATE names SET kind = 'npc', within = (
+        SELECT NULLIF(location_name, 'None') FROM npcs
+        WHERE npcs.name = names.name
+    )
+    WHERE kind IS NULL AND name IN (SELECT name FROM npcs)
+    """,
+    """
+    UPDATE names SET kind = 'location', within = (
+        SELECT parent_location FROM locations
+        WHERE locations.name = names.name
+    )
+    WHERE kind IS NULL AND name IN (SELECT name FROM locations)
+    """,
+]
+
+# schema changes, in order, applied to saves with a lower PRAGMA user_version
+MIGRATIONS = [
+    # 1: location coordinates
+    [
+        "ALTER TABLE locations ADD COLUMN x REAL",
+        "ALTER TABLE locations ADD COLUMN y REAL",
+    ],
+    # 2: the NPCs of a location in a join table instead of a JSON array
+    [
+        """
+        CREATE TABLE location_npcs (
+            location_name TEXT,
+            npc_name TEXT,
+            position INTEGER,
+            PRIMARY KEY (location_name, npc_name)
+        )
+        """,
+        "CREATE INDEX location_npcs_npc_name ON location_npcs (npc_name)",
+        "CREATE INDEX npcs_location_name ON npcs (location_name)",
+        """
+        INSERT OR IGNORE INTO location_npcs (location_name, npc_name, position)
+        SELECT locations.name, json_each.value, json_each.key
+        FROM locations, json_each(locations.npcs)
+        """,
+        # locations.npcs is left in place, unused: dropping a column needs
+        # SQLite 3.35, newer than some systems ship
+    ],
+    # 3: full-text indexes of the NPCs, locations and quests
+    [
+        statement
+        for table, columns, _ in SEARCH_INDEXES.values()
+        for statement in (
+            f"""
+            CREATE VIRTUAL TABLE {table}_fts USING fts5(
+                {", ".join(columns)},
+                content = '{table}', tokenize = 'porter unicode61'
+            )
+            """,
+            f"""
+            CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts (rowid, {", ".join(columns)})
+                VALUES (new.rowid, {", ".join(f"new.{c}" for c in columns)});
+            END
+            """,
+            f"""
+            CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {", ".join(columns)})
+                VALUES ('delete', old.rowid, {", ".join(f"old.{c}" for c in columns)});
+            END
+            """,
+            f"""
+            CREATE TRIGGER {table}_fts_update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {", ".join(columns)})
+                VALUES ('delete', old.rowid, {", ".join(f"old.{c}" for c in columns)});
+                INSERT INTO {table}_fts (rowid, {", ".join(columns)})
+                VALUES (new.rowid, {", ".join(f"new.{c}" for c in columns)});
+            END
+            """,
+            f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')",
+        )
+    ],
+    # 4: the kind of entity a proper noun names, and the location it is in
+    [
+        "ALTER TABLE names ADD COLUMN kind TEXT",
+        "ALTER TABLE names ADD COLUMN within TEXT",
+        *CLASSIFY_NAMES,
+    ],
+]
+
+# columns of the NPC and location summaries used when building prompts
+SUMMARY_COLUMNS = ("name", "description")
+
+
+def location_row(location: Location) -> tuple:
+    """The values of LOCATION_COLUMNS stored for a location."""
+    return (
+        location.name,
+        str(location.description),
+        location.parent_location,
+        json.dumps(location.sublocations),
+        str(location.location_type),
+        str(location.attributes),
+        *(location.coordinates or (None, None)),
+    )
+
+
+def npc_row(npc: NPC) -> tuple:
+    """The values of NPC_COLUMNS stored for an NPC."""
+    return (
+        npc.name,
+        str(npc.description),
+        str(npc.location_name),
+        str(npc.behavior_type),
+        str(npc.appearance),
+        str(npc.bonds),
+        str(npc.ideals),
+        str(npc.flaws),
+        str(npc.role),
+        str(npc.traits),
+        str(npc.gender),
+        npc.affinity_score,
+        npc.affinity_type,
+    )
+
+
+@lru_cache
+def projection(table: str, columns: tuple[str, ...]):
+    """Named tuple type holding a selection of the columns of a table."""
+    allowed = {"npcs": NPC_COLUMNS, "locations": LOCATION_COLUMNS}[table]
+    if unknown := [column for column in columns if column not in allowed]:
+        raise ValueError(f"unknown {table} columns: {unknown}")
+    return namedtuple(f"{table.title()}Projection", columns)
+
+
+# variants of the travel narration kept for each route
+TRAVEL_NARRATION_VARIANTS = 3
+# total travel narrations kept before the least recently used are evicted
+MAX_TRAVEL_NARRATIONS = 500
+
+
+class SQLClient(SaveDB):
+    def __init__(self, db_name, conn: sqlite3.Connection = None):
         if not os.path.exists(SAVE_DIR):
             os.mkdir(SAVE_DIR)
-        self.conn = sqlite3.connect(os.path.join(SAVE_DIR, f"{db_name}.sql"))
+        self.db_name = db_name
+        self.path = save_path(db_name)
+        self.attach(conn)
         # Enable foreign key constraints
         self.conn.execute("PRAGMA foreign_keys = ON;")
+        # so that INSERT OR REPLACE removes the replaced rows from the full-text
+        # indexes, through their delete triggers
+        self.conn.execute("PRAGMA recursive_triggers = ON")
         self.cursor = self.conn.cursor()
         self.create_tables()
 
@@ -73,7 +273,7 @@ class SQLClient:
             )
         """
         )
-        self.conn.commit()
+        self.commit()
 
         # Create the npcs table if it doesn't exist.
         self.cursor.execute(
@@ -86,7 +286,94 @@ class SQLClient:
             )
         """
         )
-        self.conn.commit()
+
+        # Rendered scene descriptions, keyed on the content of the location and
+        # the NPCs present when the scene was generated.
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scene_descriptions (
+                location_name TEXT PRIMARY KEY,
+                scene_key TEXT,
+                description TEXT
+            )
+        """
+        )
+
+        # Travel narrations, several variants per route. The source_key tracks
+        # the content of the locations the variant was generated from.
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS travel_narrations (
+                origin TEXT,
+                destination TEXT,
+                move_type TEXT,
+                variant INTEGER,
+                source_key TEXT,
+                narration TEXT,
+                last_used INTEGER,
+                PRIMARY KEY (origin, destination, move_type, variant)
+            )
+        """
+        )
+
+        # The game state and player character, by name
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS save_data (
+                key TEXT PRIMARY KEY,
+                data TEXT
+            )
+        """
+        )
+
+        # The proper nouns and their nicknames, looked up by ProperNounDB
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS names (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL
+            )
+        """
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nicknames (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name_id INTEGER NOT NULL,
+                nickname TEXT NOT NULL,
+                normalized_nickname TEXT NOT NULL,
+                FOREIGN KEY(name_id) REFERENCES names(id)
+            )
+        """
+        )
+
+        # Results of completed world generation steps, used to resume
+        # generation after a failure.
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                step TEXT PRIMARY KEY,
+                data TEXT
+            )
+        """
+        )
+        self.commit()
+        self.migrate()
+
+    def reopen(self, conn: sqlite3.Connection) -> "SQLClient":
+        return SQLClient(self.db_name, conn=conn)
+
+    def migrate(self):
+        """Bring the tables of saves made by older versions up to date."""
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        for version, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                self.cursor.execute(statement)
+            self.cursor.execute(f"PRAGMA user_version = {version}")
+            self.commit()
+            logger.debug(f"Database migrated to version {version}.")
 
     # def get_game_state(self):
     #     self.cursor.execute("SELECT date, location, mode FROM game_state WHERE id = 1")
@@ -110,7 +397,7 @@ class SQLClient:
     #     """,
     #         (values,),
     #     )
-    #     self.conn.commit()
+    #     self.commit()
 
     # def update_game_state(self, **kwargs):
     #     # Build the query dynamically
@@ -125,133 +412,300 @@ class SQLClient:
     #     """,
     #         (values,),
     #     )
-    #     self.conn.commit()
+    #     self.commit()
 
     def close(self):
         self.conn.close()
 
     def save_location(self, location: Location):
-        npcs = json.dumps([npc.name for npc in location.npcs])
-        sublocations = json.dumps(location.sublocations)
+        self.save_locations([location])
 
-        self.cursor.execute(
+    def save_locations(self, locations: list[Location]):
+        """Save or update locations with one statement per table, in one transaction."""
+        names = [(location.name,) for location in locations]
+        with self.transaction():
+            self.cursor.executemany(
+                """
+                INSERT OR REPLACE INTO locations (
+                    name, description, parent_location, sublocations,
+                    location_type, attributes, x, y
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [location_row(location) for location in locations],
+            )
+            self.cursor.executemany(
+                "DELETE FROM location_npcs WHERE location_name = ?", names
+            )
+            self.cursor.executemany(
+                """
+                INSERT OR IGNORE INTO location_npcs (
+                    location_name, npc_name, position
+                ) VALUES (?, ?, ?)
+            """,
+                [
+                    (location.name, npc.name, position)
+                    for location in locations
+                    for position, npc in enumerate(location.npcs)
+                ],
+            )
+            self.invalidate_scene_descriptions([name for name, in names])
+        logger.debug(
+            f"Locations {[location.name for location in locations]} saved to the "
+            "database."
+        )
+
+    def get_location(self, name: str) -> Optional[Location]:
+        self.wait_for_writes(("location", name), ("npc",))
+        locations = self.select_locations("WHERE locations.name = ?", (name,))
+        if locations:
+            logger.debug(f"Location '{name}' loaded from the database.")
+            return locations[0]
+        else:
+            logger.debug(f"Location '{name}' not found in the database.")
+            return None
+
+    def get_neighborhood(
+        self, name: str, nearby: list[str] = ()
+    ) -> Optional[Neighborhood]:
+        """
+        Load a location with its parent, siblings, children and the `nearby`
+        locations, NPCs included, in two queries whatever the number of locations.
+        """
+        self.wait_for_writes(("location",), ("npc",))
+        return self.build_neighborhood(name, nearby)
+
+    def build_neighborhood(
+        self, name: str, nearby: list[str]
+    ) -> Optional[Neighborhood]:
+        location = self.get_location(name)
+        if not location:
+            return None
+        parent_name = location.parent_location
+        others = self.neighborhood_candidates(location, nearby)
+        parent = next((o for o in others if o.name == parent_name), None)
+        parent_sublocations = parent.sublocations if parent else []
+
+        def listed_first(names):
+            # sublocations in their listed order, then the rest by name
+            return lambda other: (
+                names.index(other.name) if other.name in names else len(names),
+                other.name,
+            )
+
+        neighborhood = Neighborhood(location=location, parent=parent)
+        for other in others:
+            if other is parent:
+                continue
+            if other.name in location.sublocations or other.parent_location == name:
+                neighborhood.children.append(other)
+            elif parent_name and (
+                other.name in parent_sublocations
+                or other.parent_location == parent_name
+            ):
+                neighborhood.siblings.append(other)
+            else:
+                neighborhood.nearby.append(other)
+        neighborhood.children.sort(key=listed_first(location.sublocations))
+        neighborhood.siblings.sort(key=listed_first(parent_sublocations))
+        neighborhood.nearby.sort(key=listed_first(list(nearby)))
+        logger.debug(f"Neighborhood of '{name}' loaded from the database.")
+        return neighborhood
+
+    def neighborhood_candidates(
+        self, location: Location, nearby: list[str]
+    ) -> list[Location]:
+        """The locations one move away from `location`, and the `nearby` ones."""
+        name, parent_name = location.name, location.parent_location
+        return self.select_locations(
             """
-            INSERT OR REPLACE INTO locations (
-                name, description, npcs, parent_location, sublocations,
-                location_type, attributes
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            WHERE locations.name != ? AND (
+                locations.name = ?
+                OR locations.parent_location IN (?, ?)
+                OR locations.name IN (SELECT value FROM json_each(?))
+                OR locations.name IN (
+                    SELECT value FROM json_each(
+                        (SELECT sublocations FROM locations WHERE name = ?)
+                    )
+                )
+                OR locations.name IN (SELECT value FROM json_each(?))
+            )
         """,
             (
-                location.name,
-                str(location.description),
-                npcs,
-                location.parent_location,
-                sublocations,
-                str(location.location_type),
-                str(location.attributes),
+                name,
+                parent_name,
+                name,
+                parent_name,
+                json.dumps(location.sublocations),
+                parent_name,
+                json.dumps(list(nearby)),
             ),
         )
-        self.conn.commit()
-        logger.debug(f"Location '{location.name}' saved to the database.")
 
-    def get_location(self, name: str) -> Optional[Location]:
+    def select_locations(self, where: str = "", params=()) -> list[Location]:
+        """
+        Locations matching the WHERE clause, with their NPCs, in a single JOIN.
+        Doesn't wait for the pending writes, see get_location.
+        """
         self.cursor.execute(
-            "SELECT * FROM locations WHERE name = ?",
-            (name,),
+            f"{LOCATION_SELECT} {where} ORDER BY locations.name, location_npcs.position",
+            params,
         )
-        row = self.cursor.fetchone()
-        if row:
+        locations = {}
+        for row in self.cursor.fetchall():
             (
                 name,
                 description,
-                npcs,
                 parent_location,
                 sublocations,
                 location_type,
                 attributes,
-            ) = row
-            location = Location(
-                name=name,
-                description=description,
-                npcs=[self.get_npc(npc_name) for npc_name in json.loads(npcs)],
-                parent_location=parent_location,
-                sublocations=json.loads(sublocations),
-                location_type=location_type,
-                attributes=attributes,
-            )
-            logger.debug(f"Location '{name}' loaded from the database.")
-            return location
-        else:
-            logger.debug(f"Location '{name}' not found in the database.")
-            return None
+                x,
+                y,
+            ) = row[: len(LOCATION_COLUMNS)]
+            if name not in locations:
+                locations[name] = Location(
+                    name=name,
+                    description=description,
+                    npcs=[],
+                    parent_location=parent_location,
+                    sublocations=json.loads(sublocations),
+                    location_type=location_type,
+                    attributes=attributes,
+                    coordinates=None if x is None else (x, y),
+                )
+            npc_row = row[len(LOCATION_COLUMNS) :]
+            if npc_row[0] is not None:
+                locations[name].npcs.append(NPC(*npc_row))
+        return list(locations.values())
 
-    def get_all_locations(self) -> list[Location]:
+    def get_location_summaries(
+        self, names: list[str], columns: tuple[str, ...] = SUMMARY_COLUMNS
+    ) -> list[tuple]:
+        """Some columns of the named locations, as named tuples in the same order."""
+        self.wait_for_writes(("location",))
+        return self.select_location_summaries(names, columns)
+
+    def select_location_summaries(
+        self, names: list[str], columns: tuple[str, ...]
+    ) -> list[tuple]:
+        Projection = projection("locations", tuple(columns))
         self.cursor.execute(
-            "SELECT * FROM locations",
+            f"""
+            SELECT {", ".join(f"locations.{column}" for column in columns)}
+            FROM json_each(?) JOIN locations ON locations.name = json_each.value
+            ORDER BY json_each.key
+        """,
+            (json.dumps(list(names)),),
         )
-        locations = []
-        for row in self.cursor.fetchall():
-            if row:
-                (
-                    name,
-                    description,
-                    npcs,
-                    parent_location,
-                    sublocations,
-                    location_type,
-                    attributes,
-                ) = row
-                locations.append(
-                    Location(
-                        name=name,
-                        description=description,
-                        npcs=[self.get_npc(npc_name) for npc_name in json.loads(npcs)],
-                        parent_location=parent_location,
-                        sublocations=json.loads(sublocations),
-                        location_type=location_type,
-                        attributes=attributes,
-                    )
-                )
-                logger.debug(f"Location '{name}' loaded from the database.")
-            else:
-                logger.debug(f"Location '{name}' not found in the database.")
-        return locations
+        return [Projection(*row) for row in self.cursor.fetchall()]
 
-    def save_npc(self, npc: NPC):
-        """Save or update an NPC instance in the database."""
-        logger.debug(f"Inserting NPC: {asdict(npc)}")
+    def get_location_hierarchy(self) -> list[tuple]:
+        """
+        (name, parent_location, sublocations, location_type, coordinates) of every
+        location.
+        """
+        self.wait_for_writes(("location",))
+        return self.select_location_hierarchy()
+
+    def select_location_hierarchy(self) -> list[tuple]:
         self.cursor.execute(
             """
-            INSERT OR REPLACE INTO npcs (
-                name, description,
-                location_name, behavior_type, appearance,
-                bonds, ideals, flaws, role,
-                traits, gender, affinity_score, affinity_type
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+            SELECT name, parent_location, sublocations, location_type, x, y
+            FROM locations
+        """
+        )
+        return [
             (
-                npc.name,
-                str(npc.description),
-                str(npc.location_name),
-                str(npc.behavior_type),
-                str(npc.appearance),
-                str(npc.bonds),
-                str(npc.ideals),
-                str(npc.flaws),
-                str(npc.role),
-                str(npc.traits),
-                str(npc.gender),
-                npc.affinity_score,
-                npc.affinity_type,
-            ),
+                name,
+                parent_location,
+                json.loads(sublocations),
+                location_type,
+                None if x is None else (x, y),
+            )
+            for name, parent_location, sublocations, location_type, x, y in (
+                self.cursor.fetchall()
+            )
+        ]
+
+    def get_all_locations(self) -> list[Location]:
+        self.wait_for_writes(("location",), ("npc",))
+        locations = self.select_locations()
+        logger.debug(f"{len(locations)} locations loaded from the database.")
+        return locations
+
+    def search(
+        self, text: str, kinds: tuple[str, ...] = tuple(SEARCH_INDEXES), limit=10
+    ) -> list[SearchHit]:
+        """
+        The NPCs, locations and quests matching any word of `text`, best first,
+        with a snippet of the matching column.
+        """
+        if unknown := [kind for kind in kinds if kind not in SEARCH_INDEXES]:
+            raise ValueError(f"unknown kinds of entities: {unknown}")
+        words = re.findall(r"\w+", text)
+        if not words or not kinds:
+            return []
+        query = " OR ".join(f'"{word}"' for word in words)
+        selects = []
+        for kind in kinds:
+            table, _, weights = SEARCH_INDEXES[kind]
+            selects.append(
+                f"""
+                SELECT '{kind}', name,
+                    snippet({table}_fts, -1, '[', ']', '...', 12),
+                    bm25({table}_fts, {", ".join(map(str, weights))})
+                FROM {table}_fts WHERE {table}_fts MATCH ?
+            """
+            )
+        # the full-text indexes are only up to date once the writes are committed
+        self.wait_for_writes(*[(kind,) for kind in kinds])
+        self.cursor.execute(
+            " UNION ALL ".join(selects) + " ORDER BY 4 LIMIT ?",
+            (*[query] * len(kinds), limit),
         )
-        self.conn.commit()
-        logger.debug(f"NPC '{npc.name}' saved to the database.")
+        return [SearchHit(*row) for row in self.cursor.fetchall()]
+
+    def save_npc(self, npc: NPC):
+        """Save or update an NPC instance in the database."""
+        self.save_npcs([npc])
+
+    def save_npcs(self, npcs: list[NPC]):
+        """Save or update NPCs with one statement per table, in one transaction."""
+        names = json.dumps([npc.name for npc in npcs])
+        with self.transaction():
+            # scenes at both the NPCs' previous and new locations are out of date
+            self.cursor.execute(
+                """
+                SELECT location_name FROM npcs
+                WHERE name IN (SELECT value FROM json_each(?))
+                UNION
+                SELECT location_name FROM location_npcs
+                WHERE npc_name IN (SELECT value FROM json_each(?))
+            """,
+                (names, names),
+            )
+            self.invalidate_scene_descriptions(
+                [row[0] for row in self.cursor.fetchall()]
+                + [str(npc.location_name) for npc in npcs]
+            )
+            self.cursor.executemany(
+                """
+                INSERT OR REPLACE INTO npcs (
+                    name, description,
+                    location_name, behavior_type, appearance,
+                    bonds, ideals, flaws, role,
+                    traits, gender, affinity_score, affinity_type
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [npc_row(npc) for npc in npcs],
+            )
+        logger.debug(f"NPCs {[npc.name for npc in npcs]} saved to the database.")
 
     def get_npc(self, name: str) -> Optional[NPC]:
         """Retrieve an NPC instance from the database by name."""
+        self.wait_for_writes(("npc", name))
         self.cursor.execute(
-            "SELECT * FROM npcs WHERE name = ?",
+            f"SELECT {', '.join(NPC_COLUMNS)} FROM npcs WHERE name = ?",
             (name,),
         )
         row = self.cursor.fetchone()
@@ -263,10 +717,36 @@ class SQLClient:
             logger.debug(f"NPC '{name}' not found in the database.")
             return None
 
+    def get_npc_summaries(
+        self, location_name: str, columns: tuple[str, ...] = SUMMARY_COLUMNS
+    ) -> list[tuple]:
+        """
+        Some columns of the NPCs of a location, as named tuples in their order
+        there, for prompts that don't need whole NPCs.
+        """
+        self.wait_for_writes(("location", location_name), ("npc",))
+        return self.select_npc_summaries(location_name, columns)
+
+    def select_npc_summaries(
+        self, location_name: str, columns: tuple[str, ...]
+    ) -> list[tuple]:
+        Projection = projection("npcs", tuple(columns))
+        self.cursor.execute(
+            f"""
+            SELECT {", ".join(f"npcs.{column}" for column in columns)}
+            FROM location_npcs JOIN npcs ON npcs.name = location_npcs.npc_name
+            WHERE location_npcs.location_name = ?
+            ORDER BY location_npcs.position
+        """,
+            (location_name,),
+        )
+        return [Projection(*row) for row in self.cursor.fetchall()]
+
     def npc_name_used(self, name: str) -> bool:
         """determine if an NPC already exists with the name given."""
+        self.wait_for_writes(("npc", name))
         self.cursor.execute(
-            "SELECT * FROM npcs WHERE name = ?",
+            "SELECT 1 FROM npcs WHERE name = ?",
             (name,),
         )
         row = self.cursor.fetchone()
@@ -274,8 +754,12 @@ class SQLClient:
         return bool(row)
 
     def get_all_npcs(self) -> list[NPC]:
+        self.wait_for_writes(("npc",))
+        return self.select_npcs()
+
+    def select_npcs(self) -> list[NPC]:
         self.cursor.execute(
-            "SELECT * FROM npcs",
+            f"SELECT {', '.join(NPC_COLUMNS)} FROM npcs",
         )
         npcs = []
         for row in self.cursor.fetchall():
@@ -283,6 +767,128 @@ class SQLClient:
 
         return npcs
 
+    def get_scene_description(self, location_name: str, scene_key: str):
+        """Retrieve the cached scene description, None if missing or out of date."""
+        # rows left over by the NPCs and locations saved since never match the key
+        self.wait_for_writes(("scene", location_name))
+        self.cursor.execute(
+            """
+            SELECT description FROM scene_descriptions
+            WHERE location_name = ? AND scene_key = ?
+        """,
+            (location_name, scene_key),
+        )
+        row = self.cursor.fetchone()
+        if row:
+            logger.debug(f"Scene for '{location_name}' loaded from the database.")
+            return row[0]
+        return None
+
+    def save_scene_description(
+        self, location_name: str, scene_key: str, description: str
+    ):
+        self.cursor.execute(
+            """
+            INSERT OR REPLACE INTO scene_descriptions (
+                location_name, scene_key, description
+            ) VALUES (?, ?, ?)
+        """,
+            (location_name, scene_key, description),
+        )
+        self.commit()
+        logger.debug(f"Scene for '{location_name}' saved to the database.")
+
+    def invalidate_scene_descriptions(self, location_names: list[str]):
+        self.cursor.executemany(
+            "DELETE FROM scene_descriptions WHERE location_name = ?",
+            [(name,) for name in location_names],
+        )
+
+    def get_travel_narration(
+        self, origin: str, destination: str, move_type: str, source_key: str
+    ) -> Optional[str]:
+        """
+        Retrieve the least recently used up to date narration for a route.
+
+        Returns None while the route has fewer than TRAVEL_NARRATION_VARIANTS up to
+        date variants so that a new variant gets generated.
+        """
+        self.wait_for_writes(("travel", origin, destination, move_type))
+        self.cursor.execute(
+            """
+            SELECT variant, narration FROM travel_narrations
+            WHERE origin = ? AND destination = ? AND move_type = ?
+                AND source_key = ?
+            ORDER BY last_used
+        """,
+            (origin, destination, move_type, source_key),
+        )
+        rows = self.cursor.fetchall()
+        if len(rows) < TRAVEL_NARRATION_VARIANTS:
+            return None
+        variant, narration = rows[0]
+        self.use_travel_narration(origin, destination, move_type, variant)
+        logger.debug(f"Travel narration {origin} -> {destination} reused.")
+        return narration
+
+    def use_travel_narration(
+        self, origin: str, destination: str, move_type: str, variant: int
+    ):
+        """Make a variant the most recently used of all the narrations."""
+        self.cursor.execute(
+            """
+            UPDATE travel_narrations
+            SET last_used = (SELECT MAX(last_used) + 1 FROM travel_narrations)
+            WHERE origin = ? AND destination = ? AND move_type = ? AND variant = ?
+        """,
+            (origin, destination, move_type, variant),
+        )
+        self.commit()
+
+    def save_travel_narration(
+        self,
+        origin: str,
+        destination: str,
+        move_type: str,
+        source_key: str,
+        narration: str,
+    ):
+        """Store a new variant for a route, replacing out of date variants first."""
+        self.cursor.execute(
+            """
+            SELECT variant, source_key FROM travel_narrations
+            WHERE origin = ? AND destination = ? AND move_type = ?
+        """,
+            (origin, destination, move_type),
+        )
+        variants = dict(self.cursor.fetchall())
+        stale = [v for v, key in variants.items() if key != source_key]
+        unused = [v for v in range(TRAVEL_NARRATION_VARIANTS) if v not in variants]
+        variant = (stale + unused + [min(variants, default=0)])[0]
+        self.cursor.execute(
+            """
+            INSERT OR REPLACE INTO travel_narrations (
+                origin, destination, move_type, variant, source_key, narration,
+                last_used
+            ) VALUES (
+                ?, ?, ?, ?, ?, ?,
+                (SELECT COALESCE(MAX(last_used), 0) + 1 FROM travel_narrations)
+            )
+        """,
+            (origin, destination, move_type, variant, source_key, narration),
+        )
+        self.cursor.execute(
+            """
+            DELETE FROM travel_narrations WHERE rowid IN (
+                SELECT rowid FROM travel_narrations ORDER BY last_used
+                LIMIT MAX(0, (SELECT COUNT(*) FROM travel_narrations) - ?)
+            )
+        """,
+            (MAX_TRAVEL_NARRATIONS,),
+        )
+        self.commit()
+        logger.debug(f"Travel narration {origin} -> {destination} saved.")
+
     def save_quest(self, quest: Quest):
         self.cursor.execute(
             """
@@ -297,10 +903,11 @@ class SQLClient:
                 quest.giver,
             ),
         )
-        self.conn.commit()
+        self.commit()
         logger.debug(f"Quest '{quest.name}' saved to the database.")
 
     def get_quest(self, name: str) -> Optional[Quest]:
+        self.wait_for_writes(("quest", name))
         self.cursor.execute(
             "SELECT * FROM quests WHERE name = ?",
             (name,),
@@ -324,3 +931,60 @@ class SQLClient:
         else:
             logger.debug(f"Quest '{name}' not found in the database.")
             return None
+
+    def save_game(self, save_data: dict):
+        """Store the game state and player character, e.g. {"GameState": {...}}."""
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO save_data (key, data) VALUES (?, ?)",
+            [(key, json.dumps(data)) for key, data in save_data.items()],
+        )
+        self.commit()
+        logger.debug(f"Saving data:\n{json.dumps(save_data, indent=2)}")
+
+    def load_game(self) -> dict:
+        """
+        The game state and player character, imported from the JSON file of
+        saves made before they were stored in the save database.
+        """
+        self.wait_for_writes(("save_game",))
+        self.cursor.execute("SELECT key, data FROM save_data")
+        save_data = {key: json.loads(data) for key, data in self.cursor.fetchall()}
+        legacy_file = os.path.join(SAVE_DIR, f"{self.db_name}.json")
+        if not save_data and os.path.exists(legacy_file):
+            with open(legacy_file) as f:
+                save_data = json.load(f)
+            self.save_game(save_data)
+            logger.info(f"Imported {legacy_file} into the save database.")
+        return save_data
+
+    def save_checkpoint(self, step: str, data):
+        """Record the (JSON serializable) result of a completed generation step."""
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO checkpoints (step, data) VALUES (?, ?)",
+            (step, json.dumps(data)),
+        )
+        self.commit()
+        logger.debug(f"Checkpoint '{step}' saved to the database.")
+
+    def get_checkpoint(self, step: str):
+        """Retrieve the result of a completed generation step, None if not run yet."""
+        self.wait_for_writes(("checkpoint", step), ("clear_checkpoints",))
+        self.cursor.execute(
+            "SELECT data FROM checkpoints WHERE step = ?",
+            (step,),
+        )
+        row = self.cursor.fetchone()
+        if row:
+            logger.debug(f"Checkpoint '{step}' loaded from the database.")
+            return json.loads(row[0])
+        return None
+
+    def has_checkpoints(self) -> bool:
+        self.wait_for_writes(("checkpoint",), ("clear_checkpoints",))
+        self.cursor.execute("SELECT 1 FROM checkpoints LIMIT 1")
+        return self.cursor.fetchone() is not None
+
+    def clear_checkpoints(self):
+        self.cursor.execute("DELETE FROM checkpoints")
+        self.commit()
+        logger.debug("Checkpoints cleared from the database.")
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import queue
 import sys
@@ -24,6 +25,11 @@ def suppress_stdout():
         sys.stderr = original_stderr
 
 
+def content_key(*parts: str) -> str:
+    """Stable key for cached generations that changes whenever one of the parts does."""
+    return hashlib.sha1("\x00".join(parts).encode()).hexdigest()
+
+
 def slow_print(text, delay=0.01):
     """Function to print text slowly character by character."""
     for char in text:
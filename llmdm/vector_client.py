@@ -1,4 +1,4 @@
-from opensearchpy import OpenSearch
+from opensearchpy import OpenSearch, helpers
 from opensearchpy.exceptions import RequestError
 
 
@@ -29,6 +29,25 @@ class OpenSearchClient:
     def index_document(self, document, doc_id=None):
         return self.client.index(index=self.index_name, body=document, id=doc_id)
 
+    def export(self) -> list[dict]:
+        """Every document of the save's index, with its id."""
+        return [
+            {"_id": hit["_id"], "_source": hit["_source"]}
+            for hit in helpers.scan(
+                self.client,
+                index=self.index_name,
+                query={"query": {"match_all": {}}},
+            )
+        ]
+
+    def import_data(self, documents: list[dict]):
+        """Load the output of export(), replacing documents with the same id."""
+        helpers.bulk(
+            self.client,
+            ({"_index": self.index_name, **document} for document in documents),
+            refresh=True,
+        )
+
     def search_documents(self, query: dict) -> list[dict]:
         return [
             hit["_source"]
@@ -0,0 +1,173 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from llmdm.save_db import connect
+
+logger = logging.getLogger(__name__)
+
+# times a batch of writes is tried before its error is handed to the game loop
+WRITE_ATTEMPTS = 3
+
+
+class WriteBehind:
+    """
+    Background thread persisting the writes queued by the game loop.
+
+    Writes are queued under a key. Queuing a key that is still waiting replaces
+    its write but keeps its place, so an object saved several times in a turn is
+    written once, with its latest state. Writes to a save database run on the
+    thread's own connection to it, and everything picked up together is
+    committed together.
+
+    The game reads its own writes from memory (the identity map of
+    CachedSQLClient, the writes still pending and the LocationGraph); reads that
+    need the database wait for the pending writes they depend on with drain().
+
+    A batch that fails is rolled back and tried again. If it keeps failing it
+    stays queued, the thread stops writing, and the error is raised by the next
+    put(), drain() or close() of the game loop.
+    """
+
+    def __init__(self):
+        self.jobs: OrderedDict[Hashable, tuple] = OrderedDict()
+        # the batch being written, until it is committed
+        self.writing: OrderedDict[Hashable, tuple] = OrderedDict()
+        self.condition = threading.Condition()
+        self.error: Optional[Exception] = None
+        self.stopping = False
+        # id of a save database client -> the same client on the thread's own
+        # connection, shared by the clients sharing a connection on the game loop
+        self.clones = {}
+        self.connections = {}
+        self.thread = threading.Thread(
+            target=self.run, name="write-behind", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, key: Hashable, write: Callable, *args, db=None):
+        """
+        Queue write(*args), or write(connection, *args) with the thread's own
+        connection to the save database `db`.
+        """
+        with self.condition:
+            self.raise_error()
+            self.jobs[key] = (write, args, db)
+            self.condition.notify_all()
+
+    def pending(self, db) -> dict:
+        """
+        key -> args of the writes queued by the save database client `db` and
+        not committed yet, the latest write of a key last.
+        """
+        with self.condition:
+            return {
+                key[1]: args
+                for key, (_, args, job_db) in [
+                    *self.writing.items(),
+                    *self.jobs.items(),
+                ]
+                if job_db is db
+            }
+
+    def drain(self, match: Callable = None):
+        """
+        Wait until every queued write, or those of save databases for which
+        match(db, key) is true, has been committed. `key` is the one the save
+        database queued the write under.
+        """
+        if threading.current_thread() is self.thread:
+            return
+
+        def waiting():
+            return any(
+                match is None or (db is not None and match(db, key[1]))
+                for key, (_, _, db) in [*self.writing.items(), *self.jobs.items()]
+            )
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.error or not waiting())
+            self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(
+                f"{len(self.jobs)} writes could not be saved"
+            ) from self.error
+
+    def close(self):
+        """Write everything queued, then stop the thread."""
+        try:
+            self.drain()
+        finally:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+            self.thread.join()
+
+    def clone(self, db):
+        if id(db) not in self.clones:
+            if id(db.conn) not in self.connections:
+                conn = connect(db.path)
+                # committed once per batch by the thread
+                conn.transaction_depth = 1
+                self.connections[id(db.conn)] = conn
+            clone = db.reopen(self.connections[id(db.conn)])
+            self.clones[id(db)] = clone
+        return self.clones[id(db)]
+
+    def write(self, jobs: list[tuple], done: set[int]):
+        """
+        Run a batch of writes and commit them. The writes outside of the save
+        databases, which can't be rolled back, are added to `done` so that
+        trying the batch again doesn't repeat them.
+        """
+        for i, (write, args, db) in enumerate(jobs):
+            if db is not None:
+                write(self.clone(db), *args)
+            elif i not in done:
+                write(*args)
+                done.add(i)
+        for conn in self.connections.values():
+            conn.commit()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: (self.jobs and not self.error) or self.stopping
+                )
+                if self.stopping and (not self.jobs or self.error):
+                    break
+                self.writing, self.jobs = self.jobs, OrderedDict()
+            jobs, done = list(self.writing.values()), set()
+            for attempt in range(1, WRITE_ATTEMPTS + 1):
+                try:
+                    self.write(jobs, done)
+                    error = None
+                    logger.debug(f"{len(jobs)} background writes committed.")
+                    break
+                except Exception as e:
+                    error = e
+                    logger.exception(
+                        f"Error in background writes, attempt {attempt} of {WRITE_ATTEMPTS}"
+                    )
+                    for conn in self.connections.values():
+                        conn.rollback()
+            with self.condition:
+                if error is not None:
+                    # kept first in the queue, without the writes already done,
+                    # and the game loop gets the error
+                    self.error = error
+                    failed = OrderedDict(
+                        (key, job)
+                        for i, (key, job) in enumerate(self.writing.items())
+                        if i not in done
+                    )
+                    failed.update(self.jobs)
+                    self.jobs = failed
+                self.writing = OrderedDict()
+                self.condition.notify_all()
+        for conn in self.connections.values():
+            conn.close()
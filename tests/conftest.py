@@ -0,0 +1,19 @@
+import pytest
+
+from llmdm.sql_client import SQLClient
+
+
+@pytest.fixture
+def save_dir(tmp_path, monkeypatch):
+    """Run the test from an empty directory, the saves going to its saved/."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "saved").mkdir()
+    return tmp_path / "saved"
+
+
+@pytest.fixture
+def other_client(sql_db):
+    """Another client of the "test" save, reading what sql_db has committed."""
+    db = SQLClient("test")
+    yield db
+    db.close()
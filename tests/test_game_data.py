@@ -0,0 +1,174 @@
+import pytest
+
+from llmdm.character import Character
+from llmdm.game_data import GameData, GameState, open_save
+from llmdm.location import Location
+from llmdm.npc import NPC
+
+
+class FakeLLM:
+    """The generations world building asks for, without a model."""
+
+    seed = None
+
+    def __init__(self):
+        self.generated = 0
+
+    def reseed(self, stream):
+        pass
+
+    def next_name(self, prefix: str) -> str:
+        self.generated += 1
+        return f"{prefix} {self.generated}"
+
+    def generate(self, prompt, *args, **kwargs):
+        return "A quiet town."
+
+    def generate_object(self, cls, fill_data={}, nicknames=False, **kwargs):
+        obj = cls(**{"name": self.next_name(cls.__name__), **fill_data})
+        return (obj, []) if nicknames else obj
+
+    def parse_out(self, text, object_type):
+        return ["Tomas", "Ysolde", "Brannoc"]
+
+    def generate_full_npc(self, player_character, fill_data={}, **kwargs):
+        return NPC(**{"name": self.next_name("NPC"), **fill_data}), []
+
+    def match_npcs_to_locations(self, description, locations, npcs, **kwargs):
+        for location in locations:
+            location.npcs.extend(npcs)
+
+    def get_npc_name(self, player_input, npc_summaries):
+        return None
+
+
+class FakeStore:
+    """Graph or vector store that ignores every write."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+@pytest.fixture
+def game_data(save_dir):
+    sql_db, noun_db = open_save("test")
+    game_data = GameData(
+        llm=FakeLLM(),
+        sql_db=sql_db,
+        graph_db=FakeStore(),
+        vector_db=FakeStore(),
+        game_state=GameState(location="The Tavern", seed=1),
+        noun_db=noun_db,
+        player_character=Character(),
+        save_name="test",
+    )
+    yield game_data
+    sql_db.close()
+
+
+class TestGenerateTown:
+    def test_locations_are_written_together(self, game_data, monkeypatch):
+        writes = []
+        save_locations = game_data.sql_db.save_locations
+        monkeypatch.setattr(
+            game_data.sql_db,
+            "save_locations",
+            lambda locations: writes.append([loc.name for loc in locations])
+            or save_locations(locations),
+        )
+        town = game_data.generate_town()
+        # each location is written when generated, then all of them populated
+        *created, populated = writes
+        assert all(len(names) == 1 for names in created)
+        assert sorted(populated) == sorted(town.sublocations + [town.name])
+        for name in town.sublocations:
+            assert len(game_data.sql_db.get_location(name).npcs) == 3
+
+    def test_known_npcs_are_not_generated_again(self, game_data):
+        known = NPC(name="Ysolda")
+        game_data.sql_db.save_npc(known)
+        game_data.noun_db.add("Ysolda", [], kind="npc")
+        town = game_data.generate_town()
+        npcs = game_data.sql_db.get_location(town.sublocations[0]).npcs
+        assert "Ysolda" in [npc.name for npc in npcs]
+        assert len(npcs) == 3
+
+
+class TestUnitOfWork:
+    def test_rollback_undoes_the_location_graph(self, game_data):
+        with pytest.raises(RuntimeError):
+            with game_data.unit_of_work():
+                game_data.save_location(Location(name="The Tavern"), [])
+                raise RuntimeError("action failed")
+        assert "The Tavern" not in game_data.location_graph.nodes
+
+    def test_deferred_writes_wait_for_the_commit(self, game_data):
+        written = []
+        with game_data.unit_of_work():
+            game_data.defer(object(), written.append, "committed")
+            assert written == []
+        with pytest.raises(RuntimeError):
+            with game_data.unit_of_work():
+                game_data.defer(object(), written.append, "rolled back")
+                raise RuntimeError("action failed")
+        assert written == ["committed"]
+
+    def test_forks_only_between_turns(self, game_data, save_dir):
+        with game_data.unit_of_work():
+            game_data.save_location(Location(name="The Tavern"), [])
+            with pytest.raises(RuntimeError):
+                game_data.fork("fork")
+        assert not (save_dir / "fork.sql").exists()
+
+
+class TestResolveNames:
+    def test_names_sounding_alike_stay_distinct(self, game_data):
+        game_data.noun_db.add("Lorin Vale", [], kind="npc")
+        game_data.noun_db.add("Elara", [], kind="npc")
+        assert game_data.resolve_names(
+            ["Laren Vole", "Ilori", "Lorin Val"], kind="npc"
+        ) == ["Laren Vole", "Ilori", "Lorin Vale"]
+
+
+class TestGetNpcToTalkTo:
+    @pytest.fixture
+    def tavern(self, game_data):
+        npcs = [
+            NPC(name="Tomas", location_name="The Tavern"),
+            NPC(name="Ysolde Marrow", location_name="The Tavern"),
+            NPC(name="Brannoc", location_name="The Tavern"),
+        ]
+        game_data.sql_db.save_npcs(npcs)
+        game_data.sql_db.save_location(Location(name="The Tavern", npcs=npcs))
+        game_data.noun_db.add("Tomas", [], kind="npc", within="The Tavern")
+        game_data.noun_db.add(
+            "Ysolde Marrow",
+            ["Ysolde", "the innkeeper"],
+            kind="npc",
+            within="The Tavern",
+        )
+        game_data.noun_db.add("Brannoc", [], kind="npc", within="The Tavern")
+        return game_data
+
+    @pytest.mark.parametrize(
+        "player_input, name",
+        [
+            ("talk to tomas", "Tomas"),
+            ("I want to speak with Ysolde Marrow.", "Ysolde Marrow"),
+            ("ask the innkeeper about rooms", "Ysolde Marrow"),
+            ("go chat with brannocc over by the fire", "Brannoc"),
+        ],
+    )
+    def test_resolves_names_in_sentences(self, tavern, player_input, name):
+        assert tavern.get_npc_to_talk_to(player_input).name == name
+
+    def test_asks_the_llm_otherwise(self, tavern, monkeypatch):
+        asked = []
+        monkeypatch.setattr(
+            tavern.llm,
+            "get_npc_name",
+            lambda player_input, _: asked.append(player_input),
+        )
+        assert tavern.get_npc_to_talk_to("talk to tomas and brannoc") is None
+        assert tavern.get_npc_to_talk_to("talk to the old man") is None
+        assert asked == ["talk to tomas and brannoc", "talk to the old man"]
@@ -0,0 +1,109 @@
+import pytest
+
+from llmdm.location import Location
+from llmdm.location_graph import LocationGraph
+
+
+@pytest.fixture
+def graph():
+    graph = LocationGraph()
+    graph.add(
+        Location(name="Elderwood", sublocations=["The Rusty Tankard", "Iron Forge"]),
+        ["the village"],
+    )
+    graph.add(
+        Location(name="The Rusty Tankard", parent_location="Elderwood"),
+        ["the tavern", "the inn"],
+    )
+    graph.add(Location(name="Iron Forge", parent_location="Elderwood"), ["smithy"])
+    graph.add(Location(name="The Cellar", parent_location="The Rusty Tankard"))
+    return graph
+
+
+class TestLocationGraph:
+    def test_neighbors(self, graph):
+        assert graph.neighbors("The Rusty Tankard") == {
+            "The Rusty Tankard": "local",
+            "Elderwood": "parent",
+            "Iron Forge": "nearby",
+            "The Cellar": "child",
+        }
+
+    def test_resolves_names_and_nicknames(self, graph):
+        assert graph.resolve_movement("head to the smithy", "The Rusty Tankard") == (
+            "nearby",
+            "Iron Forge",
+        )
+        assert graph.resolve_movement("go down to the cellar", "The Rusty Tankard") == (
+            "child",
+            "The Cellar",
+        )
+        assert graph.resolve_movement("walk into the tavern", "Elderwood") == (
+            "child",
+            "The Rusty Tankard",
+        )
+
+    def test_unclear_input_is_not_resolved(self, graph):
+        assert graph.resolve_movement("go somewhere quiet", "Elderwood") is None
+
+    def test_current_location_is_not_a_destination(self, graph):
+        assert graph.resolve_movement("leave the tavern", "The Rusty Tankard") is None
+        assert (
+            graph.resolve_movement("look around the inn", "The Rusty Tankard") is None
+        )
+
+    def test_update_moves_location(self, graph):
+        graph.add(Location(name="The Cellar", parent_location="Iron Forge"))
+        assert "The Cellar" not in graph.get_children("The Rusty Tankard")
+        assert graph.get_children("Iron Forge") == ["The Cellar"]
+
+    def test_find_route(self, graph):
+        assert graph.find_route("The Cellar", "Elderwood") == [
+            "The Cellar",
+            "The Rusty Tankard",
+            "Elderwood",
+        ]
+        # sibling locations are one "nearby" move apart
+        assert graph.find_route("The Cellar", "Iron Forge") == [
+            "The Cellar",
+            "The Rusty Tankard",
+            "Iron Forge",
+        ]
+        assert graph.find_route("The Cellar", "Nowhere") is None
+
+    def test_routes_are_recomputed_after_updates(self, graph):
+        assert len(graph.find_route("The Cellar", "Iron Forge")) == 3
+        graph.add(Location(name="The Cellar", parent_location="Iron Forge"))
+        assert graph.find_route("The Cellar", "Iron Forge") == [
+            "The Cellar",
+            "Iron Forge",
+        ]
+
+    def test_resolves_distant_locations_as_routes(self, graph):
+        assert graph.resolve_movement("go to the cellar", "Iron Forge") == (
+            "route",
+            "The Cellar",
+        )
+
+    def test_nearby_areas(self, graph):
+        graph.add(Location(name="Elderwood", coordinates=(0.0, 0.0)))
+        graph.add(Location(name="Mistvale", coordinates=(10.0, 0.0)))
+        graph.add(Location(name="Frostmere", coordinates=(100.0, 0.0)))
+        graph.add(
+            Location(
+                name="Mistvale Market",
+                parent_location="Mistvale",
+                coordinates=(10.0, 0.2),
+            )
+        )
+        assert graph.nearby("Elderwood", k=2) == ["Mistvale", "Mistvale Market"]
+        assert graph.nearby("Elderwood", top_level=True) == ["Mistvale", "Frostmere"]
+        assert graph.neighbors("Elderwood")["Mistvale"] == "nearby"
+        assert "Frostmere" not in graph.neighbors("Elderwood")
+        assert graph.find_route("The Cellar", "Mistvale Market") == [
+            "The Cellar",
+            "The Rusty Tankard",
+            "Elderwood",
+            "Mistvale",
+            "Mistvale Market",
+        ]
@@ -0,0 +1,214 @@
+import os
+
+import pytest
+from rapidfuzz.fuzz import token_sort_ratio as fuzz_score
+
+from llmdm import name_index
+from llmdm.location import Location
+from llmdm.name_index import phonetic_key
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.npc import NPC
+from llmdm.sql_client import SQLClient
+
+
+def open_nouns(save_name: str) -> ProperNounDB:
+    return ProperNounDB(save_name, conn=SQLClient(save_name).conn)
+
+
+@pytest.fixture
+def noun_db(save_dir):
+    db = open_nouns("test")
+    yield db
+    db.close()
+
+
+class TestStorage:
+    def test_add_many(self, noun_db):
+        noun_db.add("Elderwood", [])
+        noun_db.add_many(
+            [("The Rusty Tankard", ["the tavern"]), ("Mira Thornfield", ["Mira"])]
+        )
+        assert noun_db.get_nicknames() == {
+            "Elderwood": ["Elderwood"],
+            "The Rusty Tankard": ["the tavern", "The Rusty Tankard"],
+            "Mira Thornfield": ["Mira", "Mira Thornfield"],
+        }
+        assert noun_db.fuzzy_lookup("tavern") == "The Rusty Tankard"
+
+    def test_imports_legacy_database(self, save_dir):
+        legacy = open_nouns("legacy")
+        legacy.add("Elderwood", ["the town"])
+        legacy.close()
+        os.rename(save_dir / "legacy.sql", save_dir / "old_proper_nouns.sql")
+        assert open_nouns("old").get_nicknames() == {
+            "Elderwood": ["the town", "Elderwood"]
+        }
+
+    def test_lookups_use_the_index(self, noun_db):
+        noun_db.add_many([("The Rusty Tankard", ["the tavern"]), ("Elderwood", [])])
+        statements = []
+        noun_db.conn.set_trace_callback(statements.append)
+        assert noun_db.fuzzy_lookup("tavern") == "The Rusty Tankard"
+        noun_db.add("Mira Thornfield", ["Mira"])
+        assert noun_db.fuzzy_lookup("mira") == "Mira Thornfield"
+        assert not [s for s in statements if s.startswith("SELECT")]
+        with pytest.raises(IndexError):
+            noun_db.fuzzy_lookup("zzzzzzzzzzzzzzzzzzzz")
+
+    def test_rollback_drops_added_names(self, noun_db):
+        noun_db.add("Elderwood", [])
+        with pytest.raises(RuntimeError):
+            with noun_db.transaction():
+                noun_db.add("Mira Thornfield", ["Mira"])
+                raise RuntimeError("turn failed")
+        assert "Mira Thornfield" not in dict(noun_db.index.fuzzy_lookup("mira"))
+        assert open_nouns("test").fuzzy_lookup("elderwood") == "Elderwood"
+
+    def test_classifies_names_of_older_saves(self, save_dir):
+        sql_db = SQLClient("old")
+        sql_db.save_npc(NPC(name="Mira", location_name="The Tavern"))
+        sql_db.save_location(Location(name="The Tavern", parent_location="Elderwood"))
+        # names saved before they had a kind and a location
+        sql_db.conn.executescript(
+            """
+            DROP TABLE names;
+            CREATE TABLE names (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL
+            );
+            PRAGMA user_version = 3;
+            INSERT INTO names (name, normalized_name)
+            VALUES ('Mira', 'mira'), ('The Tavern', 'the tavern');
+            """
+        )
+        sql_db.close()
+        sql_db = SQLClient("old")
+        noun_db = ProperNounDB("old", conn=sql_db.conn)
+        assert noun_db.fuzzy_lookup("mira", kind="npc", within="The Tavern") == "Mira"
+        assert noun_db.fuzzy_lookup("tavern", within="Elderwood") == "The Tavern"
+
+
+class TestLookup:
+    def test_fuzzy_lookup_many(self, noun_db):
+        noun_db.add_many(
+            [("The Rusty Tankard", ["the tavern"]), ("Mira Thornfield", [])]
+        )
+        assert noun_db.fuzzy_lookup_many(["tavern", "Mira Thornfeld", "#"]) == [
+            ("The Rusty Tankard", pytest.approx(fuzz_score("tavern", "the tavern"))),
+            (
+                "Mira Thornfield",
+                pytest.approx(fuzz_score("mira thornfeld", "mira thornfield")),
+            ),
+            (None, 0.0),
+        ]
+        assert [
+            name for name, _ in noun_db.fuzzy_lookup_many(["mira"], threshold=90)
+        ] == [None]
+        assert noun_db.fuzzy_lookup_many([]) == []
+
+    def test_lookup_by_kind_and_location(self, noun_db):
+        noun_db.add("Mira Thornfield", ["Mira"], kind="npc", within="The Tavern")
+        noun_db.add("Mirewood", [], kind="location", within="Elderwood")
+        noun_db.add("Tomas", [], kind="npc", within="The Forge")
+        assert noun_db.fuzzy_lookup("mira") == "Mira Thornfield"
+        assert noun_db.fuzzy_lookup("mira", kind="location") == "Mirewood"
+        assert noun_db.fuzzy_lookup("mira", within="The Forge") == "Tomas"
+        with pytest.raises(IndexError):
+            noun_db.fuzzy_lookup("mira", kind="npc", within="Elderwood")
+
+        noun_db.set_within({"Mira Thornfield": "The Forge"})
+        assert noun_db.fuzzy_lookup("mira", kind="npc", within="The Forge") == (
+            "Mira Thornfield"
+        )
+        reloaded = open_nouns("test")
+        assert reloaded.fuzzy_lookup_many(
+            ["mira"], kind="npc", within="The Tavern"
+        ) == [(None, 0.0)]
+        assert reloaded.fuzzy_lookup("mira", within="The Forge") == "Mira Thornfield"
+
+    def test_shortlists_large_partitions(self, noun_db, monkeypatch):
+        monkeypatch.setattr(name_index, "SHORTLIST_FROM", 10)
+        monkeypatch.setattr(name_index, "SHORTLIST_SIZE", 3)
+        noun_db.add_many([(f"Villager {i}", []) for i in range(20)], kind="npc")
+        noun_db.add("Thorgrim Ironfist", ["Thorgrim"], kind="npc", within="The Forge")
+        assert noun_db.fuzzy_lookup("thorgrm") == "Thorgrim Ironfist"
+        assert noun_db.fuzzy_lookup_many(["thorgrimm", "ironfist"], kind="npc") == [
+            ("Thorgrim Ironfist", pytest.approx(fuzz_score("thorgrimm", "thorgrim"))),
+            (
+                "Thorgrim Ironfist",
+                pytest.approx(fuzz_score("ironfist", "thorgrim ironfist")),
+            ),
+        ]
+        noun_db.set_within({"Thorgrim Ironfist": "The Tavern"})
+        noun_db.add("Thorgrim Ironfist II", [], kind="npc", within="The Forge")
+        assert noun_db.fuzzy_lookup("thorgrim", within="The Forge") == (
+            "Thorgrim Ironfist II"
+        )
+
+    def test_candidates(self, noun_db):
+        noun_db.add_many(
+            [
+                ("Mira Thornfield", ["Mira", "the bard"]),
+                ("Miran Ashdown", ["Miran"]),
+                ("Tomas", ["the bard"]),
+            ],
+            kind="npc",
+        )
+        assert noun_db.candidates("Mira!") == [("Mira Thornfield", 100.0)]
+        assert noun_db.candidates("The Bard") == [
+            ("Mira Thornfield", 100.0),
+            ("Tomas", 100.0),
+        ]
+        assert [name for name, _ in noun_db.candidates("mirra", threshold=60)] == [
+            "Mira Thornfield",
+            "Miran Ashdown",
+        ]
+        assert noun_db.candidates("mira", kind="location") == []
+        assert noun_db.fuzzy_lookup_many(["miran", "mirran"], kind="npc") == [
+            ("Miran Ashdown", 100.0),
+            ("Miran Ashdown", pytest.approx(fuzz_score("mirran", "miran"))),
+        ]
+
+
+class TestPhonetic:
+    def test_matches_names_sounding_alike(self, noun_db):
+        noun_db.add("Thorgrim Ironfist", ["Thorgrim"], kind="npc")
+        noun_db.add("Cormac Nightshade", ["Cormac"], kind="npc")
+        assert phonetic_key("thorgrimm") == phonetic_key("thorgrim")
+        assert noun_db.candidates("Thorgrimm", kind="npc")[0] == (
+            "Thorgrim Ironfist",
+            pytest.approx(fuzz_score("thorgrimm", "thorgrim")),
+        )
+        # as close to both, the name sounding like the query comes first
+        noun_db.add("Gormal", [], kind="npc")
+        assert fuzz_score("kormak", "cormac") == fuzz_score("kormak", "gormal")
+        assert [name for name, _ in noun_db.candidates("kormak", kind="npc")][:2] == [
+            "Cormac Nightshade",
+            "Gormal",
+        ]
+        assert noun_db.fuzzy_lookup_many(["kormak", "thorgrm"], kind="npc") == [
+            ("Cormac Nightshade", pytest.approx(fuzz_score("kormak", "cormac"))),
+            ("Thorgrim Ironfist", pytest.approx(fuzz_score("thorgrm", "thorgrim"))),
+        ]
+        # too short a key to tell names apart
+        noun_db.add("Mira", [], kind="npc")
+        assert phonetic_key("myra") == phonetic_key("mira")
+        assert noun_db.candidates("myra", threshold=80) == []
+
+    def test_sounding_alike_scores_above_the_floor(self, noun_db):
+        noun_db.add("Brannoc", [], kind="npc")
+        noun_db.add("Lorin Vale", ["Lorin"], kind="npc")
+        assert fuzz_score("brannok", "brannoc") < name_index.PHONETIC_SCORE
+        assert noun_db.candidates("brannok", threshold=90, kind="npc") == [
+            ("Brannoc", name_index.PHONETIC_SCORE)
+        ]
+        assert noun_db.fuzzy_lookup_many(["brannok"], 90, kind="npc") == [
+            ("Brannoc", name_index.PHONETIC_SCORE)
+        ]
+        # the vowels are part of the key, so these are different names
+        assert phonetic_key("laren vole") != phonetic_key("lorin vale")
+        assert noun_db.fuzzy_lookup_many(["Laren Vole"], 80, kind="npc") == [
+            (None, 0.0)
+        ]
+        assert noun_db.candidates("Laren Vole", threshold=80, kind="npc") == []
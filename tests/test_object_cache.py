@@ -0,0 +1,79 @@
+from copy import deepcopy
+
+import pytest
+
+from llmdm.location import Location
+from llmdm.npc import NPC
+from llmdm.object_cache import CachedSQLClient
+
+
+@pytest.fixture
+def sql_db(save_dir):
+    db = CachedSQLClient("test", max_size=3)
+    npc = NPC(name="Mira", location_name="The Tavern")
+    db.save_npc(npc)
+    db.save_location(Location(name="The Tavern", npcs=[npc]))
+    db.clear()
+    yield db
+    db.close()
+
+
+class TestObjectCache:
+    def test_repeated_reads_are_lookups(self, sql_db):
+        queries = []
+        tavern = sql_db.get_location("The Tavern")
+        sql_db.conn.set_trace_callback(queries.append)
+        assert sql_db.get_location("The Tavern") is tavern
+        assert sql_db.get_npc("Mira") is tavern.npcs[0]
+        assert queries == []
+
+    def test_flush_writes_changes_made_in_place(self, sql_db, other_client):
+        sql_db.get_npc("Mira").affinity_score = 5
+        assert sql_db.flush() == 1
+        assert sql_db.flush() == 0
+        assert other_client.get_npc("Mira").affinity_score == 5
+
+    def test_flush_only_writes_changed_objects(self, sql_db):
+        sql_db.get_location("The Tavern")
+        queries = []
+        sql_db.conn.set_trace_callback(queries.append)
+        assert sql_db.flush() == 0
+        sql_db.get_npc("Mira").role = "bard"
+        assert sql_db.flush() == 1
+        assert not any("INTO locations" in query for query in queries)
+
+    def test_saved_objects_are_not_changed(self, sql_db):
+        npc = sql_db.get_npc("Mira")
+        npc.role = "bard"
+        sql_db.save_npc(npc)
+        assert sql_db.flush() == 0
+
+    def test_queries_see_unflushed_changes(self, sql_db):
+        sql_db.get_location("The Tavern").description = "Smoky"
+        [tavern] = sql_db.get_all_locations()
+        assert tavern.description == "Smoky"
+
+    def test_evicted_changes_are_written(self, sql_db, other_client):
+        sql_db.get_npc("Mira").role = "bard"
+        for name in ("A", "B", "C"):
+            sql_db.save_location(Location(name=name))
+        assert ("npc", "Mira") not in sql_db.objects
+        assert other_client.get_npc("Mira").role == "bard"
+        assert sql_db.get_npc("Mira").role == "bard"
+
+    def test_forgotten_objects_are_not_watched(self, sql_db):
+        npc = sql_db.get_npc("Mira")
+        sql_db.clear()
+        npc.role = "bard"
+        assert sql_db.flush() == 0
+        assert sql_db.get_npc("Mira").role != "bard"
+
+    def test_clients_watch_their_own_objects(self, sql_db):
+        other = CachedSQLClient("test")
+        npc = sql_db.get_npc("Mira")
+        other.save_npc(npc)
+        other.close()
+        npc.role = "bard"
+        assert sql_db.flush() == 1
+        deepcopy(npc).role = "thief"
+        assert sql_db.flush() == 0
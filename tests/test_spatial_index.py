@@ -0,0 +1,34 @@
+import math
+import random
+
+from llmdm.spatial_index import SpatialIndex
+
+
+def brute_force(points, x, y):
+    return sorted((math.dist((x, y), point), name) for name, point in points.items())
+
+
+class TestSpatialIndex:
+    def test_queries_match_brute_force(self):
+        rng = random.Random(0)
+        index = SpatialIndex(cell_size=2.0)
+        points = {}
+        for i in range(2000):
+            points[f"loc{i}"] = (rng.uniform(-100, 100), rng.uniform(-100, 100))
+            index.insert(f"loc{i}", *points[f"loc{i}"])
+
+        for _ in range(20):
+            x, y = rng.uniform(-120, 120), rng.uniform(-120, 120)
+            expected = brute_force(points, x, y)
+            assert index.nearest(x, y, 7) == expected[:7]
+            assert index.within(x, y, 15.0) == [p for p in expected if p[0] <= 15.0]
+
+    def test_move_and_remove(self):
+        index = SpatialIndex()
+        index.insert("tavern", 0.0, 0.0)
+        index.insert("tavern", 50.0, 50.0)
+        assert index.within(0.0, 0.0, 10.0) == []
+        assert index.nearest(0.0, 0.0, 1)[0][1] == "tavern"
+        index.remove("tavern")
+        assert len(index) == 0
+        assert index.nearest(0.0, 0.0, 1) == []
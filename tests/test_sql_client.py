@@ -0,0 +1,371 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from llmdm.location import Location
+from llmdm.nouns_lookup import ProperNounDB
+from llmdm.npc import NPC
+from llmdm.quest import Quest
+from llmdm.save_db import list_saves, save_path
+from llmdm.sql_client import TRAVEL_NARRATION_VARIANTS, SQLClient
+
+
+@pytest.fixture
+def sql_db(save_dir):
+    db = SQLClient("test")
+    yield db
+    db.close()
+
+
+class TestCheckpoints:
+    def test_resume_from_checkpoint(self, sql_db):
+        assert not sql_db.has_checkpoints()
+        assert sql_db.get_checkpoint("town/plan") is None
+
+        sql_db.save_checkpoint("town/plan", {"name": "Elderwood"})
+        assert sql_db.has_checkpoints()
+        assert sql_db.get_checkpoint("town/plan") == {"name": "Elderwood"}
+
+    def test_checkpoints_survive_reconnect(self, sql_db):
+        sql_db.save_checkpoint("town/description", "A quiet town.")
+        sql_db.close()
+        reopened = SQLClient("test")
+        assert reopened.get_checkpoint("town/description") == "A quiet town."
+        reopened.clear_checkpoints()
+        assert not reopened.has_checkpoints()
+        reopened.close()
+
+
+class TestSceneDescriptions:
+    def test_cached_until_key_changes(self, sql_db):
+        sql_db.save_scene_description("The Tavern", "key-1", "A smoky room.")
+        assert sql_db.get_scene_description("The Tavern", "key-1") == "A smoky room."
+        assert sql_db.get_scene_description("The Tavern", "key-2") is None
+
+    def test_saving_location_invalidates(self, sql_db):
+        sql_db.save_scene_description("The Tavern", "key", "A smoky room.")
+        sql_db.save_location(Location(name="The Tavern"))
+        assert sql_db.get_scene_description("The Tavern", "key") is None
+
+    def test_npc_movement_invalidates_both_locations(self, sql_db):
+        npc = NPC(name="Brom", location_name="The Tavern")
+        sql_db.save_npc(npc)
+        sql_db.save_location(Location(name="The Tavern", npcs=[npc]))
+        sql_db.save_scene_description("The Tavern", "key", "Brom drinks.")
+        sql_db.save_scene_description("The Forge", "key", "An empty forge.")
+
+        npc.location_name = "The Forge"
+        sql_db.save_npc(npc)
+        assert sql_db.get_scene_description("The Tavern", "key") is None
+        assert sql_db.get_scene_description("The Forge", "key") is None
+
+
+class TestTravelNarrations:
+    route = ("Town Square", "The Tavern", "child")
+
+    def test_rotates_through_variants(self, sql_db):
+        for i in range(TRAVEL_NARRATION_VARIANTS):
+            assert sql_db.get_travel_narration(*self.route, "key") is None
+            sql_db.save_travel_narration(*self.route, "key", f"variant {i}")
+
+        served = [
+            sql_db.get_travel_narration(*self.route, "key")
+            for _ in range(2 * TRAVEL_NARRATION_VARIANTS)
+        ]
+        expected = [f"variant {i}" for i in range(TRAVEL_NARRATION_VARIANTS)]
+        assert served == expected * 2
+
+    def test_regenerates_when_locations_change(self, sql_db):
+        for i in range(TRAVEL_NARRATION_VARIANTS):
+            sql_db.save_travel_narration(*self.route, "old", f"variant {i}")
+        assert sql_db.get_travel_narration(*self.route, "new") is None
+
+        sql_db.save_travel_narration(*self.route, "new", "fresh")
+        sql_db.cursor.execute("SELECT COUNT(*) FROM travel_narrations")
+        assert sql_db.cursor.fetchone()[0] == TRAVEL_NARRATION_VARIANTS
+
+    def test_evicts_least_recently_used(self, sql_db, monkeypatch):
+        monkeypatch.setattr("llmdm.sql_client.MAX_TRAVEL_NARRATIONS", 2)
+        sql_db.save_travel_narration("A", "B", "nearby", "key", "first")
+        sql_db.save_travel_narration("B", "C", "nearby", "key", "second")
+        sql_db.save_travel_narration("C", "D", "nearby", "key", "third")
+        sql_db.cursor.execute("SELECT narration FROM travel_narrations")
+        assert sorted(row[0] for row in sql_db.cursor.fetchall()) == [
+            "second",
+            "third",
+        ]
+
+
+class TestLocations:
+    def test_coordinates_round_trip(self, sql_db):
+        sql_db.save_location(Location(name="Elderwood", coordinates=(1.5, -2.0)))
+        sql_db.save_location(Location(name="Nowhere"))
+        assert sql_db.get_location("Elderwood").coordinates == (1.5, -2.0)
+        assert sql_db.get_location("Nowhere").coordinates is None
+
+    def test_migrates_old_saves(self, save_dir):
+        conn = sqlite3.connect(save_dir / "old.sql")
+        conn.execute(
+            """
+            CREATE TABLE locations (
+                name TEXT PRIMARY KEY,
+                description TEXT,
+                npcs TEXT,
+                parent_location TEXT,
+                sublocations TEXT,
+                location_type TEXT,
+                attributes TEXT
+            )
+        """
+        )
+        conn.execute(
+            "CREATE TABLE npcs (name TEXT PRIMARY KEY, description TEXT, "
+            "location_name TEXT, behavior_type TEXT, appearance TEXT, bonds TEXT, "
+            "ideals TEXT, flaws TEXT, role TEXT, traits TEXT, gender TEXT, "
+            "affinity_score INTEGER, affinity_type TEXT)"
+        )
+        conn.execute(
+            "INSERT INTO npcs (name, location_name) VALUES ('Mira', 'Elderwood')"
+        )
+        conn.execute(
+            "INSERT INTO locations VALUES ('Elderwood', 'A town', '[\"Mira\"]', "
+            "NULL, '[]', 'Town', 'quiet')"
+        )
+        conn.commit()
+        conn.close()
+
+        sql_db = SQLClient("old")
+        location = sql_db.get_location("Elderwood")
+        assert location.description == "A town"
+        assert location.coordinates is None
+        assert [npc.name for npc in location.npcs] == ["Mira"]
+        location.npcs = []
+        sql_db.save_location(location)
+        assert SQLClient("old").get_location("Elderwood").npcs == []
+        sql_db.close()
+
+    def test_npcs_keep_their_order(self, sql_db):
+        npcs = [NPC(name=name) for name in ("Mira", "Aldric", "Bram")]
+        for npc in npcs:
+            sql_db.save_npc(npc)
+        sql_db.save_location(Location(name="The Tavern", npcs=npcs))
+        sql_db.save_location(Location(name="Elderwood"))
+        [empty, tavern] = sql_db.get_all_locations()
+        assert empty.npcs == []
+        assert [npc.name for npc in tavern.npcs] == ["Mira", "Aldric", "Bram"]
+
+
+class TestNeighborhood:
+    @pytest.fixture
+    def town(self, sql_db):
+        sql_db.save_location(
+            Location(name="Elderwood", sublocations=["The Rusty Tankard", "Iron Forge"])
+        )
+        for name in ("The Rusty Tankard", "Iron Forge"):
+            sql_db.save_location(Location(name=name, parent_location="Elderwood"))
+        sql_db.save_location(
+            Location(name="The Cellar", parent_location="The Rusty Tankard")
+        )
+        sql_db.save_location(Location(name="Blackmoor"))
+        npc = NPC(name="Mira", location_name="The Rusty Tankard")
+        sql_db.save_npc(npc)
+        sql_db.save_location(
+            Location(
+                name="The Rusty Tankard",
+                parent_location="Elderwood",
+                npcs=[npc],
+            )
+        )
+        return sql_db
+
+    def test_loads_every_neighbor(self, town):
+        neighborhood = town.get_neighborhood("The Rusty Tankard", nearby=["Blackmoor"])
+        assert neighborhood.location.name == "The Rusty Tankard"
+        assert [npc.name for npc in neighborhood.location.npcs] == ["Mira"]
+        assert neighborhood.parent.name == "Elderwood"
+        assert [s.name for s in neighborhood.siblings] == ["Iron Forge"]
+        assert [c.name for c in neighborhood.children] == ["The Cellar"]
+        assert [n.name for n in neighborhood.nearby] == ["Blackmoor"]
+
+    def test_constant_number_of_queries(self, town):
+        queries = []
+        town.conn.set_trace_callback(queries.append)
+        town.get_neighborhood("Elderwood")
+        assert len(queries) == 2
+
+    def test_missing_location(self, town):
+        assert town.get_neighborhood("Nowhere") is None
+
+
+class TestTransactions:
+    def test_wal_mode(self, sql_db):
+        assert sql_db.conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    def test_commits_once_at_the_end(self, sql_db):
+        statements = []
+        sql_db.conn.set_trace_callback(statements.append)
+        with sql_db.transaction():
+            sql_db.save_location(Location(name="Elderwood"))
+            with sql_db.transaction():
+                sql_db.save_npc(NPC(name="Mira"))
+            sql_db.save_checkpoint("town/plan", [])
+        assert statements.count("COMMIT") == 1
+
+    def test_rolls_back_on_error(self, sql_db):
+        with pytest.raises(RuntimeError):
+            with sql_db.transaction():
+                sql_db.save_location(Location(name="Elderwood"))
+                raise RuntimeError("generation failed")
+        assert sql_db.get_location("Elderwood") is None
+        sql_db.save_location(Location(name="Elderwood"))
+        assert SQLClient("test").get_location("Elderwood") is not None
+
+    def test_spans_the_clients_of_a_connection(self, sql_db):
+        noun_db = ProperNounDB("test", conn=sql_db.conn)
+        noun_db.add("Mira", [])
+        noun_db.get_nicknames()
+        with pytest.raises(RuntimeError):
+            with noun_db.transaction():
+                sql_db.save_location(Location(name="Elderwood"))
+                noun_db.add("Elderwood", [])
+                raise RuntimeError("generation failed")
+        assert sql_db.get_location("Elderwood") is None
+        assert noun_db.get_nicknames() == {"Mira": ["Mira"]}
+
+
+class TestBulkSaves:
+    def test_save_many_in_one_commit(self, sql_db):
+        statements = []
+        sql_db.conn.set_trace_callback(statements.append)
+        npcs = [NPC(name=name, location_name="The Tavern") for name in ("A", "B")]
+        sql_db.save_npcs(npcs)
+        sql_db.save_locations(
+            [Location(name="The Tavern", npcs=npcs), Location(name="Elderwood")]
+        )
+        assert statements.count("COMMIT") == 2
+        assert [npc.name for npc in sql_db.get_location("The Tavern").npcs] == [
+            "A",
+            "B",
+        ]
+        assert sql_db.get_npc("B").location_name == "The Tavern"
+
+
+class TestProjections:
+    def test_npc_summaries_of_a_location(self, sql_db):
+        npcs = [
+            NPC(name="Mira", description="a bard", gender="female"),
+            NPC(name="Aldric", description="a smith", gender="male"),
+        ]
+        sql_db.save_npcs(npcs)
+        sql_db.save_location(Location(name="The Tavern", npcs=npcs))
+        summaries = sql_db.get_npc_summaries("The Tavern")
+        assert summaries == [("Mira", "a bard"), ("Aldric", "a smith")]
+        assert summaries[0].description == "a bard"
+        [mira, _] = sql_db.get_npc_summaries("The Tavern", ("name", "gender"))
+        assert mira.gender == "female"
+
+    def test_location_summaries_keep_order(self, sql_db):
+        sql_db.save_locations(
+            [Location(name="A", location_type="Town"), Location(name="B")]
+        )
+        assert [
+            loc.name for loc in sql_db.get_location_summaries(["B", "Nowhere", "A"])
+        ] == ["B", "A"]
+
+    def test_unknown_columns(self, sql_db):
+        with pytest.raises(ValueError):
+            sql_db.get_npc_summaries("The Tavern", ("name; DROP TABLE npcs",))
+
+
+class TestSaveBundle:
+    SAVE_DATA = {"GameState": {"location": "Elderwood"}, "PlayerCharacter": {}}
+
+    def test_everything_in_one_file(self, sql_db, save_dir):
+        noun_db = ProperNounDB("test", conn=sql_db.conn)
+        with sql_db.transaction(), noun_db.transaction():
+            sql_db.save_game(self.SAVE_DATA)
+            noun_db.add("Elderwood", [])
+        # the WAL journal files aside
+        assert {name[:8] for name in os.listdir(save_dir)} == {"test.sql"}
+        assert SQLClient("test").load_game() == self.SAVE_DATA
+        assert ProperNounDB("test", conn=SQLClient("test").conn).get_nicknames() == {
+            "Elderwood": ["Elderwood"]
+        }
+
+    def test_saves_atomically(self, sql_db):
+        noun_db = ProperNounDB("test", conn=sql_db.conn)
+        with pytest.raises(RuntimeError):
+            with sql_db.transaction(), noun_db.transaction():
+                sql_db.save_game(self.SAVE_DATA)
+                noun_db.add("Elderwood", [])
+                raise RuntimeError("turn failed")
+        assert sql_db.load_game() == {}
+        assert noun_db.get_nicknames() == {}
+
+    def test_lists_only_saves_with_a_game(self, sql_db):
+        SQLClient("partial").close()
+        assert list_saves() == []
+        sql_db.save_game(self.SAVE_DATA)
+        assert list_saves() == ["test"]
+
+    def test_imports_legacy_save_file(self, save_dir):
+        (save_dir / "old.json").write_text(json.dumps(self.SAVE_DATA))
+        assert SQLClient("old").load_game() == self.SAVE_DATA
+        (save_dir / "old.json").unlink()
+        assert SQLClient("old").load_game() == self.SAVE_DATA
+
+    def test_backup_is_an_independent_copy(self, sql_db):
+        noun_db = ProperNounDB("test", conn=sql_db.conn)
+        sql_db.save_game(self.SAVE_DATA)
+        sql_db.save_npcs([NPC(name=f"npc {i}") for i in range(200)])
+        noun_db.add("Elderwood", [])
+        steps = []
+        sql_db.backup(
+            save_path("fork"), pages=1, progress=lambda *args: steps.append(args)
+        )
+        sql_db.save_npc(NPC(name="Mira"))
+        assert len(steps) > 1
+        fork = SQLClient("fork")
+        assert fork.load_game() == self.SAVE_DATA
+        assert len(fork.get_all_npcs()) == 200
+        assert ProperNounDB("fork", conn=fork.conn).get_nicknames() == {
+            "Elderwood": ["Elderwood"]
+        }
+
+
+class TestSearch:
+    def test_ranked_hits(self, sql_db):
+        sql_db.save_npcs(
+            [
+                NPC(name="Mira", description="A bard who sings of the old forest."),
+                NPC(name="Tomas", description="A blacksmith."),
+            ]
+        )
+        sql_db.save_location(
+            Location(name="The Old Forest", description="Dark and quiet.")
+        )
+        sql_db.save_quest(
+            Quest(name="Lost Ring", description="", objective="Search the forest")
+        )
+        hits = sql_db.search("old forest?")
+        assert [(hit.kind, hit.name) for hit in hits] == [
+            ("location", "The Old Forest"),
+            ("npc", "Mira"),
+            ("quest", "Lost Ring"),
+        ]
+        assert "[forest]" in hits[1].snippet
+        assert [hit.name for hit in sql_db.search("forest", kinds=("npc",))] == ["Mira"]
+        assert sql_db.search("forest", limit=1)[0].name == "The Old Forest"
+        assert sql_db.search("?!") == []
+
+    def test_follows_updates(self, sql_db):
+        sql_db.save_npc(NPC(name="Mira", description="A bard."))
+        sql_db.save_npc(NPC(name="Mira", description="A retired thief."))
+        assert sql_db.search("bard") == []
+        assert [hit.name for hit in sql_db.search("thief")] == ["Mira"]
+
+    def test_unknown_kinds(self, sql_db):
+        with pytest.raises(ValueError):
+            sql_db.search("forest", kinds=("dragon",))
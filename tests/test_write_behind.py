@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+from llmdm.location import Location
+from llmdm.npc import NPC
+from llmdm.object_cache import CachedSQLClient
+from llmdm.write_behind import WriteBehind
+
+
+@pytest.fixture
+def write_behind():
+    write_behind = WriteBehind()
+    yield write_behind
+    write_behind.close()
+
+
+@pytest.fixture
+def sql_db(save_dir, write_behind):
+    db = CachedSQLClient("test")
+    db.write_behind = write_behind
+    yield db
+    write_behind.drain()
+    db.close()
+
+
+class TestQueue:
+    def test_coalesces_keeping_the_first_position(self, write_behind):
+        written = []
+        # hold the thread so that every write below is queued together
+        started, release = threading.Event(), threading.Event()
+        write_behind.put("block", lambda: started.set() or release.wait())
+        started.wait()
+        write_behind.put("a", written.append, "a1")
+        write_behind.put("b", written.append, "b")
+        write_behind.put("a", written.append, "a2")
+        release.set()
+        write_behind.drain()
+        assert written == ["a2", "b"]
+
+    def test_failed_writes_are_retried(self):
+        written = []
+
+        def flaky(value):
+            if not written:
+                written.append(None)
+                raise OSError("disk busy")
+            written.append(value)
+
+        write_behind = WriteBehind()
+        write_behind.put("a", flaky, "a")
+        write_behind.close()
+        assert written == [None, "a"]
+
+    def test_failed_writes_are_raised(self):
+        def broken():
+            raise OSError("disk full")
+
+        write_behind = WriteBehind()
+        write_behind.put("a", broken)
+        with pytest.raises(RuntimeError) as error:
+            write_behind.drain()
+        assert isinstance(error.value.__cause__, OSError)
+        with pytest.raises(RuntimeError):
+            write_behind.put("b", print)
+        with pytest.raises(RuntimeError):
+            write_behind.close()
+        assert not write_behind.thread.is_alive()
+
+
+class TestSaveDB:
+    def test_reads_own_writes(self, sql_db):
+        npc = NPC(name="Mira", location_name="The Tavern")
+        sql_db.save_npc(npc)
+        sql_db.save_location(Location(name="The Tavern", npcs=[npc]))
+        assert sql_db.get_npc("Mira") is npc
+        assert [loc.name for loc in sql_db.get_all_locations()] == ["The Tavern"]
+        sql_db.save_checkpoint("town/plan", ["tavern"])
+        assert sql_db.get_checkpoint("town/plan") == ["tavern"]
+
+    def test_writes_the_state_at_save_time(self, sql_db, write_behind, other_client):
+        npc = NPC(name="Mira", role="bard")
+        sql_db.save_npc(npc)
+        npc.role = "thief"
+        write_behind.drain()
+        assert other_client.get_npc("Mira").role == "bard"
+        sql_db.flush()
+        write_behind.drain()
+        assert other_client.get_npc("Mira").role == "thief"
+
+    def test_writes_wait_for_the_transaction(self, sql_db, write_behind, other_client):
+        with sql_db.transaction():
+            sql_db.save_npc(NPC(name="Mira"))
+            write_behind.drain()
+            assert other_client.get_npc("Mira") is None
+        write_behind.drain()
+        assert other_client.get_npc("Mira") is not None
+
+    def test_rolled_back_writes_are_dropped(self, sql_db, write_behind, other_client):
+        with pytest.raises(RuntimeError):
+            with sql_db.transaction():
+                sql_db.save_npc(NPC(name="Mira"))
+                raise RuntimeError("action failed")
+        write_behind.drain()
+        assert other_client.get_npc("Mira") is None
+        assert sql_db.get_npc("Mira") is None
+
+    def test_reads_do_not_wait_for_the_writes(self, sql_db, write_behind, other_client):
+        started, release = threading.Event(), threading.Event()
+        write_behind.put("block", lambda: started.set() or release.wait())
+        started.wait()
+        npc = NPC(name="Mira", role="bard", location_name="The Tavern")
+        sql_db.save_npc(npc)
+        sql_db.save_location(Location(name="The Tavern", npcs=[npc]))
+        sql_db.save_scene_description("The Tavern", "night", "Smoky")
+        sql_db.forget_all()
+        try:
+            assert sql_db.get_npc("Mira").role == "bard"
+            assert [s.name for s in sql_db.get_location_summaries(["The Tavern"])] == [
+                "The Tavern"
+            ]
+            assert [s.name for s in sql_db.get_npc_summaries("The Tavern")] == ["Mira"]
+            assert sql_db.get_scene_description("The Tavern", "night") == "Smoky"
+            assert other_client.get_npc("Mira") is None
+        finally:
+            release.set()